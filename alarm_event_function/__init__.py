@@ -0,0 +1,24 @@
+"""
+Queue-triggered consumer for alarm-start events published by iot_to_cosmos_bridge.
+
+Runs the alarm_monitor_function state machine as soon as the bridge sees the alarm bit,
+instead of waiting for the next timer poll to read the document back from Cosmos.
+"""
+
+import json
+import logging
+
+import azure.functions as func
+
+from alarm_monitor_function import handle_alarm_event
+
+
+def main(msg: func.QueueMessage) -> None:
+    """Handle one alarm event from the `alarm-events` queue."""
+    try:
+        event = json.loads(msg.get_body().decode("utf-8"))
+    except ValueError as e:
+        logging.error(f"Invalid alarm event message: {e}")
+        return
+
+    handle_alarm_event(event)
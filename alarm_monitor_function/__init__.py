@@ -4,14 +4,24 @@ Azure Function App to monitor CosmosDB for Test2OPCUA:CallOperator and make phon
 
 import logging
 import os
+import hmac
 import json
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from urllib.parse import quote
 import azure.functions as func
 from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure, OperationFailure, PyMongoError
+import bson
 from bson import ObjectId
+from bson.errors import InvalidId
 from azure.communication.callautomation import CallAutomationClient, PhoneNumberIdentifier
 
+from .state_store import MemoryStateStore, MongoStateStore, SqliteStateStore
+
 # Try to import media source classes for playing audio
 try:
     from azure.communication.callautomation import FileSource
@@ -31,14 +41,86 @@ PHONE_NUMBER_TO_CALL = os.environ.get("PHONE_NUMBER_TO_CALL")
 COMMUNICATION_SERVICE_CONNECTION_STRING = os.environ.get("COMMUNICATION_SERVICE_CONNECTION_STRING")
 COMMUNICATION_SERVICE_PHONE_NUMBER = os.environ.get("COMMUNICATION_SERVICE_PHONE_NUMBER")
 CALLBACK_URL = os.environ.get("CALLBACK_URL", "")
+CALLBACK_SECRET = os.environ.get("CALLBACK_SECRET", "")  # appended to the callback URL as ?token=
 AUDIO_FILE_URL = os.environ.get("AUDIO_FILE_URL", "")  # URL to pre-recorded WAV file
 
+# MongoClient pool settings (the client is shared by all invocations in a worker process)
+MONGODB_MAX_POOL_SIZE = int(os.environ.get("MONGODB_MAX_POOL_SIZE", "10"))
+MONGODB_MIN_POOL_SIZE = int(os.environ.get("MONGODB_MIN_POOL_SIZE", "1"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.environ.get("MONGODB_MAX_IDLE_TIME_MS", "120000"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGODB_SOCKET_TIMEOUT_MS", "10000"))
+MONGODB_HEALTH_CHECK_SECONDS = int(os.environ.get("MONGODB_HEALTH_CHECK_SECONDS", "300"))
+
+_mongo_client = None
+_mongo_client_checked_at = 0.0
+_mongo_client_lock = threading.Lock()
+
+# Alarm detection mode: "poll" (query every tick) or "change_stream" (push via collection.watch(),
+# falling back to polling when the server has no change stream support).
+ALARM_DETECTION_MODE = os.environ.get("ALARM_DETECTION_MODE", "poll").strip().lower()
+CHANGE_STREAM_STATE_COLLECTION = os.environ.get("CHANGE_STREAM_STATE_COLLECTION", "alarm_monitor_resume_tokens")
+CHANGE_STREAM_MAX_AWAIT_MS = int(os.environ.get("CHANGE_STREAM_MAX_AWAIT_MS", "1000"))
+# Idle getMores advance the resume token without any event; persist those at most this often.
+CHANGE_STREAM_TOKEN_SAVE_SECONDS = float(os.environ.get("CHANGE_STREAM_TOKEN_SAVE_SECONDS", "60"))
+# Reopen a failed change stream after 1s, 2s, 4s, ... up to this; timer ticks poll meanwhile.
+CHANGE_STREAM_RETRY_MAX_SECONDS = float(os.environ.get("CHANGE_STREAM_RETRY_MAX_SECONDS", "300"))
+# OperationFailure codes: the server has no change streams (not a replica set, command or
+# $changeStream stage unknown), or the saved resume token can no longer be used (history
+# lost, invalid token, resume point gone). Anything else is retried with backoff.
+_CHANGE_STREAM_UNSUPPORTED_CODES = {40573, 115, 40324}
+_RESUME_TOKEN_LOST_CODES = {286, 260, 280}
+
+# Call placement runs on background worker threads so detection never waits on ACS.
+CALL_WORKER_THREADS = int(os.environ.get("CALL_WORKER_THREADS", "2"))
+PLAYBACK_INITIAL_DELAY_SECONDS = float(os.environ.get("PLAYBACK_INITIAL_DELAY_SECONDS", "5"))
+PLAYBACK_RETRY_SECONDS = float(os.environ.get("PLAYBACK_RETRY_SECONDS", "3"))
+PLAYBACK_TIMEOUT_SECONDS = float(os.environ.get("PLAYBACK_TIMEOUT_SECONDS", "35"))
+
+# "callback": start playback when ACS posts CallConnected to /api/callbacks (call_callback_function).
+# "poll": retry play_media until the call is established. Callback mode needs a public callback URL,
+# so it falls back to polling when the URL points at localhost.
+AUDIO_PLAYBACK_TRIGGER = os.environ.get("AUDIO_PLAYBACK_TRIGGER", "callback").strip().lower()
+
+_call_executor = ThreadPoolExecutor(max_workers=CALL_WORKER_THREADS, thread_name_prefix="alarm-call")
+_pending_calls = {}  # state_key -> list of (Future, cancel Event)
+_pending_calls_lock = threading.Lock()
+
+# Calls created by this worker, keyed by call_connection_id, for callback event handling.
+_call_registry = {
+    # "<call_connection_id>": {
+    #   "state_key": str,
+    #   "created_utc": datetime,
+    #   "connected": bool,
+    #   "playback_started": bool,
+    # }
+}
+_call_registry_lock = threading.Lock()
+
+# Shared CallAutomationClient: one HTTP session with keep-alive, pre-warmed when the worker starts.
+ACS_PREWARM_ON_START = os.environ.get("ACS_PREWARM_ON_START", "true").strip().lower() in ("1", "true", "yes", "on")
+ACS_CONNECTION_POOL_SIZE = int(os.environ.get("ACS_CONNECTION_POOL_SIZE", "4"))
+
+_call_automation_client = None
+_acs_session = None
+_call_automation_client_warm = False
+_call_automation_client_lock = threading.Lock()
+
+# Operator phone number cache (keeps the Operator lookup off the dialing path).
+OPERATOR_PHONE_CACHE_TTL_SECONDS = int(os.environ.get("OPERATOR_PHONE_CACHE_TTL_SECONDS", "300"))
+OPERATOR_PHONE_WATCH = os.environ.get("OPERATOR_PHONE_WATCH", "false").strip().lower() in ("1", "true", "yes", "on")
+
+# Serializes the alarm state machine between the timer and the change stream watcher.
+_alarm_eval_lock = threading.Lock()
+
 # Track last alarm state and last call time (per function instance)
 last_alarm_state = {}
 last_call_time = {}
 
-# Stable alarm runtime state (per function instance).
-# Note: Azure Functions can scale out; this state is best-effort per instance.
+# Alarm runtime state: local cache of the configured state backend (see state_store.py).
+# With ALARM_STATE_BACKEND=memory this dict is the store itself (best-effort per instance);
+# use "mongo" (or "sqlite" for a shared local file) when the Function App scales out.
 alarm_runtime_state = {
     # "alarm:global": {
     #   "active": bool,
@@ -47,9 +129,48 @@ alarm_runtime_state = {
     #   "forced_since_utc": datetime|None,
     #   "attempts": int,
     #   "last_attempt_utc": datetime|None,
+    #   "last_call_outcome": "answered"|"not_answered"|None,  (set by call callbacks)
+    #   "last_call_outcome_utc": datetime|None,
     # }
 }
 
+ALARM_STATE_BACKEND = os.environ.get("ALARM_STATE_BACKEND", "memory").strip().lower()
+ALARM_STATE_COLLECTION = os.environ.get("ALARM_STATE_COLLECTION", "alarm_runtime_state")
+ALARM_STATE_SQLITE_PATH = os.environ.get(
+    "ALARM_STATE_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "alarm_runtime_state.sqlite3")
+)
+ALARM_STATE_FLUSH_SECONDS = float(os.environ.get("ALARM_STATE_FLUSH_SECONDS", "1"))
+
+_state_store = None
+_state_store_lock = threading.Lock()
+
+# Index provisioning and query plan caching for the latest-alarm lookup.
+ALARM_INDEX_PROVISIONING = os.environ.get("ALARM_INDEX_PROVISIONING", "true").strip().lower() in ("1", "true", "yes", "on")
+ALARM_QUERY_DIAGNOSTICS = os.environ.get("ALARM_QUERY_DIAGNOSTICS", "false").strip().lower() in ("1", "true", "yes", "on")
+
+# Projection for hot-path reads: only the fields the state machine uses. Extra fields can be added
+# with ALARM_PROJECTION_EXTRA_FIELDS; ALARM_DEBUG_FULL_DOCUMENT=true fetches whole documents again.
+ALARM_PROJECTION_EXTRA_FIELDS = [
+    field.strip() for field in os.environ.get("ALARM_PROJECTION_EXTRA_FIELDS", "").split(",") if field.strip()
+]
+ALARM_DEBUG_FULL_DOCUMENT = os.environ.get("ALARM_DEBUG_FULL_DOCUMENT", "false").strip().lower() in ("1", "true", "yes", "on")
+
+# Canonical UTC time stamped by iot_to_cosmos_bridge (int64 ns since 1970); older documents
+# can be backfilled with backfill_canonical_timestamp.py.
+CANONICAL_TS_FIELD = os.environ.get("CANONICAL_TS_FIELD", "ts_utc_ns")
+
+# Per-unit latest state maintained by iot_to_cosmos_bridge (MATERIALIZED_UNIT_STATE=true there):
+# one small document per unit with its two newest alarm samples, so the latest-alarm lookup
+# reads O(units) documents instead of sorting the telemetry collection.
+MATERIALIZED_UNIT_STATE = os.environ.get("MATERIALIZED_UNIT_STATE", "false").strip().lower() in ("1", "true", "yes", "on")
+UNIT_STATE_COLLECTION = os.environ.get("UNIT_STATE_COLLECTION", "unit_latest_state")
+
+_alarm_indexes_checked = False
+_alarm_sort_key = None  # CANONICAL_TS_FIELD, "_timestamp" or "_id", detected on the first successful query
+# Errors meaning the server cannot sort by a key at all (as opposed to throttling, 16500, or a timeout):
+# BadValue (Cosmos: "order-by item is excluded"), IndexNotFound, sort over the memory limit.
+_SORT_UNSUPPORTED_CODES = {2, 27, 96, 292}
+
 # Policy settings (configurable)
 # Defaults keep current BaaS behavior close while applying the new structure.
 SIGNAL_LOSS_SECONDS = int(os.environ.get("SIGNAL_LOSS_SECONDS", "120"))
@@ -63,6 +184,40 @@ ALLOW_ALARM_WITHOUT_CALL_SERVICE = os.environ.get("ALLOW_ALARM_WITHOUT_CALL_SERV
     "on",
 )
 
+# Multi-unit monitoring: track every unit (device) found in the collection, one state entry per unit.
+ALARM_STATE_KEY = os.environ.get("ALARM_STATE_KEY", "alarm:global")
+MULTI_UNIT_MONITORING = os.environ.get("MULTI_UNIT_MONITORING", "false").strip().lower() in ("1", "true", "yes", "on")
+UNIT_ID_FIELD = os.environ.get("UNIT_ID_FIELD", "device_id")
+UNIT_LOOKBACK_SECONDS = int(os.environ.get("UNIT_LOOKBACK_SECONDS", "3600"))
+# Partitioned collections (PARTITION_BY_UNIT=true on the bridge too): each unit is read from its
+# own partition instead of one cross-partition aggregation. Units are MONITORED_UNITS when set,
+# otherwise discovered from the documents written since the previous tick.
+PARTITION_BY_UNIT = os.environ.get("PARTITION_BY_UNIT", "false").strip().lower() in ("1", "true", "yes", "on")
+PARTITION_KEY_FIELD = os.environ.get("PARTITION_KEY_FIELD", UNIT_ID_FIELD)
+MONITORED_UNITS = [unit.strip() for unit in os.environ.get("MONITORED_UNITS", "").split(",") if unit.strip()]
+PARTITION_QUERY_THREADS = int(os.environ.get("PARTITION_QUERY_THREADS", "4"))
+# Optional per-unit overrides, e.g. {"unit-7": {"max_call_attempts": 3, "call_retry_delay_seconds": 60}}
+try:
+    UNIT_CALL_POLICIES = json.loads(os.environ.get("UNIT_CALL_POLICIES", "") or "{}")
+except ValueError:
+    logging.error("UNIT_CALL_POLICIES is not valid JSON; ignoring per-unit overrides")
+    UNIT_CALL_POLICIES = {}
+
+
+# Windows FILETIME epoch and the accepted FILETIME range (years ~2012-2076).
+WINDOWS_EPOCH = datetime(1601, 1, 1)
+UNIX_EPOCH = datetime(1970, 1, 1)
+FILETIME_MIN = 130_000_000_000_000_000
+FILETIME_MAX = 150_000_000_000_000_000
+
+
+def _filetime_to_datetime(filetime):
+    """Integer FILETIME to naive UTC datetime, rounded half-even to the microsecond like timedelta."""
+    micros, rest = divmod(filetime, 10)
+    if rest > 5 or (rest == 5 and micros & 1):
+        micros += 1
+    return WINDOWS_EPOCH + timedelta(microseconds=micros)
+
 
 def parse_timestamp(timestamp_value):
     """
@@ -70,12 +225,18 @@ def parse_timestamp(timestamp_value):
     Returns datetime object
     Note: Returned timestamps are in UTC; use -1 hour adjustment for comparisons
     """
+    # Fast path for the common case: integer FILETIME stamped by the bridge. Integer math
+    # also avoids the float rounding of `value / 10` (FILETIMEs exceed 2**53).
+    if type(timestamp_value) is int and FILETIME_MIN <= timestamp_value <= FILETIME_MAX:
+        return _filetime_to_datetime(timestamp_value)
     try:
         if isinstance(timestamp_value, (int, float)):
+            # No device clock reports times before 1970; don't map them to arbitrary dates.
+            if timestamp_value < 0:
+                return None
             # Windows FILETIME: 100-nanosecond intervals since January 1, 1601
             if 1.3e17 <= timestamp_value <= 1.5e17:
-                windows_epoch = datetime(1601, 1, 1)
-                return windows_epoch + timedelta(microseconds=timestamp_value / 10)
+                return WINDOWS_EPOCH + timedelta(microseconds=timestamp_value / 10)
             elif timestamp_value > 1e15:  # Nanoseconds
                 return datetime.fromtimestamp(timestamp_value / 1e9)
             elif timestamp_value > 1e12:  # Microseconds
@@ -84,20 +245,25 @@ def parse_timestamp(timestamp_value):
                 return datetime.fromtimestamp(timestamp_value / 1e3)
             else:  # Seconds
                 return datetime.fromtimestamp(timestamp_value)
-    except (ValueError, OSError) as e:
+    except (ValueError, OverflowError, OSError) as e:
         logging.error(f"Error parsing timestamp {timestamp_value}: {e}")
     return None
 
 
 def get_document_time(doc):
     """
-    Get a datetime for a document, using 'timestamp' when present,
+    Get a datetime for a document, using CANONICAL_TS_FIELD or 'timestamp' when present,
     otherwise falling back to the ObjectId generation time.
     """
     if not doc:
         return None
 
-    # First try explicit 'timestamp' field
+    # Canonical UTC nanoseconds stamped at ingest
+    canonical = doc.get(CANONICAL_TS_FIELD)
+    if type(canonical) is int:
+        return UNIX_EPOCH + timedelta(microseconds=canonical // 1000)
+
+    # Then try explicit 'timestamp' field
     if "timestamp" in doc:
         ts = parse_timestamp(doc["timestamp"])
         if ts:
@@ -109,21 +275,244 @@ def get_document_time(doc):
         if ts:
             return ts
 
-    # Fallback: use ObjectId generation time
-    try:
-        _id = doc.get("_id")
-        if isinstance(_id, ObjectId):
-            return _id.generation_time
-        if isinstance(_id, str):
+    # Fallback: use ObjectId generation time. Only 24-character strings can be ObjectIds,
+    # so other string ids skip the raise-and-catch.
+    _id = doc.get("_id")
+    if isinstance(_id, ObjectId):
+        return _id.generation_time
+    if isinstance(_id, str) and len(_id) == 24:
+        try:
             return ObjectId(_id).generation_time
-    except Exception as e:
-        logging.debug(f"Could not derive time from _id: {e}")
+        except InvalidId as e:
+            logging.debug(f"Could not derive time from _id: {e}")
 
     return None
 
 
+def unit_state_key(doc):
+    """Stable alarm state key for the unit a document belongs to."""
+    if MULTI_UNIT_MONITORING and doc is not None:
+        unit_id = doc.get(UNIT_ID_FIELD)
+        if unit_id is not None:
+            return f"alarm:{unit_id}"
+    return ALARM_STATE_KEY
+
+
+def get_call_policy(state_key):
+    """Call/forcing policy for a state key, with UNIT_CALL_POLICIES overrides applied."""
+    policy = {
+        "signal_loss_seconds": SIGNAL_LOSS_SECONDS,
+        "max_forced_window_seconds": MAX_FORCED_WINDOW_SECONDS,
+        "call_retry_delay_seconds": CALL_RETRY_DELAY_SECONDS,
+        "max_call_attempts": MAX_CALL_ATTEMPTS,
+    }
+    unit_id = state_key.split(":", 1)[1] if state_key.startswith("alarm:") else state_key
+    overrides = UNIT_CALL_POLICIES.get(unit_id) or UNIT_CALL_POLICIES.get(state_key) or {}
+    for key, value in overrides.items():
+        if key in policy:
+            policy[key] = int(value)
+    return policy
+
+
+def get_mongo_client():
+    """
+    Return the MongoClient shared by this worker process, creating it on first use.
+    A ping is only issued every MONGODB_HEALTH_CHECK_SECONDS so a normal tick costs
+    a single round trip; a failed ping drops the client and connects again.
+    """
+    global _mongo_client, _mongo_client_checked_at
+
+    if not MONGODB_CONNECTION_STRING:
+        return None
+
+    with _mongo_client_lock:
+        now = time.monotonic()
+        if _mongo_client is not None and now - _mongo_client_checked_at >= MONGODB_HEALTH_CHECK_SECONDS:
+            try:
+                _mongo_client.admin.command("ping")
+                _mongo_client_checked_at = now
+            except PyMongoError as e:
+                logging.warning(f"MongoClient health check failed, reconnecting: {e}")
+                _close_mongo_client_locked()
+
+        if _mongo_client is None:
+            logging.info(f"Creating shared MongoClient (maxPoolSize={MONGODB_MAX_POOL_SIZE})")
+            _mongo_client = MongoClient(
+                MONGODB_CONNECTION_STRING,
+                maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                minPoolSize=MONGODB_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS,
+                serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+                connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+                socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+                retryWrites=False,
+            )
+            _mongo_client_checked_at = now
+
+        return _mongo_client
+
+
+def _close_mongo_client_locked():
+    """Close and forget the shared client. Caller must hold _mongo_client_lock."""
+    global _mongo_client
+    if _mongo_client is not None:
+        try:
+            _mongo_client.close()
+        except Exception as e:
+            logging.debug(f"Error closing MongoClient: {e}")
+    _mongo_client = None
+
+
+def reset_mongo_client():
+    """
+    Drop the shared client so the next call reconnects. Only for connection errors
+    (ConnectionFailure, which covers AutoReconnect and ServerSelectionTimeoutError): a throttle
+    (16500) or a bad query says nothing about the connection and keeps the pool.
+    """
+    with _mongo_client_lock:
+        _close_mongo_client_locked()
+
+
+def get_state_store():
+    """Return the alarm state backend selected by ALARM_STATE_BACKEND, creating it on first use."""
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            if ALARM_STATE_BACKEND == "mongo":
+                _state_store = MongoStateStore(
+                    lambda: get_mongo_client()[COSMOS_DATABASE][ALARM_STATE_COLLECTION],
+                    flush_interval_seconds=ALARM_STATE_FLUSH_SECONDS,
+                )
+            elif ALARM_STATE_BACKEND == "sqlite":
+                _state_store = SqliteStateStore(ALARM_STATE_SQLITE_PATH, flush_interval_seconds=ALARM_STATE_FLUSH_SECONDS)
+            else:
+                _state_store = MemoryStateStore(alarm_runtime_state)
+            logging.info(f"Alarm state backend: {type(_state_store).__name__}")
+        return _state_store
+
+
+def load_alarm_states(state_keys):
+    """Refresh the local state cache for the given keys in one round trip."""
+    states = get_state_store().load(state_keys)
+    if ALARM_STATE_BACKEND in ("mongo", "sqlite"):
+        alarm_runtime_state.update(states)
+    return states
+
+
+def get_alarm_projection():
+    """Projection for alarm reads, following the configured field names (None = full document)."""
+    if ALARM_DEBUG_FULL_DOCUMENT:
+        return None
+    fields = [ALARM_FIELD, CALL_SERVICE_FIELD, VOLUME_TREATED_FIELD, CANONICAL_TS_FIELD, "_timestamp", "timestamp", "_id"]
+    if MULTI_UNIT_MONITORING:
+        fields.append(UNIT_ID_FIELD)
+        if PARTITION_BY_UNIT:
+            fields.append(PARTITION_KEY_FIELD)
+    fields.extend(ALARM_PROJECTION_EXTRA_FIELDS)
+    return {field: 1 for field in fields}
+
+
+def ensure_alarm_indexes(collection):
+    """
+    Create the index backing the latest-alarm lookup once per worker.
+    A partial index on CANONICAL_TS_FIELD (only documents carrying ALARM_FIELD) is preferred;
+    servers without partial index support (e.g. Cosmos) get a plain descending index.
+    Multi-unit mode additionally gets a (unit, CANONICAL_TS_FIELD) compound index for the $group,
+    and partitioned mode a (PARTITION_KEY_FIELD, CANONICAL_TS_FIELD) one for per-partition reads.
+    """
+    global _alarm_indexes_checked
+
+    if _alarm_indexes_checked or not ALARM_INDEX_PROVISIONING:
+        return
+    _alarm_indexes_checked = True
+    try:
+        existing = {tuple(index["key"].items()) for index in collection.list_indexes()}
+        if ((CANONICAL_TS_FIELD, -1),) not in existing:
+            try:
+                collection.create_index(
+                    [(CANONICAL_TS_FIELD, -1)],
+                    name="alarm_latest_ts",
+                    partialFilterExpression={ALARM_FIELD: {"$exists": True}},
+                )
+            except OperationFailure as e:
+                logging.info(f"Partial index not supported ({e}); creating plain {CANONICAL_TS_FIELD} index")
+                collection.create_index([(CANONICAL_TS_FIELD, -1)], name="alarm_latest_ts")
+            logging.info(f"Created {CANONICAL_TS_FIELD} index for latest-alarm lookup")
+        if MULTI_UNIT_MONITORING and ((UNIT_ID_FIELD, 1), (CANONICAL_TS_FIELD, -1)) not in existing:
+            collection.create_index([(UNIT_ID_FIELD, 1), (CANONICAL_TS_FIELD, -1)], name="alarm_unit_ts")
+            logging.info(f"Created ({UNIT_ID_FIELD}, {CANONICAL_TS_FIELD}) index for multi-unit lookup")
+        partition_key = ((PARTITION_KEY_FIELD, 1), (CANONICAL_TS_FIELD, -1))
+        if PARTITION_BY_UNIT and PARTITION_KEY_FIELD != UNIT_ID_FIELD and partition_key not in existing:
+            collection.create_index(list(partition_key), name="alarm_partition_ts")
+            logging.info(f"Created ({PARTITION_KEY_FIELD}, {CANONICAL_TS_FIELD}) index for per-partition lookup")
+    except PyMongoError as e:
+        logging.warning(f"Could not provision alarm indexes: {e}")
+
+
+def get_alarm_query_diagnostics(collection=None):
+    """
+    Return the explain() plan of the latest-alarm query and, on Cosmos, the request charge (RU)
+    of the last request. Intended for troubleshooting; not called on the hot path.
+    """
+    if collection is None:
+        collection = get_mongo_client()[COSMOS_DATABASE][COSMOS_COLLECTION]
+    sort_key = _alarm_sort_key or CANONICAL_TS_FIELD
+    projection = get_alarm_projection()
+    query = {ALARM_FIELD: {"$exists": True}}
+    if PARTITION_BY_UNIT and MONITORED_UNITS:
+        query[PARTITION_KEY_FIELD] = MONITORED_UNITS[0]  # one unit's single-partition read
+    cursor = collection.find(query, projection).sort(sort_key, -1).limit(2)
+    diagnostics = {"sort_key": sort_key, "projection": projection, "explain": cursor.explain()}
+    try:
+        stats = collection.database.command({"getLastRequestStatistics": 1})
+        diagnostics["request_charge"] = stats.get("RequestCharge")
+    except PyMongoError:
+        diagnostics["request_charge"] = None  # not a Cosmos endpoint
+    return diagnostics
+
+
+def _snapshot_from_unit_state(state):
+    """(alarm_value, latest_doc, previous_doc) from a unit state document, or None if it has no samples."""
+    recent = (state or {}).get("recent") or []
+    if not recent:
+        return None
+    return recent[0].get(ALARM_FIELD), recent[0], recent[1] if len(recent) > 1 else None
+
+
+def read_unit_states(db, since_ns=None):
+    """
+    Snapshots from the materialized unit state collection: the newest unit when since_ns is
+    None, otherwise every unit seen since then. Returns a list of snapshots (empty if the
+    bridge has not written any state yet).
+    """
+    states = db[UNIT_STATE_COLLECTION]
+    if since_ns is None:
+        cursor = states.find({"recent.0": {"$exists": True}}).sort("latest_ts_ns", -1).limit(1)
+    else:
+        cursor = states.find({"last_seen_ns": {"$gte": since_ns}})
+    return [snapshot for snapshot in map(_snapshot_from_unit_state, cursor) if snapshot]
+
+
+def _latest_alarm_docs(collection, query, projection, sort_key):
+    """
+    Latest two documents matching query, newest first by sort_key. With PARTITION_BY_UNIT and
+    MONITORED_UNITS every unit is read from its own partition and the results are merged, so
+    no read fans out across partitions.
+    """
+    if not (PARTITION_BY_UNIT and MONITORED_UNITS):
+        return list(collection.find(query, projection).sort(sort_key, -1).limit(2))
+    per_unit = get_partition_executor().map(
+        lambda unit: list(collection.find({**query, PARTITION_KEY_FIELD: unit}, projection).sort(sort_key, -1).limit(2)),
+        MONITORED_UNITS,
+    )
+    docs = [doc for unit_docs in per_unit for doc in unit_docs]
+    docs.sort(key=lambda doc: (doc.get(sort_key) is not None, doc.get(sort_key)), reverse=True)
+    return docs[:2]
+
+
 def check_alarm_in_cosmosdb():
     """Check CosmosDB for alarm condition"""
+    global _alarm_sort_key
     try:
         if not MONGODB_CONNECTION_STRING:
             logging.error("MongoDBConnectionString not configured")
@@ -131,32 +520,72 @@ def check_alarm_in_cosmosdb():
         
         logging.info(f"Connecting to database: {COSMOS_DATABASE}, collection: {COSMOS_COLLECTION}")
         
-        # Connect to CosmosDB
-        client = MongoClient(MONGODB_CONNECTION_STRING)
+        # Reuse the worker-wide CosmosDB client
+        client = get_mongo_client()
         db = client[COSMOS_DATABASE]
         collection = db[COSMOS_COLLECTION]
-        
+
+        if MATERIALIZED_UNIT_STATE:
+            snapshots = read_unit_states(db)
+            if snapshots:
+                alarm_value, latest_doc, previous_doc = snapshots[0]
+                logging.info(
+                    f"Latest unit state: ID={latest_doc.get('_id')}, Alarm={alarm_value}, "
+                    f"Timestamp={get_document_time(latest_doc)}"
+                )
+                return snapshots[0]
+            logging.info(f"No documents in '{UNIT_STATE_COLLECTION}' yet, querying the telemetry collection")
+
+        ensure_alarm_indexes(collection)
+
         # Get the two most recent documents (latest and previous).
         # Important: In some collections, `_id` is a string (not ObjectId) and lexicographic sorting
-        # can pick the wrong "latest" document. Prefer `_timestamp` (FILETIME) when present.
-        base_filter = {}
+        # can pick the wrong "latest" document. Prefer the canonical UTC field stamped at ingest,
+        # then `_timestamp` (FILETIME) for collections written before it existed.
         docs = []
 
         # Prefer messages that actually contain the alarm field.
-        filter_with_alarm = {**base_filter, ALARM_FIELD: {"$exists": True}}
+        filter_with_alarm = {ALARM_FIELD: {"$exists": True}}
+        projection = get_alarm_projection()
 
-        # Try sorting by `_timestamp` first (newest first).
-        try:
-            cursor = collection.find(filter_with_alarm).sort("_timestamp", -1).limit(2)
-            docs = list(cursor)
-        except Exception as sort_e:
-            logging.warning(f"Could not sort by _timestamp: {sort_e}")
-            docs = []
+        # Use the sort key that worked before; otherwise try the candidates in order (newest first).
+        # Only "sort not supported" errors rule a key out; anything else (a throttle, a timeout)
+        # fails this tick and the key is detected again on the next one.
+        if _alarm_sort_key != "_id":
+            sort_keys = [_alarm_sort_key] if _alarm_sort_key else [CANONICAL_TS_FIELD, "_timestamp"]
+            failed = 0
+            for sort_key in sort_keys:
+                # Documents without the field would sort last but in no particular order.
+                query = filter_with_alarm
+                if sort_key == CANONICAL_TS_FIELD:
+                    query = {**filter_with_alarm, sort_key: {"$exists": True}}
+                try:
+                    docs = _latest_alarm_docs(collection, query, projection, sort_key)
+                except OperationFailure as sort_e:
+                    if sort_e.code not in _SORT_UNSUPPORTED_CODES:
+                        raise
+                    logging.warning(f"Could not sort by {sort_key}: {sort_e}")
+                    failed += 1
+                    docs = []
+                    continue
+                if docs:
+                    if _alarm_sort_key is None:
+                        _alarm_sort_key = sort_key
+                        logging.info(f"Latest-alarm lookup will sort by {sort_key}")
+                    break
+            if failed == len(sort_keys):
+                if _alarm_sort_key is None:
+                    logging.warning("No timestamp sort is supported, using _id from now on")
+                    _alarm_sort_key = "_id"
+                else:
+                    # The cached key stopped working (e.g. its index was dropped): detect again.
+                    logging.warning(f"Sorting by {_alarm_sort_key} is no longer supported, detecting the sort key again")
+                    _alarm_sort_key = None
 
-        # Fallback: sort by `_id` (works when `_id` is ObjectId; may be imperfect otherwise).
+        # Fallback: sort by `_id`, ObjectIds only. Their order is insertion time; the bridge's
+        # "<partition>:<offset>:<seq>" event ids sort as strings ("100" < "99") and across partitions.
         if not docs:
-            cursor = collection.find(filter_with_alarm).sort("_id", -1).limit(2)
-            docs = list(cursor)
+            docs = _latest_alarm_docs(collection, {**filter_with_alarm, "_id": {"$type": "objectId"}}, projection, "_id")
         latest_doc = docs[0] if docs else None
         previous_doc = docs[1] if len(docs) > 1 else None
         
@@ -180,14 +609,179 @@ def check_alarm_in_cosmosdb():
         latest_time = get_document_time(latest_doc)
         
         logging.info(f"Latest document: ID={latest_doc.get('_id')}, Alarm={alarm_value}, Timestamp={latest_time}")
+        if ALARM_QUERY_DIAGNOSTICS:
+            try:
+                diagnostics = get_alarm_query_diagnostics(collection)
+                bytes_read = sum(len(bson.encode(doc)) for doc in docs)
+                logging.info(
+                    f"Latest-alarm query: sort={diagnostics['sort_key']}, bytes_read={bytes_read}, "
+                    f"projected={projection is not None}, RU={diagnostics['request_charge']}, "
+                    f"plan={json.dumps(diagnostics['explain'].get('queryPlanner', {}).get('winningPlan'), default=str)}"
+                )
+            except PyMongoError as diag_e:
+                logging.warning(f"Could not collect query diagnostics: {diag_e}")
         
         return alarm_value, latest_doc, previous_doc
         
+    except PyMongoError as e:
+        logging.error(f"Error checking CosmosDB: {e}")
+        if isinstance(e, ConnectionFailure):
+            reset_mongo_client()
+        return None
     except Exception as e:
         logging.error(f"Error checking CosmosDB: {e}")
         return None
 
 
+# Latest units seen by check_alarms_for_units(), so silent units keep being evaluated
+# (signal-loss forcing) after they drop out of the lookback window.
+_unit_snapshots = {}
+
+# Partition keys found so far, and the CANONICAL_TS_FIELD value discovery has covered up to.
+_discovered_partitions = set()
+_partitions_discovered_ns = None
+_partition_executor = None
+
+
+def get_partition_keys(collection, since_ns):
+    """
+    Partition keys to read this tick: MONITORED_UNITS when configured, otherwise every key seen
+    since since_ns. Discovery is incremental: after the first tick, distinct() only covers the
+    documents written since the previous one (an index range on CANONICAL_TS_FIELD), and keys
+    found earlier are kept so silent units are still evaluated.
+    """
+    global _partitions_discovered_ns
+    if MONITORED_UNITS:
+        return list(MONITORED_UNITS)
+    start = since_ns if _partitions_discovered_ns is None else max(since_ns, _partitions_discovered_ns)
+    # Re-read a few seconds before the watermark: documents may arrive slightly out of order.
+    query = {CANONICAL_TS_FIELD: {"$gte": start - 5 * 1_000_000_000}}
+    latest = collection.find_one(query, {CANONICAL_TS_FIELD: 1}, sort=[(CANONICAL_TS_FIELD, -1)])
+    if latest is not None:
+        found = collection.distinct(PARTITION_KEY_FIELD, query)
+        new_keys = {key for key in found if key is not None} - _discovered_partitions
+        if new_keys:
+            _discovered_partitions.update(new_keys)
+            logging.info(f"Partition discovery: {len(new_keys)} new, {len(_discovered_partitions)} unit partition(s)")
+        _partitions_discovered_ns = latest[CANONICAL_TS_FIELD]
+    return sorted(_discovered_partitions, key=str)
+
+
+def _latest_alarm_docs_in_partition(collection, partition_key, projection):
+    """Latest two alarm documents of one unit; the filter pins the query to its partition."""
+    query = {PARTITION_KEY_FIELD: partition_key, ALARM_FIELD: {"$exists": True}, CANONICAL_TS_FIELD: {"$exists": True}}
+    return list(collection.find(query, projection).sort(CANONICAL_TS_FIELD, -1).limit(2))
+
+
+def get_partition_executor():
+    """Threads running the single-partition reads (PARTITION_QUERY_THREADS)."""
+    global _partition_executor
+    if _partition_executor is None:
+        _partition_executor = ThreadPoolExecutor(
+            max_workers=max(1, PARTITION_QUERY_THREADS), thread_name_prefix="alarm-partition"
+        )
+    return _partition_executor
+
+
+def check_partitions_for_units(collection, since_ns):
+    """Per-partition variant of the multi-unit aggregation; queries run on PARTITION_QUERY_THREADS threads."""
+    projection = get_alarm_projection()
+    keys = get_partition_keys(collection, since_ns)
+    results = get_partition_executor().map(lambda key: _latest_alarm_docs_in_partition(collection, key, projection), keys)
+    for docs in results:
+        if docs:
+            _unit_snapshots[unit_state_key(docs[0])] = (docs[0].get(ALARM_FIELD), docs[0], docs[1] if len(docs) > 1 else None)
+
+
+def _first_alarm_doc_per_unit(collection, match):
+    """
+    Newest matching document of every unit, {unit_id: doc}. $first on the index-sorted stream keeps
+    one document per unit in the $group, so memory stays O(units) however large the window is.
+    """
+    pipeline = [{"$match": match}, {"$sort": {CANONICAL_TS_FIELD: -1}}]
+    projection = get_alarm_projection()
+    if projection is not None:
+        pipeline.append({"$project": projection})
+    pipeline.append({"$group": {"_id": f"${UNIT_ID_FIELD}", "doc": {"$first": "$$ROOT"}}})
+    return {group["_id"]: group["doc"] for group in collection.aggregate(pipeline, allowDiskUse=True) if group.get("doc")}
+
+
+def check_alarms_for_units(now_utc=None):
+    """
+    Fetch the latest two alarm documents of every unit with two $first aggregations (or one query per
+    partition with PARTITION_BY_UNIT, or from the unit state collection).
+    Returns {state_key: (alarm_value, latest_doc, previous_doc)}, or None on error.
+    """
+    try:
+        client = get_mongo_client()
+        if client is None:
+            logging.error("MongoDBConnectionString not configured")
+            return None
+        db = client[COSMOS_DATABASE]
+        collection = db[COSMOS_COLLECTION]
+
+        now_utc = now_utc or datetime.utcnow()
+        since_ns = (now_utc - timedelta(seconds=UNIT_LOOKBACK_SECONDS) - UNIX_EPOCH) // timedelta(microseconds=1) * 1000
+
+        if MATERIALIZED_UNIT_STATE:
+            snapshots = read_unit_states(db, since_ns)
+            if snapshots:
+                for snapshot in snapshots:
+                    _unit_snapshots[unit_state_key(snapshot[1])] = snapshot
+                logging.info(f"Multi-unit check (unit state): {len(_unit_snapshots)} unit(s) tracked")
+                return dict(_unit_snapshots)
+
+        ensure_alarm_indexes(collection)
+        if PARTITION_BY_UNIT:
+            check_partitions_for_units(collection, since_ns)
+            logging.info(f"Multi-unit check (per partition): {len(_unit_snapshots)} unit(s) tracked")
+            return dict(_unit_snapshots)
+
+        match = {
+            ALARM_FIELD: {"$exists": True},
+            UNIT_ID_FIELD: {"$exists": True},
+            CANONICAL_TS_FIELD: {"$gte": since_ns},
+        }
+        latest = _first_alarm_doc_per_unit(collection, match)
+        # Previous sample: a unit whose latest document is unchanged keeps the one found earlier;
+        # the rest get a second $first pass over just those units, their latest documents excluded.
+        changed = {
+            unit_id: doc for unit_id, doc in latest.items()
+            if _unit_snapshots.get(unit_state_key(doc), (None, {}))[1].get("_id") != doc["_id"]
+        }
+        previous = _first_alarm_doc_per_unit(collection, {
+            **match,
+            UNIT_ID_FIELD: {"$in": list(changed)},
+            "_id": {"$nin": [doc["_id"] for doc in changed.values()]},
+        }) if changed else {}
+        for unit_id, latest_doc in changed.items():
+            _unit_snapshots[unit_state_key(latest_doc)] = (
+                latest_doc.get(ALARM_FIELD), latest_doc, previous.get(unit_id)
+            )
+
+        logging.info(f"Multi-unit check: {len(_unit_snapshots)} unit(s) tracked")
+        return dict(_unit_snapshots)
+
+    except PyMongoError as e:
+        logging.error(f"Error checking CosmosDB units: {e}")
+        if isinstance(e, ConnectionFailure):
+            reset_mongo_client()
+        return None
+    except Exception as e:
+        logging.error(f"Error checking CosmosDB units: {e}")
+        return None
+
+
+def fetch_alarm_snapshots(now_utc):
+    """Return {state_key: (alarm_value, latest_doc, previous_doc)} for this tick."""
+    if MULTI_UNIT_MONITORING:
+        return check_alarms_for_units(now_utc)
+    result = check_alarm_in_cosmosdb()
+    if result is None:
+        return None
+    return {ALARM_STATE_KEY: result}
+
+
 def get_phone_number_from_database():
     """Get phone number from Operator collection in IoTDatabase"""
     try:
@@ -195,8 +789,8 @@ def get_phone_number_from_database():
             logging.error("MongoDBConnectionString not configured")
             return None
         
-        # Connect to CosmosDB
-        client = MongoClient(MONGODB_CONNECTION_STRING)
+        # Reuse the worker-wide CosmosDB client
+        client = get_mongo_client()
         db = client[COSMOS_DATABASE]
         operator_collection = db["Operator"]
         
@@ -227,13 +821,284 @@ def get_phone_number_from_database():
         logging.info(f"Retrieved phone number from Operator collection: {full_phone_number}")
         return full_phone_number
         
+    except PyMongoError as e:
+        logging.error(f"Error getting phone number from database: {e}")
+        if isinstance(e, ConnectionFailure):
+            reset_mongo_client()
+        return None
     except Exception as e:
         logging.error(f"Error getting phone number from database: {e}")
         return None
 
 
-def make_phone_call(message="Hi Operator, this is the Bawat Container. There is a Safety Alarm. Please attend."):
-    """Make phone call using Azure Communication Services and play message when answered"""
+class ChangeStreamBackoff:
+    """
+    Reopen schedule of a failing change stream: 1s, 2s, 4s, ... up to CHANGE_STREAM_RETRY_MAX_SECONDS.
+    Logs a WARNING only when the stream goes from healthy to failing, and INFO when it recovers.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.healthy = True
+        self.retry_at = 0.0  # time.monotonic() before which the stream is not reopened
+        self.delay = 0.0
+
+    def waiting(self):
+        return time.monotonic() < self.retry_at
+
+    def failed(self, message):
+        self.delay = min(max(1.0, self.delay * 2), CHANGE_STREAM_RETRY_MAX_SECONDS)
+        self.retry_at = time.monotonic() + self.delay
+        if self.healthy:
+            self.healthy = False
+            logging.warning(message)
+        else:
+            logging.debug(f"{message} (next attempt in {self.delay:.0f}s)")
+
+    def recovered(self):
+        if not self.healthy:
+            logging.info(f"Change stream on {self.name} recovered")
+        self.healthy = True
+        self.delay = 0.0
+
+
+class OperatorPhoneCache:
+    """
+    In-process cache of the normalized Operator phone number.
+
+    Fresh values are returned directly; a stale value is still returned while a background
+    thread reloads it, so only the very first lookup of a worker reads the database inline.
+    """
+
+    def __init__(self, loader, ttl_seconds):
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        self.value = None
+        self.loaded_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._watch_thread = None
+        self.watch_supported = True
+        self.watch_backoff = ChangeStreamBackoff("Operator")
+
+    def is_fresh(self):
+        return self.value is not None and time.monotonic() - self.loaded_at < self.ttl_seconds
+
+    def get(self):
+        with self._lock:
+            value = self.value
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if value is None:
+            return self.refresh()
+        if not self.is_fresh():
+            self.refresh_in_background()
+        return value
+
+    def refresh(self):
+        """Reload the number now. Keeps the previous value if the lookup fails."""
+        value = self.loader()
+        with self._lock:
+            self.refreshes += 1
+            self._refreshing = False
+            if value:
+                self.value = value
+                self.loaded_at = time.monotonic()
+            return self.value
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name="operator-phone-refresh", daemon=True).start()
+
+    def invalidate(self):
+        """Mark the cached number stale and reload it in the background."""
+        with self._lock:
+            self.loaded_at = 0.0
+            self.invalidations += 1
+        self.refresh_in_background()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "invalidations": self.invalidations,
+                "cached": self.value is not None,
+                "fresh": self.is_fresh(),
+            }
+
+    def watch(self, collection):
+        """
+        Invalidate whenever the Operator collection changes (requires change stream support).
+        Called every tick: a failed watch is reopened only after its backoff, and never again
+        once the server turned out to have no change streams.
+        """
+        if not self.watch_supported or self.watch_backoff.waiting():
+            return
+        if self._watch_thread is not None and self._watch_thread.is_alive():
+            return
+
+        def _run():
+            try:
+                with collection.watch(
+                    [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+                     {"$project": {"_id": 1, "fullDocument": 1, "ns": 1, "documentKey": 1}}],
+                    full_document="updateLookup",
+                    max_await_time_ms=CHANGE_STREAM_MAX_AWAIT_MS,
+                ) as stream:
+                    confirmed = False
+                    while stream.alive:
+                        change = stream.try_next()
+                        if not confirmed:
+                            self.watch_backoff.recovered()
+                            confirmed = True
+                        if change is not None:
+                            logging.info("Operator collection changed; refreshing cached phone number")
+                            self.invalidate()
+            except OperationFailure as e:
+                if e.code in _CHANGE_STREAM_UNSUPPORTED_CODES:
+                    logging.warning(f"Operator change stream not supported, relying on TTL refresh: {e}")
+                    self.watch_supported = False
+                else:
+                    self.watch_backoff.failed(f"Operator change stream failed, relying on TTL refresh until it recovers: {e}")
+            except PyMongoError as e:
+                self.watch_backoff.failed(f"Operator change stream unavailable, relying on TTL refresh until it recovers: {e}")
+
+        self._watch_thread = threading.Thread(target=_run, name="operator-phone-watch", daemon=True)
+        self._watch_thread.start()
+
+
+operator_phone_cache = OperatorPhoneCache(
+    lambda: get_phone_number_from_database(), OPERATOR_PHONE_CACHE_TTL_SECONDS
+)
+
+
+def prefetch_operator_phone_number():
+    """Keep the cached Operator number warm; called every tick so dialing never waits on Mongo."""
+    if not MONGODB_CONNECTION_STRING:
+        return
+    if OPERATOR_PHONE_WATCH:
+        client = get_mongo_client()
+        operator_phone_cache.watch(client[COSMOS_DATABASE]["Operator"])
+    if not operator_phone_cache.is_fresh():
+        operator_phone_cache.refresh_in_background()
+    logging.debug(f"Operator phone cache stats: {operator_phone_cache.stats()}")
+
+
+def _acs_endpoint(connection_string):
+    """Extract the https endpoint from an ACS connection string."""
+    for part in (connection_string or "").split(";"):
+        key, _, value = part.partition("=")
+        if key.strip().lower() == "endpoint":
+            return value.strip()
+    return None
+
+
+def get_call_automation_client():
+    """
+    Return the CallAutomationClient shared by this worker, creating it on first use.
+    The client uses a requests session we own, so connections stay alive between calls
+    and prewarm_call_automation_client() can open the TLS connection ahead of time.
+    """
+    global _call_automation_client, _acs_session
+
+    with _call_automation_client_lock:
+        if _call_automation_client is None:
+            import requests
+            from azure.core.pipeline.transport import RequestsTransport
+
+            _acs_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=ACS_CONNECTION_POOL_SIZE, pool_maxsize=ACS_CONNECTION_POOL_SIZE
+            )
+            _acs_session.mount("https://", adapter)
+            _call_automation_client = CallAutomationClient.from_connection_string(
+                COMMUNICATION_SERVICE_CONNECTION_STRING,
+                transport=RequestsTransport(session=_acs_session, session_owner=False),
+            )
+        return _call_automation_client
+
+
+def prewarm_call_automation_client():
+    """Create the shared client and open a keep-alive connection to the ACS endpoint."""
+    global _call_automation_client_warm
+
+    if not COMMUNICATION_SERVICE_CONNECTION_STRING:
+        return
+    try:
+        started = time.perf_counter()
+        get_call_automation_client()
+        endpoint = _acs_endpoint(COMMUNICATION_SERVICE_CONNECTION_STRING)
+        if endpoint:
+            # Any response will do: the point is the DNS lookup and TLS handshake.
+            _acs_session.head(endpoint, timeout=10)
+        _call_automation_client_warm = True
+        logging.info(f"CallAutomationClient pre-warmed in {(time.perf_counter() - started) * 1000:.0f} ms")
+    except Exception as e:
+        logging.warning(f"Could not pre-warm CallAutomationClient: {e}")
+
+
+def get_callback_url():
+    """URL ACS posts call events to (served by call_callback_function)."""
+    url = CALLBACK_URL or f"https://{os.environ.get('WEBSITE_HOSTNAME', 'localhost')}/api/callbacks"
+    if CALLBACK_SECRET:
+        url += ("&" if "?" in url else "?") + "token=" + quote(CALLBACK_SECRET, safe="")
+    return url
+
+
+def verify_callback_token(token):
+    """True when the callback request carries CALLBACK_SECRET (or no secret is configured)."""
+    if not CALLBACK_SECRET:
+        return True
+    return hmac.compare_digest(str(token or ""), CALLBACK_SECRET)
+
+
+def use_callback_playback():
+    """True when playback should be started by the CallConnected callback instead of polling."""
+    if AUDIO_PLAYBACK_TRIGGER != "callback":
+        return False
+    return "://localhost" not in get_callback_url()
+
+
+def start_playback(call_connection_id, call_automation_client=None):
+    """Play AUDIO_FILE_URL to everyone on the call. Returns True when playback was requested."""
+    if not (AUDIO_FILE_URL and AUDIO_PLAYBACK_AVAILABLE):
+        return False
+    if call_automation_client is None:
+        call_automation_client = get_call_automation_client()
+    call_connection_obj = call_automation_client.get_call_connection(call_connection_id)
+    file_source = FileSource(url=AUDIO_FILE_URL)
+    if hasattr(call_connection_obj, 'play_media_to_all'):
+        call_connection_obj.play_media_to_all(file_source)
+        logging.info(f"Audio playback started (play_media_to_all) from: {AUDIO_FILE_URL}")
+    elif hasattr(call_connection_obj, 'play_media'):
+        call_connection_obj.play_media(play_sources=[file_source])
+        logging.info(f"Audio playback started (play_media) from: {AUDIO_FILE_URL}")
+    else:
+        raise Exception("Neither play_media_to_all nor play_media methods found")
+    return True
+
+
+def make_phone_call(message="Hi Operator, this is the Bawat Container. There is a Safety Alarm. Please attend.",
+                    cancel_event=None, state_key=None, detected_at=None):
+    """
+    Make phone call using Azure Communication Services and play message when answered.
+    In callback mode playback is left to the CallConnected event; otherwise this blocks until
+    playback starts, PLAYBACK_TIMEOUT_SECONDS elapses or cancel_event is set. The timer path
+    runs it through place_call_in_background() instead of calling it directly.
+    """
+    if cancel_event is None:
+        cancel_event = threading.Event()
     try:
         if not COMMUNICATION_SERVICE_CONNECTION_STRING:
             logging.error("Communication Service connection string not configured")
@@ -243,8 +1108,8 @@ def make_phone_call(message="Hi Operator, this is the Bawat Container. There is
             logging.error("Communication Service phone number not configured")
             return False
         
-        # Get phone number from database
-        phone_number_to_call = get_phone_number_from_database()
+        # Get phone number from the Operator cache (database read only on a cold worker)
+        phone_number_to_call = operator_phone_cache.get()
         
         if not phone_number_to_call:
             logging.error("Could not retrieve phone number from Operator collection")
@@ -256,10 +1121,9 @@ def make_phone_call(message="Hi Operator, this is the Bawat Container. There is
                 logging.error("No phone number available from database or environment variable")
                 return False
         
-        # Initialize Call Automation Client
-        call_automation_client = CallAutomationClient.from_connection_string(
-            COMMUNICATION_SERVICE_CONNECTION_STRING
-        )
+        # Shared Call Automation Client (kept alive between calls)
+        was_warm = _call_automation_client_warm or _call_automation_client is not None
+        call_automation_client = get_call_automation_client()
         
         logging.info(f"Making phone call to {phone_number_to_call}...")
         
@@ -269,18 +1133,25 @@ def make_phone_call(message="Hi Operator, this is the Bawat Container. There is
             target_phone = PhoneNumberIdentifier(phone_number_to_call)
             source_phone = PhoneNumberIdentifier(COMMUNICATION_SERVICE_PHONE_NUMBER)
             
-            callback_url = CALLBACK_URL or f"https://{os.environ.get('WEBSITE_HOSTNAME', 'localhost')}/api/callbacks"
+            callback_url = get_callback_url()
             
-            # Create the call
+            # Create the call; operation_context lets callback events find the alarm state.
             call_connection = call_automation_client.create_call(
                 target_participant=target_phone,
                 callback_url=callback_url,
-                source_caller_id_number=source_phone
+                source_caller_id_number=source_phone,
+                operation_context=state_key,
             )
             
             call_connection_id = call_connection.call_connection_id
             server_call_id = getattr(call_connection, 'server_call_id', None)
             logging.info(f"Call initiated: {call_connection_id}, ServerCallId: {server_call_id}")
+            if detected_at is not None:
+                logging.info(
+                    f"Detection to create_call return: {(time.perf_counter() - detected_at) * 1000:.0f} ms "
+                    f"({'warm' if was_warm else 'cold'} client)"
+                )
+            register_call(call_connection_id, state_key)
             
             # Debug logging
             logging.info(f"Audio file URL configured: {bool(AUDIO_FILE_URL)}")
@@ -290,48 +1161,41 @@ def make_phone_call(message="Hi Operator, this is the Bawat Container. There is
             
             # Play audio file if URL is provided
             playback_success = True  # default: treat as success when no audio is used
-            if AUDIO_FILE_URL and AUDIO_PLAYBACK_AVAILABLE:
+            if AUDIO_FILE_URL and AUDIO_PLAYBACK_AVAILABLE and use_callback_playback():
+                logging.info(f"Audio playback will start on CallConnected callback ({callback_url})")
+            elif AUDIO_FILE_URL and AUDIO_PLAYBACK_AVAILABLE:
                 try:
-                    # Get the call connection
-                    call_connection_obj = call_automation_client.get_call_connection(call_connection_id)
-                    
-                    # Create file source for audio playback
-                    file_source = FileSource(url=AUDIO_FILE_URL)
-                    
-                    # Wait for call to be established (answered) with retry logic
-                    max_retries = 10  # Try for up to 30 seconds (10 retries * 3 seconds)
+                    # Wait for call to be established (answered) with retry logic, bounded by
+                    # PLAYBACK_TIMEOUT_SECONDS and interruptible through cancel_event.
+                    deadline = time.monotonic() + PLAYBACK_TIMEOUT_SECONDS
                     retry_count = 0
                     playback_success = False
                     
-                    while retry_count < max_retries and not playback_success:
+                    while not playback_success:
                         try:
                             # Wait before trying
-                            if retry_count > 0:
-                                time.sleep(3)  # Wait 3 seconds between retries
-                            else:
-                                time.sleep(5)  # Wait 5 seconds on first attempt
+                            delay = PLAYBACK_RETRY_SECONDS if retry_count > 0 else PLAYBACK_INITIAL_DELAY_SECONDS
+                            delay = min(delay, max(0.0, deadline - time.monotonic()))
+                            if cancel_event.wait(delay):
+                                logging.info(f"Audio playback cancelled for call {call_connection_id}")
+                                break
                             
                             # Try to play audio
-                            if hasattr(call_connection_obj, 'play_media_to_all'):
-                                call_connection_obj.play_media_to_all(file_source)
-                                logging.info(f"Audio playback started (play_media_to_all) from: {AUDIO_FILE_URL}")
-                                playback_success = True
-                            elif hasattr(call_connection_obj, 'play_media'):
-                                call_connection_obj.play_media(play_sources=[file_source])
-                                logging.info(f"Audio playback started (play_media) from: {AUDIO_FILE_URL}")
-                                playback_success = True
-                            else:
-                                raise Exception("Neither play_media_to_all nor play_media methods found")
+                            playback_success = start_playback(call_connection_id, call_automation_client)
                                 
                         except Exception as play_error:
                             error_str = str(play_error)
                             # Check if it's the "not in Established state" error
                             if "not in Established state" in error_str or "8501" in error_str:
                                 retry_count += 1
-                                logging.info(f"Call not answered yet, retrying ({retry_count}/{max_retries})...")
-                                if retry_count >= max_retries:
-                                    logging.warning(f"Call not answered after {max_retries} attempts. Audio playback failed.")
+                                if time.monotonic() >= deadline:
+                                    logging.warning(
+                                        f"Call not answered within {PLAYBACK_TIMEOUT_SECONDS:.0f}s "
+                                        f"({retry_count} attempts). Audio playback failed."
+                                    )
                                     logging.info("Consider using callback-based approach to detect when call is answered")
+                                    break
+                                logging.info(f"Call not answered yet, retrying ({retry_count})...")
                             else:
                                 # Different error, don't retry
                                 raise
@@ -366,193 +1230,605 @@ def make_phone_call(message="Hi Operator, this is the Bawat Container. There is
         return False
 
 
-def main(timer: func.TimerRequest) -> None:
+class ChangeStreamWatcher:
     """
-    Timer trigger function that runs every minute to check for alarms
-    Configure in function.json with schedule: "0 * * * * *" (every minute)
-    Note: Time comparisons use -1 hour adjustment for DB timezone alignment
+    Background watcher that pushes new alarm-bearing inserts into evaluate_alarm().
+
+    Keeps the latest two documents in memory so timer ticks can re-run the state
+    machine (signal loss, retry delay) without reading the collection again, and
+    persists the resume token so a restarted worker continues where it left off.
     """
-    try:
-        # Adjust time -1 hour for DB comparison (naive UTC)
-        now_utc = datetime.utcnow()
-        current_time_adjusted = now_utc - timedelta(hours=1)
-        logging.info(f"Timer trigger executed at {now_utc} (DB comparison time: {current_time_adjusted})")
-        
-        # Check for alarm
-        result = check_alarm_in_cosmosdb()
-        
-        if result is None:
-            logging.info("No data found or error checking CosmosDB")
+
+    def __init__(self, collection, token_collection):
+        self.collection = collection
+        self.token_collection = token_collection
+        self.token_key = f"change_stream:{collection.full_name}"
+        self.units = {}  # state_key -> (latest_doc, previous_doc)
+        self.supported = True
+        self.backoff = ChangeStreamBackoff(collection.full_name)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def pipeline(self):
+        """Only inserts that carry the alarm field are relevant to the state machine."""
+        return [
+            {"$match": {"operationType": "insert", f"fullDocument.{ALARM_FIELD}": {"$exists": True}}},
+            {"$project": {"_id": 1, "fullDocument": 1, "ns": 1, "documentKey": 1}},
+        ]
+
+    def load_resume_token(self):
+        try:
+            saved = self.token_collection.find_one({"_id": self.token_key})
+            return saved.get("resume_token") if saved else None
+        except PyMongoError as e:
+            logging.warning(f"Could not load change stream resume token: {e}")
+            return None
+
+    def save_resume_token(self, token):
+        if token is None:
             return
-        
-        alarm_value, doc, previous_doc = result
-        doc_id = str(doc.get("_id", "unknown"))
-        
-        # Parse and format timestamp for logging (using timestamp field or _id fallback)
-        timestamp_str = "N/A"
-        timestamp = get_document_time(doc)
-        if timestamp:
-            # Normalize to naive for consistent arithmetic
-            if getattr(timestamp, "tzinfo", None) is not None:
-                timestamp = timestamp.replace(tzinfo=None)
-            timestamp_str = timestamp.strftime("%Y-%m-%d %H:%M:%S")
-
-        # Compute age of latest message relative to now (per-run age) — use now_utc so age is positive
-        age_seconds = None
-        if timestamp:
-            age_seconds = (now_utc - timestamp).total_seconds()
-            logging.info(f"Age of latest message (seconds) = {int(age_seconds)}")
-
-        # Calculate and log time since last message if previous document exists
-        if previous_doc:
-            prev_timestamp = get_document_time(previous_doc)
-            if timestamp and prev_timestamp:
-                if getattr(prev_timestamp, "tzinfo", None) is not None:
-                    prev_timestamp = prev_timestamp.replace(tzinfo=None)
-                time_since_last_message = (timestamp - prev_timestamp).total_seconds()
-                if time_since_last_message >= 0:
-                    logging.info(f"Time since last message (seconds) = {int(time_since_last_message)}")
-        
-        # Log timestamp and alarm status (visible in log stream)
-        call_service_value = doc.get(CALL_SERVICE_FIELD, 0)
-        logging.info(f"Timestamp last occurrence: {timestamp_str}. Alarm signal: {alarm_value}, CallService: {call_service_value}")
-
-        # Log VolumeTreated field for visibility
-        volume_treated_value = doc.get(VOLUME_TREATED_FIELD)
-        logging.info(f"Volume treated ({VOLUME_TREATED_FIELD}) = {volume_treated_value}")
-
-        # Determine if alarm is active (normal), or forced active (signal-loss) with a bounded window.
-        # Optional compatibility mode: allow CallOperator-only alarms when CallService is missing/0.
-        is_alarm_active_normal = (alarm_value == 1 and call_service_value == 1)
-        if not is_alarm_active_normal and ALLOW_ALARM_WITHOUT_CALL_SERVICE and alarm_value == 1:
-            logging.warning(
-                "⚠️  CallService bypass active (ALLOW_ALARM_WITHOUT_CALL_SERVICE=true). "
-                f"Treating alarm as active with {ALARM_FIELD}=1 and {CALL_SERVICE_FIELD}={call_service_value}."
+        try:
+            self.token_collection.replace_one(
+                {"_id": self.token_key},
+                {"_id": self.token_key, "resume_token": token, "updated_utc": datetime.utcnow()},
+                upsert=True,
             )
-            is_alarm_active_normal = True
-        is_alarm_active_forced = False
-        if age_seconds is not None and age_seconds > SIGNAL_LOSS_SECONDS and call_service_value == 1:
-            is_alarm_active_forced = True
-
-        # Stable per-unit key (not doc_id). You can override this to support multiple units per app.
-        state_key = os.environ.get("ALARM_STATE_KEY", "alarm:global")
-        state = alarm_runtime_state.get(
-            state_key,
-            {
-                "active": False,
-                "active_since_utc": None,
-                "forced_mode": False,
-                "forced_since_utc": None,
-                "attempts": 0,
-                "last_attempt_utc": None,
-            },
+        except PyMongoError as e:
+            logging.warning(f"Could not persist change stream resume token: {e}")
+
+    def clear_resume_token(self):
+        try:
+            self.token_collection.delete_one({"_id": self.token_key})
+        except PyMongoError as e:
+            logging.warning(f"Could not delete change stream resume token: {e}")
+
+    def seed(self, snapshots):
+        with self._lock:
+            for state_key, (_, latest_doc, previous_doc) in snapshots.items():
+                self.units[state_key] = (latest_doc, previous_doc)
+
+    def snapshot(self):
+        """Return {state_key: (alarm_value, latest_doc, previous_doc)} like fetch_alarm_snapshots(), or None."""
+        with self._lock:
+            if not self.units:
+                return None
+            return {
+                state_key: (latest_doc.get(ALARM_FIELD), latest_doc, previous_doc)
+                for state_key, (latest_doc, previous_doc) in self.units.items()
+            }
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="alarm-change-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def handle_change(self, change):
+        doc = change.get("fullDocument")
+        if not doc:
+            return
+        state_key = unit_state_key(doc)
+        with self._lock:
+            previous_doc = self.units.get(state_key, (None, None))[0]
+            self.units[state_key] = (doc, previous_doc)
+        logging.info(f"Change stream insert: ID={doc.get('_id')}, Alarm={doc.get(ALARM_FIELD)}, state_key={state_key}")
+        evaluate_alarm(doc.get(ALARM_FIELD), doc, previous_doc, datetime.utcnow(), state_key)
+
+    def _run(self):
+        try:
+            self._watch()
+        except Exception as e:
+            # The thread ends; ensure_change_stream_watcher() restarts it once the backoff has passed.
+            self.backoff.failed(f"Change stream watcher stopped, polling until it recovers: {e}")
+
+    def _watch(self):
+        resume_token = self.load_resume_token()
+        saved_token = resume_token
+        saved_at = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                with self.collection.watch(
+                    self.pipeline(),
+                    full_document="updateLookup",
+                    resume_after=resume_token,
+                    max_await_time_ms=CHANGE_STREAM_MAX_AWAIT_MS,
+                ) as stream:
+                    logging.info(f"Change stream opened on {self.collection.full_name}")
+                    confirmed = False
+                    while not self._stop.is_set() and stream.alive:
+                        change = stream.try_next()
+                        if not confirmed:
+                            self.backoff.recovered()
+                            confirmed = True
+                        if change is not None:
+                            try:
+                                self.handle_change(change)
+                            except Exception as e:
+                                logging.error(f"Error evaluating change stream event: {e}")
+                        if stream.resume_token is not None:
+                            resume_token = stream.resume_token
+                        # Persist right after a handled event; idle token moves at most every CHANGE_STREAM_TOKEN_SAVE_SECONDS.
+                        if resume_token != saved_token and (
+                            change is not None or time.monotonic() - saved_at >= CHANGE_STREAM_TOKEN_SAVE_SECONDS
+                        ):
+                            self.save_resume_token(resume_token)
+                            saved_token = resume_token
+                            saved_at = time.monotonic()
+            except OperationFailure as e:
+                if e.code in _CHANGE_STREAM_UNSUPPORTED_CODES:
+                    # e.g. standalone mongod or a Cosmos account without change stream support.
+                    logging.warning(f"Change streams not supported, falling back to polling: {e}")
+                    self.supported = False
+                    return
+                if e.code in _RESUME_TOKEN_LOST_CODES and resume_token is not None:
+                    # Start from now; inserts missed in between are picked up by reseeding from a poll.
+                    logging.warning(f"Change stream resume token no longer valid, reopening without it: {e}")
+                    self.clear_resume_token()
+                    resume_token = saved_token = None
+                    snapshots = fetch_alarm_snapshots(datetime.utcnow())
+                    if snapshots:
+                        self.seed(snapshots)
+                    continue
+                self.backoff.failed(f"Change stream failed, polling until it recovers: {e}")
+                self._stop.wait(self.backoff.delay)
+            except PyMongoError as e:
+                self.backoff.failed(f"Change stream interrupted, polling until it recovers: {e}")
+                self._stop.wait(self.backoff.delay)
+        if resume_token != saved_token:
+            self.save_resume_token(resume_token)
+
+
+_change_stream_watcher = None
+
+
+def ensure_change_stream_watcher():
+    """
+    Start the change stream watcher for this worker if ALARM_DETECTION_MODE asks for it.
+    Returns the running watcher, or None when the caller should poll instead (also while a
+    failed watcher backs off, so ticks neither restart it nor read a stale snapshot).
+    """
+    global _change_stream_watcher
+
+    if ALARM_DETECTION_MODE != "change_stream":
+        return None
+    if _change_stream_watcher is not None:
+        if not _change_stream_watcher.supported:
+            return None
+        if _change_stream_watcher.is_running():
+            return _change_stream_watcher if _change_stream_watcher.backoff.healthy else None
+        if _change_stream_watcher.backoff.waiting():
+            return None
+
+    client = get_mongo_client()
+    if client is None:
+        return None
+    db = client[COSMOS_DATABASE]
+    if _change_stream_watcher is None:
+        _change_stream_watcher = ChangeStreamWatcher(db[COSMOS_COLLECTION], db[CHANGE_STREAM_STATE_COLLECTION])
+        # Seed the in-memory window once so timer ticks have something to evaluate.
+        snapshots = fetch_alarm_snapshots(datetime.utcnow())
+        if snapshots:
+            _change_stream_watcher.seed(snapshots)
+    _change_stream_watcher.start()
+    return _change_stream_watcher
+
+
+def register_call(call_connection_id, state_key):
+    """Remember which alarm state a created call belongs to."""
+    with _call_registry_lock:
+        _call_registry[call_connection_id] = {
+            "state_key": state_key,
+            "created_utc": datetime.utcnow(),
+            "connected": False,
+            "playback_started": False,
+        }
+    # Lets a callback that reaches another worker prove the call belongs to this alarm state.
+    if state_key:
+        get_state_store().save(state_key, {"active_call_connection_id": call_connection_id})
+
+
+def forget_call(call_connection_id, state_key):
+    """
+    Drop an ended call. Clearing active_call_connection_id makes late or redelivered events for it
+    look unknown to every worker, so they cannot overwrite the outcome or start playback.
+    """
+    with _call_registry_lock:
+        _call_registry.pop(call_connection_id, None)
+    if state_key:
+        store = get_state_store()
+        store.flush()
+        # Only when it still names this call: a newer call for the unit may already be registered.
+        store.compare_and_set(state_key, {"active_call_connection_id": call_connection_id},
+                              {"active_call_connection_id": None})
+
+
+def record_call_outcome(state_key, outcome, call_connection_id=None):
+    """Store the answered / not-answered result of a call on its alarm state."""
+    if not state_key:
+        return
+    fields = {
+        "last_call_outcome": outcome,
+        "last_call_outcome_utc": datetime.utcnow(),
+        "last_call_connection_id": call_connection_id,
+    }
+    with _alarm_eval_lock:
+        state = alarm_runtime_state.get(state_key)
+        if state is not None:
+            state.update(fields)
+    get_state_store().save(state_key, fields)
+    logging.info(f"Call outcome for {state_key}: {outcome} (call {call_connection_id})")
+
+
+def handle_call_event(event):
+    """
+    Handle one ACS Call Automation callback event (CloudEvent dict).
+    CallConnected starts playback, CallDisconnected records whether the call was answered.
+    Returns the short event type that was handled, or None when the event was ignored.
+    """
+    event_type = str(event.get("type", "")).rsplit(".", 1)[-1]
+    data = event.get("data") or {}
+    call_connection_id = data.get("callConnectionId")
+    if not call_connection_id:
+        return None
+
+    with _call_registry_lock:
+        entry = _call_registry.get(call_connection_id)
+    if entry is None:
+        # Created by another worker/instance. operationContext comes from the request body, so only
+        # trust it when the shared state store recorded this call id for that state key.
+        state_key = data.get("operationContext")
+        stored = get_state_store().load([state_key]).get(state_key) if state_key else None
+        if not stored or stored.get("active_call_connection_id") != call_connection_id:
+            logging.warning(f"Ignoring {event_type} for unknown call {call_connection_id}")
+            return None
+        with _call_registry_lock:
+            entry = _call_registry.setdefault(call_connection_id, {
+                "state_key": state_key,
+                "created_utc": None,
+                "connected": False,
+                "playback_started": False,
+            })
+    state_key = entry.get("state_key")
+
+    if event_type == "CallConnected":
+        logging.info(f"CallConnected: {call_connection_id} (state_key={state_key})")
+        with _call_registry_lock:
+            entry["connected"] = True
+            # Claim playback so a redelivered CallConnected does not play the message twice.
+            start = not entry["playback_started"]
+            entry["playback_started"] = True
+        record_call_outcome(state_key, "answered", call_connection_id)
+        if start:
+            started = False
+            try:
+                started = start_playback(call_connection_id)
+            except Exception as e:
+                logging.error(f"Could not start audio playback on CallConnected: {e}")
+            if not started:
+                with _call_registry_lock:
+                    entry["playback_started"] = False
+    elif event_type in ("PlayCompleted", "PlayFailed"):
+        logging.info(f"{event_type}: {call_connection_id}")
+    elif event_type == "CallDisconnected":
+        logging.info(f"CallDisconnected: {call_connection_id} (connected={entry['connected']})")
+        if not entry["connected"]:
+            record_call_outcome(state_key, "not_answered", call_connection_id)
+        forget_call(call_connection_id, state_key)
+    elif event_type == "CreateCallFailed":
+        logging.warning(f"CreateCallFailed: {call_connection_id}")
+        record_call_outcome(state_key, "not_answered", call_connection_id)
+        forget_call(call_connection_id, state_key)
+    else:
+        logging.debug(f"Ignoring call event {event_type} for {call_connection_id}")
+        return None
+    return event_type
+
+
+def place_call_in_background(message, state_key):
+    """
+    Submit make_phone_call() to the call worker pool and return its Future at once.
+    The playback wait can be cancelled with cancel_pending_calls(state_key).
+    """
+    cancel_event = threading.Event()
+    detected_at = time.perf_counter()
+    future = _call_executor.submit(make_phone_call, message, cancel_event, state_key, detected_at)
+    with _pending_calls_lock:
+        _pending_calls.setdefault(state_key, []).append((future, cancel_event))
+
+    def _on_done(done_future):
+        with _pending_calls_lock:
+            entries = _pending_calls.get(state_key, [])
+            entries[:] = [entry for entry in entries if entry[0] is not done_future]
+            if not entries:
+                _pending_calls.pop(state_key, None)
+        if done_future.cancelled():
+            logging.info(f"Call for {state_key} cancelled before it was placed")
+        elif done_future.exception() is not None:
+            logging.error(f"Call worker for {state_key} raised: {done_future.exception()}")
+        elif done_future.result():
+            logging.info("Call initiated (note: create_call != answered; use callbacks for answered detection).")
+        else:
+            logging.error("Call attempt failed to initiate (will retry if policy allows).")
+
+    future.add_done_callback(_on_done)
+    return future
+
+
+def cancel_pending_calls(state_key):
+    """Cancel queued calls and stop playback waits for a unit (e.g. when its alarm clears)."""
+    with _pending_calls_lock:
+        entries = list(_pending_calls.get(state_key, []))
+    for future, cancel_event in entries:
+        cancel_event.set()
+        future.cancel()
+    return len(entries)
+
+
+def evaluate_alarm(alarm_value, doc, previous_doc, now_utc, state_key=None, state=None):
+    """
+    Run the alarm state machine for the latest (and previous) telemetry document of one unit.
+    Shared by the timer poll and the change stream watcher. `state` is the unit's state as
+    loaded from the store this tick; it is loaded here when not given.
+    """
+    state_key = state_key or ALARM_STATE_KEY
+    if state is None:
+        state = load_alarm_states([state_key])[state_key]
+    with _alarm_eval_lock:
+        _evaluate_alarm_locked(alarm_value, doc, previous_doc, now_utc, state_key, dict(state))
+
+
+def _evaluate_alarm_locked(alarm_value, doc, previous_doc, now_utc, state_key, state):
+    """State machine body; caller must hold _alarm_eval_lock."""
+    policy = get_call_policy(state_key)
+    doc_id = str(doc.get("_id", "unknown"))
+    
+    # Parse and format timestamp for logging (using timestamp field or _id fallback)
+    timestamp_str = "N/A"
+    timestamp = get_document_time(doc)
+    if timestamp:
+        # Normalize to naive for consistent arithmetic
+        if getattr(timestamp, "tzinfo", None) is not None:
+            timestamp = timestamp.replace(tzinfo=None)
+        timestamp_str = timestamp.strftime("%Y-%m-%d %H:%M:%S")
+
+    # Compute age of latest message relative to now (per-run age) — use now_utc so age is positive
+    age_seconds = None
+    if timestamp:
+        age_seconds = (now_utc - timestamp).total_seconds()
+        logging.info(f"Age of latest message (seconds) = {int(age_seconds)}")
+
+    # Calculate and log time since last message if previous document exists
+    if previous_doc:
+        prev_timestamp = get_document_time(previous_doc)
+        if timestamp and prev_timestamp:
+            if getattr(prev_timestamp, "tzinfo", None) is not None:
+                prev_timestamp = prev_timestamp.replace(tzinfo=None)
+            time_since_last_message = (timestamp - prev_timestamp).total_seconds()
+            if time_since_last_message >= 0:
+                logging.info(f"Time since last message (seconds) = {int(time_since_last_message)}")
+    
+    # Log timestamp and alarm status (visible in log stream)
+    call_service_value = doc.get(CALL_SERVICE_FIELD, 0)
+    logging.info(f"Timestamp last occurrence: {timestamp_str}. Alarm signal: {alarm_value}, CallService: {call_service_value}")
+
+    # Log VolumeTreated field for visibility
+    volume_treated_value = doc.get(VOLUME_TREATED_FIELD)
+    logging.info(f"Volume treated ({VOLUME_TREATED_FIELD}) = {volume_treated_value}")
+
+    # Determine if alarm is active (normal), or forced active (signal-loss) with a bounded window.
+    # Optional compatibility mode: allow CallOperator-only alarms when CallService is missing/0.
+    is_alarm_active_normal = (alarm_value == 1 and call_service_value == 1)
+    if not is_alarm_active_normal and ALLOW_ALARM_WITHOUT_CALL_SERVICE and alarm_value == 1:
+        logging.warning(
+            "⚠️  CallService bypass active (ALLOW_ALARM_WITHOUT_CALL_SERVICE=true). "
+            f"Treating alarm as active with {ALARM_FIELD}=1 and {CALL_SERVICE_FIELD}={call_service_value}."
         )
+        is_alarm_active_normal = True
+    is_alarm_active_forced = False
+    if age_seconds is not None and age_seconds > policy["signal_loss_seconds"] and call_service_value == 1:
+        is_alarm_active_forced = True
 
-        # Maintain forced window bookkeeping.
-        if is_alarm_active_forced and not state.get("forced_mode", False):
-            state["forced_mode"] = True
-            state["forced_since_utc"] = now_utc
-        if not is_alarm_active_forced:
-            state["forced_mode"] = False
-            state["forced_since_utc"] = None
+    # Stable per-unit key (not doc_id): ALARM_STATE_KEY, or alarm:<unit id> in multi-unit mode.
+    # Transitions and call attempts go through compare_and_set so several instances sharing
+    # the store agree on them; the forced window and call outcome are write-behind.
+    store = get_state_store()
+    forced_before = (state.get("forced_mode"), state.get("forced_since_utc"))
 
-        # Apply maximum forced window.
-        if state.get("forced_mode") and state.get("forced_since_utc") is not None:
-            forced_age = (now_utc - state["forced_since_utc"]).total_seconds()
-            if forced_age > MAX_FORCED_WINDOW_SECONDS:
-                logging.warning(
-                    "⚠️  Forced alarm window exceeded; ignoring signal-loss forcing "
-                    f"(forced_age={int(forced_age)}s, max={MAX_FORCED_WINDOW_SECONDS}s)"
-                )
-                is_alarm_active_forced = False
-                state["forced_mode"] = False
-                state["forced_since_utc"] = None
+    # Maintain forced window bookkeeping.
+    if is_alarm_active_forced and not state.get("forced_mode", False):
+        state["forced_mode"] = True
+        state["forced_since_utc"] = now_utc
+    if not is_alarm_active_forced:
+        state["forced_mode"] = False
+        state["forced_since_utc"] = None
 
-        is_alarm_active_now = is_alarm_active_normal or is_alarm_active_forced
-        if is_alarm_active_forced:
+    # Apply maximum forced window.
+    if state.get("forced_mode") and state.get("forced_since_utc") is not None:
+        forced_age = (now_utc - state["forced_since_utc"]).total_seconds()
+        if forced_age > policy["max_forced_window_seconds"]:
             logging.warning(
-                f"⚠️  Alarm forced due to signal loss: age={int(age_seconds)}s, "
-                f"threshold={SIGNAL_LOSS_SECONDS}s, CallService={call_service_value}"
+                "⚠️  Forced alarm window exceeded; ignoring signal-loss forcing "
+                f"(forced_age={int(forced_age)}s, max={policy['max_forced_window_seconds']}s)"
             )
+            is_alarm_active_forced = False
+            state["forced_mode"] = False
+            state["forced_since_utc"] = None
+
+    if (state.get("forced_mode"), state.get("forced_since_utc")) != forced_before:
+        store.save(state_key, {"forced_mode": state["forced_mode"], "forced_since_utc": state["forced_since_utc"]})
 
-        # Transition handling: CLEAR
-        if not is_alarm_active_now:
-            if state.get("active"):
+    is_alarm_active_now = is_alarm_active_normal or is_alarm_active_forced
+    if is_alarm_active_forced:
+        logging.warning(
+            f"⚠️  Alarm forced due to signal loss: age={int(age_seconds)}s, "
+            f"threshold={policy['signal_loss_seconds']}s, CallService={call_service_value}"
+        )
+
+    # Transition handling: CLEAR
+    if not is_alarm_active_now:
+        if state.get("active"):
+            cleared = store.compare_and_set(
+                state_key,
+                {"active": True, "active_since_utc": state.get("active_since_utc")},
+                {
+                    "active": False,
+                    "active_since_utc": None,
+                    "forced_mode": False,
+                    "forced_since_utc": None,
+                    "attempts": 0,
+                    "last_attempt_utc": None,
+                },
+            )
+            if cleared is not None:
                 logging.info(f"✅ Alarm cleared (state_key={state_key}). {ALARM_FIELD}={alarm_value}")
-                state["active"] = False
-                state["active_since_utc"] = None
-                state["forced_mode"] = False
-                state["forced_since_utc"] = None
-                state["attempts"] = 0
-                state["last_attempt_utc"] = None
+                state = cleared
             else:
-                logging.info(f"Status OK: {ALARM_FIELD} = {alarm_value}")
+                logging.info(f"Alarm already cleared by another instance (state_key={state_key})")
+                state = store.load([state_key])[state_key]
+            cancel_pending_calls(state_key)
+        else:
+            logging.info(f"Status OK: {ALARM_FIELD} = {alarm_value}")
 
-            alarm_runtime_state[state_key] = state
-            return
+        alarm_runtime_state[state_key] = state
+        return
 
-        # Transition handling: START
-        if not state.get("active"):
+    # Transition handling: START
+    if not state.get("active"):
+        started = store.compare_and_set(
+            state_key,
+            {"active": False},
+            {"active": True, "active_since_utc": now_utc, "attempts": 0, "last_attempt_utc": None},
+        )
+        if started is not None:
             logging.warning(f"⚠️  ALARM ACTIVE (state_key={state_key}). {ALARM_FIELD}={alarm_value}")
-            state["active"] = True
-            state["active_since_utc"] = now_utc
-            state["attempts"] = 0
-            state["last_attempt_utc"] = None
-
-        # Call policy: independent of doc_id.
-        attempts = int(state.get("attempts", 0) or 0)
-        last_attempt_utc = state.get("last_attempt_utc")
-        decision = "WAIT"
-        remaining = None
-
-        if attempts >= MAX_CALL_ATTEMPTS:
-            decision = "STOP"
-        elif attempts == 0:
+            state = started
+        else:
+            # Another instance recorded the start first; continue from its state.
+            state = store.load([state_key])[state_key]
+
+    # Call policy: independent of doc_id.
+    attempts = int(state.get("attempts", 0) or 0)
+    last_attempt_utc = state.get("last_attempt_utc")
+    decision = "WAIT"
+    remaining = None
+
+    if attempts >= policy["max_call_attempts"]:
+        decision = "STOP"
+    elif attempts == 0:
+        decision = "CALL"
+    else:
+        if last_attempt_utc is None:
             decision = "CALL"
         else:
-            if last_attempt_utc is None:
+            elapsed = (now_utc - last_attempt_utc).total_seconds()
+            if elapsed >= policy["call_retry_delay_seconds"]:
                 decision = "CALL"
             else:
-                elapsed = (now_utc - last_attempt_utc).total_seconds()
-                if elapsed >= CALL_RETRY_DELAY_SECONDS:
-                    decision = "CALL"
-                else:
-                    decision = "WAIT"
-                    remaining = int(CALL_RETRY_DELAY_SECONDS - elapsed)
-
-        logging.info(
-            "Decision: active_now=%s forced=%s attempts=%s last_attempt_age_s=%s decision=%s remaining_s=%s doc_id=%s",
-            True,
-            bool(state.get("forced_mode")),
-            attempts,
-            None if last_attempt_utc is None else int((now_utc - last_attempt_utc).total_seconds()),
-            decision,
-            remaining,
-            doc_id,
+                decision = "WAIT"
+                remaining = int(policy["call_retry_delay_seconds"] - elapsed)
+
+    logging.info(
+        "Decision: active_now=%s forced=%s attempts=%s last_attempt_age_s=%s decision=%s remaining_s=%s doc_id=%s",
+        True,
+        bool(state.get("forced_mode")),
+        attempts,
+        None if last_attempt_utc is None else int((now_utc - last_attempt_utc).total_seconds()),
+        decision,
+        remaining,
+        doc_id,
+    )
+
+    if decision == "CALL":
+        attempt_no = attempts + 1
+        # Claim the attempt atomically so only one instance dials for it.
+        claimed = store.compare_and_set(
+            state_key,
+            {"attempts": attempts, "last_attempt_utc": last_attempt_utc},
+            {"attempts": attempt_no, "last_attempt_utc": now_utc},
         )
+        if claimed is None:
+            logging.info(f"[{state_key}] Call attempt {attempt_no} already claimed by another instance")
+            alarm_runtime_state[state_key] = store.load([state_key])[state_key]
+            return
 
-        if decision == "CALL":
-            attempt_no = attempts + 1
-            logging.warning(f"Placing call attempt {attempt_no}/{MAX_CALL_ATTEMPTS}")
-            alarm_message = "Hi Operator, this is the Bawat Container. There is a Safety Alarm. Please attend."
-            call_initiated = make_phone_call(alarm_message)
+        logging.warning(f"[{state_key}] Placing call attempt {attempt_no}/{policy['max_call_attempts']}")
+        alarm_message = "Hi Operator, this is the Bawat Container. There is a Safety Alarm. Please attend."
+        # Placement and playback run in the background; the outcome is logged by the worker.
+        place_call_in_background(alarm_message, state_key)
 
-            state["attempts"] = attempt_no
-            state["last_attempt_utc"] = now_utc
-            alarm_runtime_state[state_key] = state
+        alarm_runtime_state[state_key] = claimed
+        return
 
-            if call_initiated:
-                logging.info("Call initiated (note: create_call != answered; use callbacks for answered detection).")
-            else:
-                logging.error("Call attempt failed to initiate (will retry if policy allows).")
-            return
+    # WAIT / STOP paths
+    alarm_runtime_state[state_key] = state
+    if decision == "WAIT" and remaining is not None:
+        logging.info(f"Alarm active; waiting {remaining}s before next allowed attempt.")
+    elif decision == "STOP":
+        logging.warning("Alarm active but maximum call attempts reached; no further calls until cleared.")
 
-        # WAIT / STOP paths
-        alarm_runtime_state[state_key] = state
-        if decision == "WAIT" and remaining is not None:
-            logging.info(f"Alarm active; waiting {remaining}s before next allowed attempt.")
-        elif decision == "STOP":
-            logging.warning("Alarm active but maximum call attempts reached; no further calls until cleared.")
+
+def handle_alarm_event(event):
+    """
+    Feed an alarm-start event published by iot_to_cosmos_bridge into the state machine.
+    The event carries the alarm-relevant fields of the ingested document, so no database
+    read is needed; the timer poll stays in place as a safety net.
+    """
+    doc = event.get("doc") or {}
+    if ALARM_FIELD not in doc:
+        logging.warning(f"Ignoring alarm event without {ALARM_FIELD}: {event}")
+        return
+    state_key = unit_state_key(doc)
+    logging.info(f"Alarm event from bridge: state_key={state_key}, {ALARM_FIELD}={doc.get(ALARM_FIELD)}")
+    evaluate_alarm(doc.get(ALARM_FIELD), doc, None, datetime.utcnow(), state_key)
+
+
+# Pre-warm the ACS client when the worker loads this function, off the import path.
+if ACS_PREWARM_ON_START and COMMUNICATION_SERVICE_CONNECTION_STRING:
+    _call_executor.submit(prewarm_call_automation_client)
+
+
+def main(timer: func.TimerRequest) -> None:
+    """
+    Timer trigger function that runs every minute to check for alarms
+    Configure in function.json with schedule: "0 * * * * *" (every minute)
+    Note: Time comparisons use -1 hour adjustment for DB timezone alignment
+    """
+    try:
+        # Adjust time -1 hour for DB comparison (naive UTC)
+        now_utc = datetime.utcnow()
+        current_time_adjusted = now_utc - timedelta(hours=1)
+        logging.info(f"Timer trigger executed at {now_utc} (DB comparison time: {current_time_adjusted})")
+        prefetch_operator_phone_number()
+        
+        # Check for alarm: pushed documents from the change stream when available, else poll.
+        snapshots = None
+        watcher = ensure_change_stream_watcher()
+        if watcher is not None:
+            snapshots = watcher.snapshot()
+        if snapshots is None:
+            snapshots = fetch_alarm_snapshots(now_utc)
+        
+        if not snapshots:
+            logging.info("No data found or error checking CosmosDB")
+            return
+        
+        # One round trip loads the state of every unit evaluated this tick.
+        states = load_alarm_states(snapshots.keys())
+        for state_key, (alarm_value, doc, previous_doc) in snapshots.items():
+            try:
+                evaluate_alarm(alarm_value, doc, previous_doc, now_utc, state_key, states.get(state_key))
+            except Exception as e:
+                logging.error(f"Error evaluating alarm for {state_key}: {e}")
     except Exception as e:
         logging.error(f"Error in monitor_timer_trigger: {e}")
         import traceback
@@ -574,18 +1850,22 @@ def cosmosdb_trigger(documents: func.DocumentList) -> None:
             alarm_value = doc_dict.get(ALARM_FIELD)
             call_service_value = doc_dict.get(CALL_SERVICE_FIELD, 0)
             doc_id = str(doc_dict.get('_id', 'unknown'))
+            # Calls and their outcomes belong to the unit, not to the document that raised them.
+            state_key = unit_state_key(doc_dict)
             
             if alarm_value == 1 and call_service_value == 1:
                 # Check if we already notified for this alarm
-                if last_alarm_state.get(doc_id) != 1:
+                if last_alarm_state.get(state_key) != 1:
                     logging.warning(f"⚠️  ALARM TRIGGERED in new document! {ALARM_FIELD} = 1")
-                    logging.info(f"Document ID: {doc_id}")
+                    logging.info(f"Document ID: {doc_id} (state_key={state_key})")
                     
                     # Make phone call
                     alarm_message = f"ALARM: {ALARM_FIELD} is active. Check system immediately."
-                    make_phone_call(alarm_message)
+                    place_call_in_background(alarm_message, state_key)
                     
-                    last_alarm_state[doc_id] = 1
+                    last_alarm_state[state_key] = 1
+            elif alarm_value != 1:
+                last_alarm_state[state_key] = alarm_value
                     
         except Exception as e:
             logging.error(f"Error processing document: {e}")
@@ -0,0 +1,258 @@
+"""
+Alarm runtime state backends for alarm_monitor_function.
+
+Every backend offers the same three operations:
+- load(state_keys): read the state of several units in one round trip
+- compare_and_set(state_key, expected, updates): atomic transition used for START/CLEAR
+  and for claiming a call attempt, so scaled-out instances never double-dial
+- save(state_key, fields): write-behind for non-contended fields (forced window, call outcome)
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_STATE = {
+    "active": False,
+    "active_since_utc": None,
+    "forced_mode": False,
+    "forced_since_utc": None,
+    "attempts": 0,
+    "last_attempt_utc": None,
+    "last_call_outcome": None,
+    "last_call_outcome_utc": None,
+}
+
+
+def new_state():
+    """Return a fresh default state dictionary."""
+    return dict(DEFAULT_STATE)
+
+
+def _truncate_ms(value):
+    """BSON dates keep millisecond precision; truncate so compare-and-set filters match."""
+    if isinstance(value, datetime):
+        return value.replace(microsecond=(value.microsecond // 1000) * 1000)
+    return value
+
+
+class StateStore:
+    """Base class with the write-behind queue shared by all backends."""
+
+    def __init__(self, flush_interval_seconds=1.0):
+        self.flush_interval_seconds = flush_interval_seconds
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._flusher = None
+
+    def load(self, state_keys):
+        raise NotImplementedError
+
+    def compare_and_set(self, state_key, expected, updates):
+        """Apply updates only if the stored fields equal expected. Returns the new state or None."""
+        raise NotImplementedError
+
+    def _write_many(self, pending):
+        raise NotImplementedError
+
+    def save(self, state_key, fields):
+        """Queue non-contended fields; a background thread writes them within flush_interval_seconds."""
+        with self._pending_lock:
+            self._pending.setdefault(state_key, {}).update(fields)
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_loop, name="alarm-state-flush", daemon=True)
+                self._flusher.start()
+        self._flush_event.set()
+
+    def flush(self):
+        """Write queued fields now."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            self._write_many(pending)
+        except Exception as e:
+            logging.error(f"Alarm state write-behind failed, will retry: {e}")
+            with self._pending_lock:
+                for state_key, fields in pending.items():
+                    merged = dict(fields)
+                    merged.update(self._pending.get(state_key, {}))
+                    self._pending[state_key] = merged
+
+    def _flush_loop(self):
+        while True:
+            self._flush_event.wait()
+            self._flush_event.clear()
+            # Coalesce bursts of saves into one write per interval.
+            time.sleep(self.flush_interval_seconds)
+            self.flush()
+
+
+class MemoryStateStore(StateStore):
+    """Per-process store (previous behaviour); atomic only within one worker."""
+
+    def __init__(self, states=None, flush_interval_seconds=0.0):
+        super().__init__(flush_interval_seconds)
+        self.states = states if states is not None else {}
+        self._lock = threading.Lock()
+
+    def load(self, state_keys):
+        with self._lock:
+            return {key: dict(self.states.get(key) or new_state()) for key in state_keys}
+
+    def compare_and_set(self, state_key, expected, updates):
+        with self._lock:
+            state = self.states.get(state_key) or new_state()
+            if any(state.get(field) != value for field, value in expected.items()):
+                return None
+            state = {**state, **updates}
+            self.states[state_key] = state
+            return dict(state)
+
+    def save(self, state_key, fields):
+        with self._lock:
+            state = self.states.get(state_key) or new_state()
+            state.update(fields)
+            self.states[state_key] = state
+
+    def _write_many(self, pending):
+        for state_key, fields in pending.items():
+            self.save(state_key, fields)
+
+
+class MongoStateStore(StateStore):
+    """State documents in a Mongo collection, one per state key (`_id`)."""
+
+    def __init__(self, get_collection, flush_interval_seconds=1.0):
+        super().__init__(flush_interval_seconds)
+        self.get_collection = get_collection
+
+    @staticmethod
+    def _from_doc(doc):
+        state = new_state()
+        if doc:
+            state.update({k: v for k, v in doc.items() if k != "_id"})
+        return state
+
+    def load(self, state_keys):
+        keys = list(state_keys)
+        found = {doc["_id"]: doc for doc in self.get_collection().find({"_id": {"$in": keys}})}
+        return {key: self._from_doc(found.get(key)) for key in keys}
+
+    def compare_and_set(self, state_key, expected, updates):
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+
+        collection = self.get_collection()
+        expected = {k: _truncate_ms(v) for k, v in expected.items()}
+        updates = {k: _truncate_ms(v) for k, v in updates.items()}
+        doc = collection.find_one_and_update(
+            {"_id": state_key, **expected},
+            {"$set": updates},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is not None:
+            return self._from_doc(doc)
+
+        # No stored document yet: it counts as the default state.
+        if all(DEFAULT_STATE.get(k) == v for k, v in expected.items()):
+            state = {**new_state(), **updates}
+            try:
+                collection.insert_one({"_id": state_key, **state})
+                return state
+            except DuplicateKeyError:
+                return None
+        return None
+
+    def _write_many(self, pending):
+        from pymongo import UpdateOne
+
+        requests = []
+        for state_key, fields in pending.items():
+            fields = {k: _truncate_ms(v) for k, v in fields.items()}
+            defaults = {k: v for k, v in DEFAULT_STATE.items() if k not in fields}
+            requests.append(UpdateOne(
+                {"_id": state_key},
+                {"$set": fields, "$setOnInsert": defaults},
+                upsert=True,
+            ))
+        if requests:
+            self.get_collection().bulk_write(requests, ordered=False)
+
+
+class SqliteStateStore(StateStore):
+    """Local file stand-in; BEGIN IMMEDIATE makes compare-and-set atomic across processes."""
+
+    def __init__(self, path, flush_interval_seconds=1.0):
+        super().__init__(flush_interval_seconds)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS alarm_state (state_key TEXT PRIMARY KEY, state TEXT NOT NULL)")
+
+    @staticmethod
+    def _encode(state):
+        return json.dumps({k: v.isoformat() if isinstance(v, datetime) else v for k, v in state.items()})
+
+    @staticmethod
+    def _decode(text):
+        state = new_state()
+        for key, value in json.loads(text).items():
+            if key.endswith("_utc") and isinstance(value, str):
+                value = datetime.fromisoformat(value)
+            state[key] = value
+        return state
+
+    def _read_locked(self, state_key):
+        row = self._conn.execute("SELECT state FROM alarm_state WHERE state_key = ?", (state_key,)).fetchone()
+        return self._decode(row[0]) if row else new_state()
+
+    def _write_locked(self, state_key, state):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO alarm_state (state_key, state) VALUES (?, ?)",
+            (state_key, self._encode(state)),
+        )
+
+    def load(self, state_keys):
+        keys = list(state_keys)
+        with self._lock:
+            placeholders = ",".join("?" for _ in keys)
+            rows = self._conn.execute(
+                f"SELECT state_key, state FROM alarm_state WHERE state_key IN ({placeholders})", keys
+            ).fetchall() if keys else []
+        found = {key: self._decode(text) for key, text in rows}
+        return {key: found.get(key) or new_state() for key in keys}
+
+    def compare_and_set(self, state_key, expected, updates):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                state = self._read_locked(state_key)
+                if any(state.get(field) != value for field, value in expected.items()):
+                    self._conn.execute("ROLLBACK")
+                    return None
+                state.update(updates)
+                self._write_locked(state_key, state)
+                self._conn.execute("COMMIT")
+                return state
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _write_many(self, pending):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for state_key, fields in pending.items():
+                    state = self._read_locked(state_key)
+                    state.update(fields)
+                    self._write_locked(state_key, state)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
@@ -0,0 +1,186 @@
+"""
+Vectorized counterpart of parse_timestamp() for history and export paths.
+
+parse_timestamps(values) classifies a whole array of raw timestamps (FILETIME, ns, µs,
+ms, s) by magnitude in one pass and returns naive datetime64[ns] values, element for
+element equal to parse_timestamp():
+- FILETIME (1.3e17..1.5e17) is UTC, rounded half-even to the microsecond
+- the Unix ranges go through the same float division and the same half-even microsecond
+  rounding as datetime.fromtimestamp(), then get the process' local UTC offset (a no-op
+  on Azure Functions, which run in UTC)
+Values parse_timestamp() returns None for (non-numbers, NaN, negative numbers) become NaT,
+as do values outside the datetime64[ns] range (years 1678-2261).
+
+Requires numpy, listed in requirements-dev.txt with the benchmarks and tests that use this
+module. The function modules do not import it, so the deployed Function App does not need it.
+"""
+
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from . import FILETIME_MAX, FILETIME_MIN
+
+# Integer bounds: Python compares int and float exactly, so ints must not go through float64.
+NANOSECONDS_MIN = 10 ** 15
+MICROSECONDS_MIN = 10 ** 12
+MILLISECONDS_MIN = 10 ** 9
+
+# 1601-01-01 relative to 1970-01-01, in microseconds.
+WINDOWS_TO_UNIX_EPOCH_US = 11_644_473_600_000_000
+NS_PER_US = 1000
+NS_PER_S = 1_000_000_000
+# Seconds representable as datetime64[ns] (with a day of margin for local offsets).
+_MAX_SECONDS = np.iinfo(np.int64).max // NS_PER_S - 86_400
+# UTC offsets change at multiples of 15 minutes, so one lookup per bucket is exact.
+_OFFSET_BUCKET_SECONDS = 900
+_NAT = np.iinfo(np.int64).min
+# Range boundaries below FILETIME, in order: > 1e9 ms, > 1e12 µs, > 1e15 ns (else seconds).
+_INT_THRESHOLDS = (MILLISECONDS_MIN, MICROSECONDS_MIN, NANOSECONDS_MIN)
+_FLOAT_THRESHOLDS = (1e9, 1e12, 1e15)
+_DIVISORS = np.array([1.0, 1e3, 1e6, 1e9])
+_MICROS_PER_UNIT = np.array([1_000_000, 1_000, 1, 0], dtype=np.int64)
+
+
+def _round_half_even_div10(values):
+    """Integer division by 10 rounded half-even (timedelta's rounding), for int64 arrays."""
+    micros = values // 10
+    rest = values - micros * 10
+    micros += (rest > 5) | ((rest == 5) & ((micros & 1) == 1))
+    return micros
+
+
+def _total_microseconds(seconds):
+    """
+    Float seconds -> integer microseconds exactly as datetime.fromtimestamp() rounds them:
+    the modf fraction is rounded half-even to the microsecond and added to the whole part.
+    """
+    whole = seconds.astype(np.int64)  # seconds are non-negative here, so this is modf's whole part
+    fraction = seconds - whole  # exact in floating point
+    fraction *= 1e6
+    np.rint(fraction, out=fraction)
+    whole *= 1_000_000
+    whole += fraction.astype(np.int64)
+    return whole
+
+
+def _float_seconds_to_micros(seconds, valid):
+    """(microseconds, valid) for float Unix seconds; NaN, negative and out-of-range ones are invalid."""
+    valid = valid & (seconds >= 0) & (seconds < _MAX_SECONDS)
+    return _total_microseconds(seconds if valid.all() else np.where(valid, seconds, 0.0)), valid
+
+
+def _local_offsets(whole_seconds):
+    """Local UTC offset in seconds for each Unix second."""
+    buckets = whole_seconds // _OFFSET_BUCKET_SECONDS
+    unique, inverse = np.unique(buckets, return_inverse=True)
+    offsets = np.empty(len(unique), dtype=np.int64)
+    for i, bucket in enumerate(unique.tolist()):
+        instant = bucket * _OFFSET_BUCKET_SECONDS
+        utc = datetime.fromtimestamp(instant, timezone.utc).replace(tzinfo=None)
+        offsets[i] = (datetime.fromtimestamp(instant) - utc).total_seconds()
+    return offsets[inverse.reshape(-1)]
+
+
+def _convert(values, out, index, is_int):
+    """
+    Convert one int64 or float64 array with the same magnitude ranges as parse_timestamp().
+    Mixed-format arrays convert every Unix range in one pass with a per-element multiplier,
+    which is much faster than gathering and scattering every range separately. Only FILETIMEs
+    and integer nanoseconds (which need the scalar code's float rounding) are gathered.
+    """
+    if is_int:
+        thresholds, filetime_min, filetime_max = _INT_THRESHOLDS, FILETIME_MIN, FILETIME_MAX
+    else:
+        thresholds, filetime_min, filetime_max = _FLOAT_THRESHOLDS, 1.3e17, 1.5e17
+    filetime = (values >= filetime_min) & (values <= filetime_max)
+    any_filetime = filetime.any()
+    all_filetime = any_filetime and filetime.all()
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        converted = None
+        if any_filetime:
+            picked_filetime = None if all_filetime else np.flatnonzero(filetime)
+            raw = values if all_filetime else values[picked_filetime]
+            filetime_us = _round_half_even_div10(raw) if is_int else np.round(raw / 10).astype(np.int64)
+            converted = (filetime_us - WINDOWS_TO_UNIX_EPOCH_US) * NS_PER_US
+        if not all_filetime:
+            # Seconds/ms/µs/ns by the number of thresholds below the value; same float division
+            # as the scalar code (int operands are converted to float64 first).
+            above = (values > thresholds[0]).view(np.int8) + (values > thresholds[1]).view(np.int8)
+            above += (values > thresholds[2]).view(np.int8)
+            if is_int:
+                # Integer s/ms/µs never exceed 1e9 seconds, where the float division is off by
+                # less than 0.2 µs, so fromtimestamp() lands exactly on the integer result.
+                # Only nanoseconds need the float path, and only those elements take it.
+                nanos = above == 3
+                valid = values >= 0
+                if any_filetime:
+                    nanos &= ~filetime
+                    valid &= ~filetime
+                if nanos.all():
+                    micros, valid = _float_seconds_to_micros(values / 1e9, valid)
+                else:
+                    micros = values * _MICROS_PER_UNIT[above]
+                    if nanos.any():
+                        picked = np.flatnonzero(nanos)
+                        micros[picked], valid[picked] = _float_seconds_to_micros(values[picked] / 1e9, valid[picked])
+            else:
+                # A single-unit column (the usual case) divides by a scalar instead of gathering.
+                lowest = above.min()
+                divisor = _DIVISORS[lowest] if lowest == above.max() else _DIVISORS[above]
+                valid = ~filetime if any_filetime else np.ones(len(values), dtype=bool)
+                micros, valid = _float_seconds_to_micros(values / divisor, valid)
+            offsets = None
+            if not (time.timezone == 0 and not time.daylight):
+                offsets = _local_offsets(np.where(valid, micros, 0) // 1_000_000) * NS_PER_S
+            unix_ns = micros
+            unix_ns *= NS_PER_US
+            if offsets is not None:
+                unix_ns += offsets
+            if not valid.all():
+                unix_ns = np.where(valid, unix_ns, _NAT)
+            if converted is not None:
+                unix_ns[picked_filetime] = converted
+            converted = unix_ns
+
+    if index is None:
+        out[:] = converted
+    else:
+        out[index] = converted
+
+
+def parse_timestamps(values):
+    """
+    Convert an array-like of raw timestamps into a datetime64[ns] array in one pass.
+    Accepts int, float, bool or object arrays (mixed types, None); see the module docstring
+    for the exact semantics.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]")
+    out = np.full(values.shape, _NAT, dtype=np.int64)
+    flat_values = values.reshape(-1)
+    flat_out = out.reshape(-1)
+
+    kind = values.dtype.kind
+    if kind in "ib":
+        _convert(flat_values.astype(np.int64, copy=False), flat_out, None, is_int=True)
+    elif kind == "u":
+        # uint64 values above the int64 range are nanoseconds past datetime64[ns]: NaT.
+        keep = np.flatnonzero(flat_values <= np.iinfo(np.int64).max)
+        _convert(flat_values[keep].astype(np.int64), flat_out, keep, is_int=True)
+    elif kind == "f":
+        _convert(flat_values.astype(np.float64), flat_out, None, is_int=False)
+    elif kind == "O":
+        # Mixed Python objects: classify by type first, then convert each group vectorized.
+        ints = np.flatnonzero([
+            isinstance(v, (int, np.integer)) and abs(int(v)) <= np.iinfo(np.int64).max for v in flat_values
+        ])
+        floats = np.flatnonzero([isinstance(v, (float, np.floating)) for v in flat_values])
+        if ints.size:
+            _convert(flat_values[ints].astype(np.int64), flat_out, ints, is_int=True)
+        if floats.size:
+            _convert(flat_values[floats].astype(np.float64), flat_out, floats, is_int=False)
+    return out.view("datetime64[ns]")
@@ -0,0 +1,147 @@
+"""
+Backfill the canonical UTC timestamp (ts_utc_ns) on telemetry written before
+iot_to_cosmos_bridge started stamping it.
+
+Documents without the field are streamed in batches and updated with unordered bulk
+writes, using the same conversion as the bridge. The tool can be stopped and started
+again at any time: it only ever selects documents that still lack the field, and each
+update is conditional on that, so a rerun never rewrites a value. Throttled writes
+(Cosmos 429) are retried with the bridge's backoff, and --max-rate keeps the RU usage
+of a large backfill bounded.
+
+Usage:
+  python backfill_canonical_timestamp.py --dry-run
+  python backfill_canonical_timestamp.py --batch-size 500 --max-rate 1000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from iot_to_cosmos_bridge import (  # noqa: E402
+    CANONICAL_TS_FIELD,
+    RETRYABLE_WRITE_CODES,
+    _backoff_ms,
+    _canonical_ts_ns,
+)
+
+SOURCE_FIELDS = {"timestamp": 1, "_timestamp": 1, "_ts": 1}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=f"Backfill {CANONICAL_TS_FIELD} on existing telemetry documents")
+    parser.add_argument("--connection-string", default=None, help="defaults to mongodb_connection_string in local_data.json")
+    parser.add_argument("--database", default=None, help="defaults to cosmos_database in local_data.json")
+    parser.add_argument("--collection", default=None, help="defaults to cosmos_collection in local_data.json")
+    parser.add_argument("--batch-size", type=int, default=500, help="documents per bulk write")
+    parser.add_argument("--max-rate", type=float, default=0, help="maximum documents per second (0 = unlimited)")
+    parser.add_argument("--max-retries", type=int, default=8, help="retries of throttled writes per batch")
+    parser.add_argument("--dry-run", action="store_true", help="count what would be updated without writing")
+    return parser.parse_args()
+
+
+def load_config():
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_data.json")
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path, 'r') as f:
+        return json.load(f)
+
+
+def write_batch(collection, requests, max_retries):
+    """Unordered bulk write, re-sending only the throttled/transient failures. Returns (modified, failed)."""
+    modified = failed = 0
+    for attempt in range(max_retries + 1):
+        try:
+            result = collection.bulk_write(requests, ordered=False)
+            return modified + result.modified_count, failed
+        except BulkWriteError as e:
+            modified += e.details.get("nModified", 0)
+            retry = []
+            for err in e.details.get("writeErrors", []):
+                if err.get("code") in RETRYABLE_WRITE_CODES:
+                    retry.append(err)
+                else:
+                    failed += 1
+                    print(f"❌ Update failed (code {err.get('code')}): {err.get('errmsg')}")
+            if not retry:
+                return modified, failed
+            requests = [requests[err["index"]] for err in retry]
+            if attempt < max_retries:
+                time.sleep(_backoff_ms(attempt, retry) / 1000)
+    return modified, failed + len(requests)
+
+
+def main():
+    args = parse_args()
+    config = load_config()
+    connection_string = args.connection_string or config.get("mongodb_connection_string")
+    database = args.database or config.get("cosmos_database", "IoTDatabase")
+    collection_name = args.collection or config.get("cosmos_collection", "iotmessages")
+    if not connection_string:
+        print("❌ No connection string: pass --connection-string or fill in local_data.json")
+        return 1
+
+    client = MongoClient(connection_string, retryWrites=False)
+    collection = client[database][collection_name]
+    missing = {CANONICAL_TS_FIELD: {"$exists": False}}
+
+    print("=" * 80)
+    print(f"Backfill {CANONICAL_TS_FIELD}: {database}.{collection_name}{' (dry run)' if args.dry_run else ''}")
+    print("=" * 80)
+
+    scanned = updated = unconvertible = failed = 0
+    started = time.perf_counter()
+    batch = []
+
+    def flush():
+        nonlocal updated, failed
+        if batch and not args.dry_run:
+            modified, batch_failed = write_batch(collection, batch, args.max_retries)
+            updated += modified
+            failed += batch_failed
+        elif batch:
+            updated += len(batch)
+        batch.clear()
+        if args.max_rate > 0:
+            # Sleep until the average rate is back under the limit.
+            ahead = scanned / args.max_rate - (time.perf_counter() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+        elapsed = time.perf_counter() - started
+        print(f"   {scanned} scanned, {updated} updated, {unconvertible} without a timestamp, "
+              f"{failed} failed ({scanned / elapsed if elapsed > 0 else 0:.0f} docs/s)", end="\r")
+
+    cursor = collection.find(missing, SOURCE_FIELDS, no_cursor_timeout=True).batch_size(args.batch_size)
+    try:
+        for doc in cursor:
+            scanned += 1
+            value = _canonical_ts_ns(doc)
+            if value is None:
+                unconvertible += 1
+                continue
+            batch.append(UpdateOne({"_id": doc["_id"], **missing}, {"$set": {CANONICAL_TS_FIELD: value}}))
+            if len(batch) >= args.batch_size:
+                flush()
+        flush()
+    except KeyboardInterrupt:
+        print("\n⚠️  Interrupted; rerun to continue where this run stopped")
+    finally:
+        cursor.close()
+
+    print()
+    if not args.dry_run:
+        collection.create_index([(CANONICAL_TS_FIELD, 1)], name=f"{CANONICAL_TS_FIELD}_1")
+    print(f"✅ Done: {updated} document(s) {'would be ' if args.dry_run else ''}updated in "
+          f"{time.perf_counter() - started:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,507 @@
+"""
+Replay benchmark for the alarm pipeline: IoT Hub bridge -> Mongo -> alarm monitor -> ACS.
+
+Synthetic telemetry is pushed through iot_to_cosmos_bridge.main() into an in-memory
+collection (mongomock) or a local mongod (--mongodb-uri), then alarm_monitor_function
+detects the alarm and dials through a fake CallAutomationClient. For every alarm the
+script measures the time from "alarm bit set" (the event entering the bridge) to
+"create_call issued", and writes a JSON report that can be compared between changes.
+
+Modes:
+  timer   the monitor tick (alarm_monitor_function.main) runs right after each ingest
+  inline  BRIDGE_ALARM_EVAL: the bridge hands the alarm start to the monitor in-process
+
+Usage:
+  python benchmark_alarm_pipeline.py --alarms 200 --units 1 --mode timer
+  python benchmark_alarm_pipeline.py --mode inline --units 20 --noise 50 --report bench.json
+  python benchmark_alarm_pipeline.py --mongodb-uri mongodb://localhost:27017
+  python benchmark_alarm_pipeline.py --redeliver 3   # every batch delivered 3 more times
+  python benchmark_alarm_pipeline.py --mongodb-uri mongodb://localhost:27017 --preload 1000000 --alarms 20 --tags 40
+
+Before the replay, the latest-alarm lookup is timed --query-ticks times on the preloaded
+collection with the alarm projection and with full documents. The report records latency,
+bytes returned per tick, the winning plan and (on Cosmos) the request charge.
+
+After the replay, --acs-dials calls go through make_phone_call() twice: with a new
+CallAutomationClient per call (cold: SDK client construction plus a simulated DNS/TLS
+setup of --acs-setup-ms) and with one shared, pre-warmed client (warm: --acs-rtt-ms only).
+The report compares detection to create_call return for both.
+
+With --redeliver the run also checks that replayed Event Hub batches store no second copies
+(every stored document has its own event timestamp), and exits non-zero if they do.
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+# Collection methods counted as one request each (the RU-equivalent of the run).
+COUNTED_OPS = {
+    "find", "find_one", "aggregate", "insert_one", "insert_many", "update_one", "update_many",
+    "replace_one", "bulk_write", "find_one_and_update", "delete_one", "delete_many",
+    "count_documents", "list_indexes", "create_index", "watch",
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay telemetry through the alarm pipeline and time detection-to-dial")
+    parser.add_argument("--alarms", type=int, default=200, help="number of alarm on/off cycles to replay")
+    parser.add_argument("--units", type=int, default=1, help="number of units; >1 enables MULTI_UNIT_MONITORING")
+    parser.add_argument("--mode", choices=("timer", "inline"), default="timer")
+    parser.add_argument("--noise", type=int, default=10, help="non-alarm telemetry events sent with every alarm")
+    parser.add_argument("--preload", type=int, default=1000, help="telemetry documents written before timing starts")
+    parser.add_argument("--mongodb-uri", default=None, help="use a local mongod instead of the in-memory fake")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for a call before counting a miss")
+    parser.add_argument("--report", default="benchmark_report.json", help="path of the JSON report")
+    parser.add_argument("--redeliver", type=int, default=0, help="deliver every bridge batch this many extra times")
+    parser.add_argument("--tags", type=int, default=0, help="extra OPC-UA tags in every payload's `v` list")
+    parser.add_argument("--query-ticks", type=int, default=20,
+                        help="latest-alarm lookups timed after the preload, with and without the projection (0 skips)")
+    parser.add_argument("--acs-dials", type=int, default=10,
+                        help="calls timed from detection to create_call return, cold and warm client (0 skips)")
+    parser.add_argument("--acs-setup-ms", type=float, default=150.0,
+                        help="simulated DNS lookup + TLS handshake paid by the first request of a new client")
+    parser.add_argument("--acs-rtt-ms", type=float, default=40.0, help="simulated create_call round trip")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own logging")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """Environment read by the function modules at import time. Existing values win."""
+    os.environ.setdefault("MongoDBConnectionString", args.mongodb_uri or "mongodb://benchmark.invalid:27017")
+    os.environ.setdefault("COSMOS_DATABASE", "AlarmBenchmark")
+    os.environ.setdefault("COMMUNICATION_SERVICE_CONNECTION_STRING", "endpoint=https://benchmark.invalid/;accesskey=YmVuY2g=")
+    os.environ.setdefault("COMMUNICATION_SERVICE_PHONE_NUMBER", "+10000000000")
+    os.environ.setdefault("CALLBACK_URL", "https://benchmark.invalid/api/callbacks")
+    os.environ.setdefault("ACS_PREWARM_ON_START", "false")
+    if not args.mongodb_uri:
+        # mongomock is not thread-safe: keep PARTITION_BY_UNIT reads on the calling thread.
+        os.environ.setdefault("PARTITION_QUERY_THREADS", "1")
+    os.environ.setdefault("MULTI_UNIT_MONITORING", "true" if args.units > 1 else "false")
+    os.environ["BRIDGE_ALARM_EVAL"] = "true" if args.mode == "inline" else "false"
+
+
+class CountingCollection:
+    """Collection wrapper counting database requests per method name."""
+
+    def __init__(self, collection, counts):
+        self._collection = collection
+        self._counts = counts
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in COUNTED_OPS or not callable(attr):
+            return attr
+
+        def counted(*args, **kwargs):
+            self._counts[name] += 1
+            return attr(*args, **kwargs)
+
+        return counted
+
+
+class CountingDatabase:
+    def __init__(self, database, counts):
+        self._database = database
+        self._counts = counts
+
+    def __getitem__(self, name):
+        return CountingCollection(self._database[name], self._counts)
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+
+class CountingClient:
+    def __init__(self, client, counts):
+        self._client = client
+        self._counts = counts
+
+    def __getitem__(self, name):
+        return CountingDatabase(self._client[name], self._counts)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class FakeCallConnection:
+    def __init__(self, call_connection_id):
+        self.call_connection_id = call_connection_id
+        self.server_call_id = None
+
+
+class FakeCallAutomationClient:
+    """Records when create_call is issued for each alarm state key."""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+        self._waiters = {}
+
+    def expect(self, state_key):
+        event = threading.Event()
+        with self._lock:
+            self._waiters[state_key] = {"event": event, "issued_at": None}
+        return event
+
+    def issued_at(self, state_key):
+        with self._lock:
+            return self._waiters.get(state_key, {}).get("issued_at")
+
+    def create_call(self, target_participant=None, callback_url=None, source_caller_id_number=None,
+                    operation_context=None, **kwargs):
+        issued_at = time.perf_counter()
+        with self._lock:
+            self.calls.append(operation_context)
+            waiter = self._waiters.get(operation_context)
+            if waiter is not None and waiter["issued_at"] is None:
+                waiter["issued_at"] = issued_at
+                waiter["event"].set()
+            return FakeCallConnection(f"bench-call-{len(self.calls)}")
+
+    def get_call_connection(self, call_connection_id):
+        return FakeCallConnection(call_connection_id)
+
+
+class SimulatedAcsClient(FakeCallAutomationClient):
+    """
+    Fake client with network costs: the first request of a client pays setup_ms (its connection
+    is not open yet) and every create_call pays rtt_ms. prewarm() opens the connection ahead of
+    time, like prewarm_call_automation_client().
+    """
+
+    def __init__(self, setup_ms, rtt_ms):
+        super().__init__()
+        self.setup_ms = setup_ms
+        self.rtt_ms = rtt_ms
+        self.connected = False
+        self.returned_at = None
+
+    def prewarm(self):
+        time.sleep(self.setup_ms / 1000.0)
+        self.connected = True
+
+    def create_call(self, *args, **kwargs):
+        if not self.connected:
+            self.prewarm()
+        time.sleep(self.rtt_ms / 1000.0)
+        call_connection = super().create_call(*args, **kwargs)
+        self.returned_at = time.perf_counter()
+        return call_connection
+
+
+class FakeEvent:
+    """Stand-in for func.EventHubEvent as delivered by the IoT Hub built-in endpoint."""
+
+    def __init__(self, body, device_id, sequence_number):
+        self._body = json.dumps(body).encode("utf-8")
+        self.iothub_metadata = {"connection-device-id": device_id}
+        self.sequence_number = sequence_number
+        self.offset = str(sequence_number * 512)
+        self.metadata = {"PartitionContext": {"PartitionId": "0"}}
+
+    def get_body(self):
+        return self._body
+
+
+class Telemetry:
+    """Secomea-shaped payloads (fields nested in a `v` list) with strictly increasing FILETIMEs."""
+
+    def __init__(self, fields, start_filetime, tags=0):
+        self.alarm_field, self.call_service_field, self.volume_field = fields
+        self.filetime = start_filetime
+        self.sequence_number = 0
+        self.tags = tags
+
+    def event(self, device_id, alarm, volume):
+        # One microsecond apart, so "latest" is never a tie even within a single batch.
+        self.filetime += 10
+        self.sequence_number += 1
+        body = {
+            "_timestamp": self.filetime,
+            "v": [{self.alarm_field: alarm, self.call_service_field: 1}, {self.volume_field: volume}],
+        }
+        body["v"] += [{f"Test2OPCUA:Tag{i}": volume * 0.5 + i} for i in range(self.tags)]
+        return FakeEvent(body, device_id, self.sequence_number)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def latency_summary(values):
+    if not values:
+        return None
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+def winning_plan(explain):
+    """Stage chain of the winning plan, e.g. "LIMIT > PROJECTION_SIMPLE > FETCH > IXSCAN", if reported."""
+    plan = (explain or {}).get("queryPlanner", {}).get("winningPlan")
+    stages = []
+    while isinstance(plan, dict) and plan.get("stage"):
+        stages.append(plan["stage"])
+        plan = plan.get("inputStage")
+    return " > ".join(stages) or None
+
+
+def measure_latest_alarm_query(monitor, ticks):
+    """
+    Time check_alarm_in_cosmosdb() with the alarm projection and with full documents
+    (ALARM_DEBUG_FULL_DOCUMENT), and measure the BSON bytes it returns per tick.
+    """
+    import bson
+
+    results = {}
+    full_document = monitor.ALARM_DEBUG_FULL_DOCUMENT
+    try:
+        for name, full in (("projection", False), ("full_document", True)):
+            monitor.ALARM_DEBUG_FULL_DOCUMENT = full
+            latencies = []
+            returned = 0
+            for _ in range(ticks):
+                started = time.perf_counter()
+                result = monitor.check_alarm_in_cosmosdb()
+                latencies.append((time.perf_counter() - started) * 1000)
+                returned += sum(len(bson.encode(doc)) for doc in (result or (None,))[1:] if doc)
+            results[name] = {"latency_ms": latency_summary(latencies), "bytes_per_tick": returned / ticks}
+            try:
+                diagnostics = monitor.get_alarm_query_diagnostics()
+                results[name]["plan"] = winning_plan(diagnostics["explain"])
+                results[name]["request_charge"] = diagnostics["request_charge"]
+            except Exception:
+                results[name]["plan"] = None  # explain() not supported by the backend
+    finally:
+        monitor.ALARM_DEBUG_FULL_DOCUMENT = full_document
+    results["sort_key"] = monitor._alarm_sort_key
+    return results
+
+
+def measure_acs_dial(monitor, dials, setup_ms, rtt_ms):
+    """
+    Time make_phone_call() from detection to the create_call return, with a new client per call
+    (cold: what every attempt paid before the shared client) and with one pre-warmed client (warm).
+    """
+    from azure.communication.callautomation import CallAutomationClient
+
+    def cold_client():
+        # The real SDK construction (credential parsing, pipeline) plus a connection that is not open yet.
+        CallAutomationClient.from_connection_string(monitor.COMMUNICATION_SERVICE_CONNECTION_STRING)
+        return SimulatedAcsClient(setup_ms, rtt_ms)
+
+    warm = SimulatedAcsClient(setup_ms, rtt_ms)
+    warm.prewarm()
+    get_client = monitor.get_call_automation_client
+    results = {"setup_ms": setup_ms, "rtt_ms": rtt_ms}
+    try:
+        for name, factory in (("cold", cold_client), ("warm", lambda: warm)):
+            latencies = []
+            clients = []
+
+            def get_call_automation_client(factory=factory):
+                clients.append(factory())
+                return clients[-1]
+
+            monitor.get_call_automation_client = get_call_automation_client
+            for n in range(dials):
+                detected_at = time.perf_counter()
+                if monitor.make_phone_call(state_key=f"acs-dial-{name}-{n}", detected_at=detected_at):
+                    latencies.append((clients[-1].returned_at - detected_at) * 1000)
+            results[name] = latency_summary(latencies)
+    finally:
+        monitor.get_call_automation_client = get_client
+    return results
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL, format="%(levelname)s %(message)s")
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import alarm_monitor_function as monitor
+    import iot_to_cosmos_bridge as bridge
+
+    if args.mongodb_uri:
+        from pymongo import MongoClient
+        backend = "mongod"
+        raw_client = MongoClient(args.mongodb_uri)
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            print("❌ mongomock is not installed; pip install mongomock or pass --mongodb-uri")
+            return 1
+        backend = "mongomock"
+        raw_client = mongomock.MongoClient()
+
+    # Start from an empty benchmark database (never the configured production one by default).
+    raw_client.drop_database(monitor.COSMOS_DATABASE)
+    raw_client[monitor.COSMOS_DATABASE]["Operator"].insert_one(
+        {"Test2OPCUA:Country": "0045", "Test2OPCUA:PhoneNumber": "12345678"}
+    )
+
+    counts = Counter()
+    client = CountingClient(raw_client, counts)
+    acs = FakeCallAutomationClient()
+    monitor.get_mongo_client = lambda: client
+    monitor.get_call_automation_client = lambda: acs
+    bridge._get_collection = lambda: client[bridge.COSMOS_DATABASE][bridge.COSMOS_COLLECTION]
+
+    def deliver(batch):
+        """One bridge invocation, then --redeliver replays of the same batch (a function retry)."""
+        bridge.main(batch)
+        for _ in range(args.redeliver):
+            bridge.main(batch)
+
+    source = Telemetry(
+        (monitor.ALARM_FIELD, monitor.CALL_SERVICE_FIELD, monitor.VOLUME_TREATED_FIELD),
+        bridge._windows_filetime_now(),
+        args.tags,
+    )
+    units = [f"bench-unit-{i:03d}" for i in range(args.units)]
+
+    print("=" * 80)
+    print("Alarm pipeline replay benchmark")
+    print("=" * 80)
+    print(f"Backend: {backend}, mode: {args.mode}, units: {len(units)}, alarms: {args.alarms}, noise/alarm: {args.noise}")
+
+    # Preload history so the monitor queries a non-trivial collection; warm the phone cache.
+    for start in range(0, args.preload, 100):
+        batch = [source.event(units[n % len(units)], 0, n) for n in range(start, min(start + 100, args.preload))]
+        deliver(batch)
+    monitor.operator_phone_cache.refresh()
+    if args.mode == "timer":
+        monitor.main(None)
+    latest_alarm_query = measure_latest_alarm_query(monitor, args.query_ticks) if args.query_ticks else None
+    counts.clear()
+
+    latencies = []
+    ingest_ms = []
+    misses = 0
+    docs_sent = 0
+    volume = args.preload
+    started = time.perf_counter()
+
+    for n in range(args.alarms):
+        unit = units[n % len(units)]
+        state_key = monitor.unit_state_key({monitor.UNIT_ID_FIELD: unit})
+        noise = []
+        for i in range(args.noise):
+            volume += 1
+            noise.append(source.event(units[(n + i + 1) % len(units)], 0, volume))
+        if len(units) > 1:
+            deliver(noise)
+            noise = []
+
+        called = acs.expect(state_key)
+        alarm_set_at = time.perf_counter()
+        batch = noise + [source.event(unit, 1, volume)]
+        bridge.main(batch)
+        ingest_ms.append((time.perf_counter() - alarm_set_at) * 1000)
+        if args.mode == "timer":
+            monitor.main(None)
+
+        if called.wait(args.timeout):
+            latencies.append((acs.issued_at(state_key) - alarm_set_at) * 1000)
+        else:
+            misses += 1
+        for _ in range(args.redeliver):
+            bridge.main(batch)
+
+        # Clear the alarm so the next cycle is a fresh START for this unit.
+        deliver([source.event(unit, 0, volume)])
+        monitor.main(None)
+        docs_sent += args.noise + 2
+
+    elapsed = time.perf_counter() - started
+    monitor._call_executor.shutdown(wait=True)
+    acs_dial = measure_acs_dial(monitor, args.acs_dials, args.acs_setup_ms, args.acs_rtt_ms) if args.acs_dials else None
+    telemetry = raw_client[bridge.COSMOS_DATABASE][bridge.COSMOS_COLLECTION]
+    stored = telemetry.count_documents({})
+    unique_stored = len(telemetry.distinct("_timestamp"))
+    events_sent = source.sequence_number
+
+    report = {
+        "generated_utc": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "config": {
+            "backend": backend,
+            "mode": args.mode,
+            "units": len(units),
+            "alarms": args.alarms,
+            "noise_per_alarm": args.noise,
+            "preload": args.preload,
+            "redeliver": args.redeliver,
+            "tags": args.tags,
+            "multi_unit_monitoring": monitor.MULTI_UNIT_MONITORING,
+            "alarm_state_backend": monitor.ALARM_STATE_BACKEND,
+        },
+        "latest_alarm_query": latest_alarm_query,
+        "detection_to_dial_ms": latency_summary(latencies),
+        "acs_dial_ms": acs_dial,
+        "bridge_ingest_ms": latency_summary(ingest_ms),
+        "misses": misses,
+        "calls_issued": len(acs.calls),
+        "elapsed_seconds": elapsed,
+        "throughput": {
+            "alarms_per_second": args.alarms / elapsed if elapsed > 0 else 0.0,
+            "documents_per_second": docs_sent / elapsed if elapsed > 0 else 0.0,
+        },
+        "db_operations": dict(sorted(counts.items())),
+        "db_operations_per_alarm": sum(counts.values()) / args.alarms if args.alarms else 0.0,
+        "events_sent": events_sent,
+        "documents_stored": stored,
+        "unique_events_stored": unique_stored,
+    }
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+
+    summary = report["detection_to_dial_ms"] or {}
+    print(f"Detection to dial (ms): p50={summary.get('p50', 0):.2f} p95={summary.get('p95', 0):.2f} "
+          f"p99={summary.get('p99', 0):.2f} max={summary.get('max', 0):.2f}")
+    print(f"Throughput: {report['throughput']['alarms_per_second']:.1f} alarms/s, "
+          f"{report['throughput']['documents_per_second']:.1f} docs/s")
+    print(f"DB operations: {sum(counts.values())} ({report['db_operations_per_alarm']:.1f} per alarm)")
+    if latest_alarm_query:
+        for name in ("projection", "full_document"):
+            query = latest_alarm_query[name]
+            print(f"Latest-alarm query ({name}, {args.preload} docs, sort by {latest_alarm_query['sort_key']}): p50={query['latency_ms']['p50']:.2f} ms "
+                  f"p95={query['latency_ms']['p95']:.2f} ms, {query['bytes_per_tick']:.0f} bytes/tick, "
+                  f"plan: {query['plan'] or 'n/a'}")
+    if acs_dial and acs_dial["cold"] and acs_dial["warm"]:
+        print(f"Detection to create_call return (ms, {args.acs_setup_ms:.0f} ms setup, {args.acs_rtt_ms:.0f} ms RTT): "
+              f"cold p50={acs_dial['cold']['p50']:.1f} p95={acs_dial['cold']['p95']:.1f}, "
+              f"warm p50={acs_dial['warm']['p50']:.1f} p95={acs_dial['warm']['p95']:.1f}")
+    if misses:
+        print(f"⚠️  {misses} alarm(s) did not produce a call within {args.timeout:.0f}s")
+    # Events may be filtered out (BRIDGE_CHANGE_FILTER), but none may be stored twice.
+    duplicated = stored != unique_stored
+    if args.redeliver:
+        print(f"{'❌' if duplicated else '✅'} Redelivery: {events_sent} event(s) delivered {args.redeliver + 1}x, "
+              f"{stored} document(s) stored")
+    print(f"✅ Report written to {args.report}")
+    return 1 if misses or (args.redeliver and duplicated) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
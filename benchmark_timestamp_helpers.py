@@ -0,0 +1,322 @@
+"""
+Micro-benchmarks for the per-document helpers: parse_timestamp, get_document_time and
+_flatten_v_entries, plus the vectorized parse_timestamps batch conversion (needs numpy).
+
+Each helper is timed on realistic Secomea gateway payloads (FILETIME `_timestamp`, Unix
+`timestamp` in s/ms/µs/ns, string and ObjectId `_id`, `v` lists of different lengths)
+next to the previous implementation, and its results are checked before timing:
+FILETIMEs against exact integer arithmetic, everything else against the previous code.
+Every run is appended as one JSON line to the history file so results can be compared
+over time.
+
+Usage:
+  python benchmark_timestamp_helpers.py
+  python benchmark_timestamp_helpers.py --number 20000 --history bench_history.jsonl
+  python -m pytest tests/test_benchmark_timestamp_helpers.py   # same cases via pytest-benchmark
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time the per-document timestamp and payload helpers")
+    parser.add_argument("--number", type=int, default=20000, help="calls per measurement")
+    parser.add_argument("--repeat", type=int, default=7, help="measurements per case (best is reported)")
+    parser.add_argument("--batch-size", type=int, default=1_000_000, help="values in the batch conversion case (0 skips it)")
+    parser.add_argument("--history", default="benchmark_history.jsonl", help="JSON lines file results are appended to")
+    return parser.parse_args()
+
+
+# --- Previous implementations, kept here as the baseline ---------------------------------
+
+def legacy_parse_timestamp(timestamp_value):
+    try:
+        if isinstance(timestamp_value, (int, float)):
+            if 1.3e17 <= timestamp_value <= 1.5e17:
+                windows_epoch = datetime(1601, 1, 1)
+                return windows_epoch + timedelta(microseconds=timestamp_value / 10)
+            elif timestamp_value > 1e15:
+                return datetime.fromtimestamp(timestamp_value / 1e9)
+            elif timestamp_value > 1e12:
+                return datetime.fromtimestamp(timestamp_value / 1e6)
+            elif timestamp_value > 1e9:
+                return datetime.fromtimestamp(timestamp_value / 1e3)
+            else:
+                return datetime.fromtimestamp(timestamp_value)
+    except (ValueError, OSError) as e:
+        logging.error(f"Error parsing timestamp {timestamp_value}: {e}")
+    return None
+
+
+def legacy_get_document_time(doc):
+    if not doc:
+        return None
+    if "timestamp" in doc:
+        ts = legacy_parse_timestamp(doc["timestamp"])
+        if ts:
+            return ts
+    if "_timestamp" in doc:
+        ts = legacy_parse_timestamp(doc["_timestamp"])
+        if ts:
+            return ts
+    try:
+        _id = doc.get("_id")
+        if isinstance(_id, ObjectId):
+            return _id.generation_time
+        if isinstance(_id, str):
+            return ObjectId(_id).generation_time
+    except Exception as e:
+        logging.debug(f"Could not derive time from _id: {e}")
+    return None
+
+
+def legacy_flatten_v_entries(doc):
+    entries = doc.get("v")
+    if not isinstance(entries, list):
+        return doc
+    for item in entries:
+        if not isinstance(item, dict):
+            continue
+        for key, value in item.items():
+            doc[key] = value
+    return doc
+
+
+# --- Payloads ----------------------------------------------------------------------------
+
+def exact_filetime(filetime):
+    """Reference conversion: exact rational value rounded half-even, as timedelta does."""
+    micros, rest = divmod(filetime, 10)
+    if rest > 5 or (rest == 5 and micros % 2):
+        micros += 1
+    return datetime(1601, 1, 1) + timedelta(microseconds=micros)
+
+
+def sample_values(rng, now):
+    unix = now.timestamp()
+    filetime = int((now - datetime(1601, 1, 1)).total_seconds() * 10_000_000)
+    return {
+        "filetime": [filetime + rng.randrange(10_000_000_000) for _ in range(200)],
+        "seconds": [int(unix) - rng.randrange(86_400) for _ in range(200)],
+        "milliseconds": [int(unix * 1e3) - rng.randrange(86_400_000) for _ in range(200)],
+        "microseconds": [int(unix * 1e6) - rng.randrange(86_400_000_000) for _ in range(200)],
+        "nanoseconds": [int(unix * 1e9) - rng.randrange(86_400_000_000_000) for _ in range(200)],
+        "float_seconds": [unix - rng.random() * 86_400 for _ in range(200)],
+    }
+
+
+def sample_documents(rng, values):
+    return {
+        "filetime_doc": [{"_id": str(ObjectId()), "_timestamp": v} for v in values["filetime"]],
+        "unix_ms_doc": [{"_id": ObjectId(), "timestamp": v} for v in values["milliseconds"]],
+        "string_id_only": [{"_id": f"{rng.randrange(10**12):x}-device"} for _ in range(200)],
+        "objectid_str_only": [{"_id": str(ObjectId())} for _ in range(200)],
+    }
+
+
+def gateway_payload(rng, v_length):
+    """Secomea gateway shape: the tag set spread over `v` entries, some repeated."""
+    entries = []
+    for i in range(v_length):
+        entries.append({
+            "ts": 1_700_000_000_000 + i,
+            "Test2OPCUA:CallOperator": rng.randrange(2),
+            "Test2OPCUA:CallService": 1,
+            f"Test2OPCUA:Tag{i % 25}": rng.random(),
+        })
+    return {"v": entries, "gateway": "secomea-sitemanager"}
+
+
+# --- Harness -----------------------------------------------------------------------------
+
+def sample_inputs(seed=1601):
+    """(values, documents, payloads) used by every case, reproducible for a given seed."""
+    rng = random.Random(seed)
+    values = sample_values(rng, datetime.utcnow())
+    documents = sample_documents(rng, values)
+    payloads = {length: gateway_payload(rng, length) for length in (1, 5, 20, 100)}
+    return values, documents, payloads
+
+
+def build_cases(monitor, bridge, values, documents, payloads):
+    """[(name, current, previous, items)] for every helper and payload shape."""
+    cases = []
+    for name, items in values.items():
+        cases.append((f"parse_timestamp[{name}]", monitor.parse_timestamp, legacy_parse_timestamp, items))
+    for name, docs in documents.items():
+        cases.append((f"get_document_time[{name}]", monitor.get_document_time, legacy_get_document_time, docs))
+    for length, payload in payloads.items():
+        # Flattening mutates its argument, so every call gets a fresh shallow copy (in both columns).
+        cases.append((
+            f"_flatten_v_entries[v={length}]",
+            lambda doc: bridge._flatten_v_entries(dict(doc)),
+            lambda doc: legacy_flatten_v_entries(dict(doc)),
+            [payload],
+        ))
+    return cases
+
+
+def best_ns_per_call(funcs, items, number, repeat):
+    """Best time per call of each function; rounds are interleaved so machine noise hits both."""
+    n = len(items)
+    best = [float("inf")] * len(funcs)
+    for _ in range(repeat):
+        for index, func in enumerate(funcs):
+            def run():
+                for i in range(number):
+                    func(items[i % n])
+            best[index] = min(best[index], timeit.timeit(run, number=1) / number * 1e9)
+    return best
+
+
+def verify(monitor, bridge, values, documents, payloads):
+    for v in values["filetime"]:
+        assert monitor.parse_timestamp(v) == exact_filetime(v), v
+        assert abs(monitor.parse_timestamp(v) - legacy_parse_timestamp(v)) <= timedelta(microseconds=2), v
+    for name, items in values.items():
+        if name != "filetime":
+            for v in items:
+                assert monitor.parse_timestamp(v) == legacy_parse_timestamp(v), (name, v)
+    for name, docs in documents.items():
+        for doc in docs:
+            if name == "filetime_doc":
+                assert monitor.get_document_time(doc) == exact_filetime(doc["_timestamp"]), doc
+            else:
+                assert monitor.get_document_time(doc) == legacy_get_document_time(doc), doc
+    for payload in payloads.values():
+        assert bridge._flatten_v_entries(dict(payload)) == legacy_flatten_v_entries(dict(payload))
+
+
+# Values at and past the range boundaries; the scalar returns None (batch: NaT) for the invalid ones.
+EDGE_VALUES = [
+    0, 1, -1, -53_664_042_058, -10 ** 16, 10 ** 9, 10 ** 9 + 1, 10 ** 12, 10 ** 12 + 1, 10 ** 15, 10 ** 15 + 1,
+    129_999_999_999_999_999, 130_000_000_000_000_000, 150_000_000_000_000_000, 150_000_000_000_000_001,
+    2 ** 63 - 1, -2 ** 63,
+]
+EDGE_FLOATS = [0.0, -0.0, -1.5, 1e9 + 0.5, 1.3e17, 1.5e17, float("nan"), float("inf"), float("-inf"), 1e30]
+
+
+def same_instant(batch_value, scalar_value):
+    """
+    A parse_timestamps element equals the scalar result: NaT where the scalar gives None or a
+    date outside datetime64[ns] (years 1678-2261).
+    """
+    import numpy as np
+
+    if scalar_value is None or not 1678 <= scalar_value.year <= 2261:
+        return bool(np.isnat(batch_value))
+    return batch_value == np.datetime64(scalar_value, "ns")
+
+
+def verify_batch(monitor, parse_timestamps):
+    """parse_timestamps agrees with parse_timestamp on every boundary value, int and float."""
+    import numpy as np
+
+    for values, dtype in ((EDGE_VALUES, np.int64), (EDGE_FLOATS, np.float64)):
+        batch = parse_timestamps(np.array(values, dtype=dtype))
+        for v, converted in zip(values, batch):
+            assert same_instant(converted, monitor.parse_timestamp(v)), (v, converted, monitor.parse_timestamp(v))
+
+
+def benchmark_batch(monitor, values, size):
+    """
+    Scalar parse_timestamp over a list vs. timestamp_batch.parse_timestamps over an int64
+    array, for single-format columns and for a mixed-format column. Returns None when numpy
+    is not installed.
+    """
+    try:
+        import numpy as np
+        from alarm_monitor_function.timestamp_batch import parse_timestamps
+    except ImportError:
+        print("ℹ️  numpy not installed; skipping the batch conversion case")
+        return None
+
+    verify_batch(monitor, parse_timestamps)
+    pools = {name: values[name] for name in ("filetime", "milliseconds", "nanoseconds")}
+    pools["mixed"] = [v for name, items in values.items() if name != "float_seconds" for v in items]
+    results = {}
+    for name, pool in pools.items():
+        raw = [pool[(i * 7919) % len(pool)] for i in range(size)]
+        array = np.array(raw, dtype=np.int64)
+
+        started = time.perf_counter()
+        scalar = [monitor.parse_timestamp(v) for v in raw]
+        scalar_seconds = time.perf_counter() - started
+        batch_seconds = min(timeit.repeat(lambda: parse_timestamps(array), number=1, repeat=3))
+        batch = parse_timestamps(array)
+
+        for i in range(0, size, max(1, size // 10_000)):
+            assert same_instant(batch[i], scalar[i]), (raw[i], batch[i], scalar[i])
+        results[name] = {
+            "size": size,
+            "scalar_seconds": scalar_seconds,
+            "batch_seconds": batch_seconds,
+            "speedup": scalar_seconds / batch_seconds,
+        }
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except Exception:
+        return None
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    os.environ.setdefault("ACS_PREWARM_ON_START", "false")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import alarm_monitor_function as monitor
+    import iot_to_cosmos_bridge as bridge
+
+    values, documents, payloads = sample_inputs()
+    verify(monitor, bridge, values, documents, payloads)
+    print("✅ Fast paths verified against the reference implementations")
+
+    cases = build_cases(monitor, bridge, values, documents, payloads)
+    results = {}
+    print(f"{'case':<40} {'previous ns':>12} {'current ns':>12} {'speedup':>8}")
+    for name, current, previous, items in cases:
+        previous_ns, current_ns = best_ns_per_call((previous, current), items, args.number, args.repeat)
+        results[name] = {"previous_ns": previous_ns, "current_ns": current_ns, "speedup": previous_ns / current_ns}
+        print(f"{name:<40} {previous_ns:>12.0f} {current_ns:>12.0f} {previous_ns / current_ns:>7.2f}x")
+
+    batch = benchmark_batch(monitor, values, args.batch_size) if args.batch_size else None
+    for name, result in (batch or {}).items():
+        print(f"parse_timestamps[{name}, {result['size']:,} values]: scalar {result['scalar_seconds']:.2f}s, "
+              f"batch {result['batch_seconds']:.3f}s ({result['speedup']:.0f}x)")
+
+    record = {
+        "generated_utc": datetime.utcnow().isoformat() + "Z",
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "number": args.number,
+        "repeat": args.repeat,
+        "results": results,
+        "batch": batch,
+    }
+    with open(args.history, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    print(f"✅ Results appended to {args.history}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
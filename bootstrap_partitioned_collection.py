@@ -0,0 +1,73 @@
+"""
+Create the telemetry collection partitioned (sharded) on the unit/device id before the
+IoT Hub bridge writes to it with PARTITION_BY_UNIT=true.
+
+- Cosmos DB (Mongo API): creates the collection with the CreateCollection custom action and
+  PARTITION_KEY_FIELD as shard key. The shard key of an existing collection cannot be
+  changed; migrate existing data into a new collection instead.
+- MongoDB sharded cluster (connect to mongos): enables sharding on the database and shards
+  the collection on a hashed PARTITION_KEY_FIELD.
+
+The bridge runs the same bootstrap once per worker, so this script is mainly for creating
+the collection ahead of time and for trying partitioning against a local sharded cluster.
+
+Usage:
+  python bootstrap_partitioned_collection.py
+  python bootstrap_partitioned_collection.py --connection-string mongodb://localhost:27017 --database AlarmBenchmark
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from iot_to_cosmos_bridge import PARTITION_KEY_FIELD, ensure_partitioned_collection  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Create the telemetry collection partitioned by unit")
+    parser.add_argument("--connection-string", default=None, help="defaults to mongodb_connection_string in local_data.json")
+    parser.add_argument("--database", default=None, help="defaults to cosmos_database in local_data.json")
+    parser.add_argument("--collection", default=None, help="defaults to cosmos_collection in local_data.json")
+    parser.add_argument("--key", default=PARTITION_KEY_FIELD, help=f"partition key field (default: {PARTITION_KEY_FIELD})")
+    return parser.parse_args()
+
+
+def load_config():
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_data.json")
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path, 'r') as f:
+        return json.load(f)
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    config = load_config()
+    connection_string = args.connection_string or config.get("mongodb_connection_string")
+    database = args.database or config.get("cosmos_database", "IoTDatabase")
+    collection_name = args.collection or config.get("cosmos_collection", "iotmessages")
+    if not connection_string:
+        print("❌ No connection string: pass --connection-string or fill in local_data.json")
+        return 1
+
+    client = MongoClient(connection_string)
+    print("=" * 80)
+    print(f"Partition {database}.{collection_name} on {args.key}")
+    print("=" * 80)
+    backend = ensure_partitioned_collection(client[database], collection_name, args.key)
+    if backend is None:
+        print("❌ The server cannot partition this collection (standalone/replica set, or an existing "
+              "collection that cannot be sharded); see the log above")
+        return 1
+    print(f"✅ Partitioned ({backend})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
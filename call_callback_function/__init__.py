@@ -0,0 +1,47 @@
+"""
+HTTP-triggered receiver for Azure Communication Services Call Automation callbacks.
+
+ACS posts CallConnected / PlayCompleted / CallDisconnected events to the `/api/callbacks`
+URL passed to create_call() by alarm_monitor_function. Playback starts as soon as the
+call connects, and answered / not-answered outcomes are written back into the alarm state.
+The endpoint is anonymous: requests must carry CALLBACK_SECRET as ?token= when it is set, and
+events for calls no worker created are ignored.
+"""
+
+import json
+import logging
+
+import azure.functions as func
+
+from alarm_monitor_function import handle_call_event, verify_callback_token
+
+
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    """Handle a batch of Call Automation CloudEvents."""
+    if not verify_callback_token(req.params.get("token")):
+        logging.warning("Callback request with a missing or wrong token")
+        return func.HttpResponse("Unauthorized", status_code=401)
+
+    try:
+        body = req.get_json()
+    except ValueError:
+        logging.warning("Callback request without a JSON body")
+        return func.HttpResponse("Invalid JSON", status_code=400)
+
+    events = body if isinstance(body, list) else [body]
+    handled = []
+    for event in events:
+        if not isinstance(event, dict):
+            continue
+        try:
+            event_type = handle_call_event(event)
+            if event_type:
+                handled.append(event_type)
+        except Exception as e:
+            logging.error(f"Error handling call event {event.get('type')}: {e}")
+
+    return func.HttpResponse(
+        json.dumps({"handled": handled}),
+        status_code=200,
+        mimetype="application/json",
+    )
@@ -3,20 +3,122 @@ Bridge telemetry from IoT Hub/Event Hub to Cosmos DB (Mongo API).
 
 This function consumes messages from the IoT Hub built-in Event Hub endpoint
 and writes them into the same Mongo collection consumed by alarm_monitor_function.
+With BRIDGE_ALARM_EVAL enabled it also evaluates the alarm condition while ingesting and
+publishes alarm-start events to the `alarm-events` queue (alarm_event_function), so calls
+do not wait for the next timer poll.
 """
 
 import json
 import logging
 import os
+import random
+import re
+import tempfile
+import threading
+import time
+import typing
 from datetime import datetime
 
 import azure.functions as func
+import bson
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, ConnectionFailure, OperationFailure, PyMongoError
+
+from .spool import DiskSpool
 
 
 MONGODB_CONNECTION_STRING = os.environ.get("MongoDBConnectionString")
 COSMOS_DATABASE = os.environ.get("COSMOS_DATABASE", "IoTDatabase")
 COSMOS_COLLECTION = os.environ.get("COSMOS_COLLECTION", "iotmessages")
+UNIT_ID_FIELD = os.environ.get("UNIT_ID_FIELD", "device_id")
+ALARM_FIELD = os.environ.get("ALARM_FIELD", "Test2OPCUA:CallOperator")
+CALL_SERVICE_FIELD = os.environ.get("CALL_SERVICE_FIELD", "Test2OPCUA:CallService")
+VOLUME_TREATED_FIELD = os.environ.get("VOLUME_TREATED_FIELD", "Test2OPCUA:VolumeTreated")
+ALLOW_ALARM_WITHOUT_CALL_SERVICE = os.environ.get("ALLOW_ALARM_WITHOUT_CALL_SERVICE", "false").strip().lower() in (
+    "1",
+    "true",
+    "yes",
+    "on",
+)
+BRIDGE_ALARM_EVAL = os.environ.get("BRIDGE_ALARM_EVAL", "false").strip().lower() in ("1", "true", "yes", "on")
+# Canonical UTC time (int64 nanoseconds since 1970) stamped on every document and indexed,
+# so readers can range-query and sort one field whatever format the gateway used.
+CANONICAL_TS_FIELD = os.environ.get("CANONICAL_TS_FIELD", "ts_utc_ns")
+# Materialized per-unit latest state (one small document per unit), read by the alarm monitor
+# instead of sorting the telemetry collection.
+MATERIALIZED_UNIT_STATE = os.environ.get("MATERIALIZED_UNIT_STATE", "false").strip().lower() in ("1", "true", "yes", "on")
+UNIT_STATE_COLLECTION = os.environ.get("UNIT_STATE_COLLECTION", "unit_latest_state")
+DEFAULT_UNIT_ID = "_default"  # state document / partition for telemetry without a unit id
+# Partitioning by unit: every document carries PARTITION_KEY_FIELD (the device id) and the
+# collection is created sharded on it, so writes spread over partitions and per-unit reads
+# stay in one partition.
+PARTITION_BY_UNIT = os.environ.get("PARTITION_BY_UNIT", "false").strip().lower() in ("1", "true", "yes", "on")
+PARTITION_KEY_FIELD = os.environ.get("PARTITION_KEY_FIELD", UNIT_ID_FIELD)
+
+# Write-on-change filter: gateways resend the full tag set every cycle, so samples equal to the
+# last written sample of their unit (numeric fields within their BRIDGE_DEADBANDS entry) are
+# dropped. Alarm/call-service changes and one heartbeat per BRIDGE_HEARTBEAT_SECONDS are always
+# written; the heartbeat must stay below the monitor's SIGNAL_LOSS_SECONDS.
+BRIDGE_CHANGE_FILTER = os.environ.get("BRIDGE_CHANGE_FILTER", "false").strip().lower() in ("1", "true", "yes", "on")
+BRIDGE_HEARTBEAT_SECONDS = float(os.environ.get("BRIDGE_HEARTBEAT_SECONDS", "60"))
+# Absolute deadband per numeric field, e.g. {"Test2OPCUA:VolumeTreated": 0.5}; other fields compare exactly.
+try:
+    BRIDGE_DEADBANDS = json.loads(os.environ.get("BRIDGE_DEADBANDS", "") or "{}")
+except ValueError:
+    logging.error("BRIDGE_DEADBANDS is not valid JSON; comparing all fields exactly")
+    BRIDGE_DEADBANDS = {}
+BRIDGE_CHANGE_IGNORE_FIELDS = [
+    field.strip() for field in os.environ.get("BRIDGE_CHANGE_IGNORE_FIELDS", "").split(",") if field.strip()
+]
+if BRIDGE_CHANGE_FILTER and BRIDGE_HEARTBEAT_SECONDS >= float(os.environ.get("SIGNAL_LOSS_SECONDS", "120")):
+    logging.warning("BRIDGE_HEARTBEAT_SECONDS >= SIGNAL_LOSS_SECONDS: quiet units will look like signal loss")
+
+# Deterministic `_id` per Event Hub event ("<partition>:<offset>:<sequence number>"), so a
+# redelivered batch only produces duplicate-key no-ops instead of second copies.
+BRIDGE_EVENT_IDS = os.environ.get("BRIDGE_EVENT_IDS", "true").strip().lower() in ("1", "true", "yes", "on")
+
+# Writer settings: chunks stay under Cosmos request limits, throttled/failed documents are retried.
+BRIDGE_MAX_POOL_SIZE = int(os.environ.get("BRIDGE_MAX_POOL_SIZE", "10"))
+BRIDGE_CHUNK_SIZE = int(os.environ.get("BRIDGE_CHUNK_SIZE", "100"))
+BRIDGE_CHUNK_MAX_BYTES = int(os.environ.get("BRIDGE_CHUNK_MAX_BYTES", "1000000"))
+BRIDGE_MAX_RETRIES = int(os.environ.get("BRIDGE_MAX_RETRIES", "5"))
+BRIDGE_RETRY_BASE_MS = int(os.environ.get("BRIDGE_RETRY_BASE_MS", "100"))
+BRIDGE_RETRY_MAX_MS = int(os.environ.get("BRIDGE_RETRY_MAX_MS", "5000"))
+
+# Local disk spool for documents that still fail after the retries (Cosmos throttling or down);
+# drained in the background, alarm documents first, once writes succeed again.
+BRIDGE_SPOOL_ENABLED = os.environ.get("BRIDGE_SPOOL_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+BRIDGE_SPOOL_DIR = os.environ.get("BRIDGE_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "iot_bridge_spool"))
+BRIDGE_SPOOL_MAX_BYTES = int(os.environ.get("BRIDGE_SPOOL_MAX_BYTES", str(256 * 1024 * 1024)))
+BRIDGE_SPOOL_DRAIN_RATE = float(os.environ.get("BRIDGE_SPOOL_DRAIN_RATE", "500"))  # documents per second
+BRIDGE_SPOOL_RETRY_SECONDS = float(os.environ.get("BRIDGE_SPOOL_RETRY_SECONDS", "30"))
+
+# Error codes worth retrying: 16500 = Cosmos request rate too large (429), 50 = time limit,
+# 89/91/189/262 = network/shutdown/primary stepdown/timeout.
+RETRYABLE_WRITE_CODES = {16500, 50, 89, 91, 189, 262}
+DUPLICATE_KEY_CODE = 11000
+_RETRY_AFTER_RE = re.compile(r"RetryAfterMs=(\d+)")
+
+# 1970-01-01 expressed as FILETIME (100ns intervals since 1601-01-01).
+UNIX_EPOCH_AS_FILETIME = 116_444_736_000_000_000
+
+_mongo_client = None
+_mongo_client_lock = threading.Lock()
+_canonical_index_checked = False
+_partitioning_checked = False
+_spool = None
+_spool_lock = threading.Lock()
+
+# Last alarm condition seen per unit by this worker, so only alarm starts are published.
+_last_alarm_active = {}
+
+# Change filter state: unit -> (CANONICAL_TS_FIELD, compared fields) of the last sample written
+# by this worker. IoT Hub routes a device to a fixed partition, so one worker sees all its samples.
+_last_written = {}
+_change_filter_totals = {"received": 0, "written": 0}
+_MISSING = object()
+# Per-message fields that differ on every sample and say nothing about the unit's state.
+_CHANGE_METADATA_FIELDS = {"_id", "_timestamp", "timestamp", "_ts", "ts", "v", "ingest_source", CANONICAL_TS_FIELD}
 
 
 def _to_dict(ev: func.EventHubEvent) -> dict:
@@ -31,11 +133,255 @@ def _to_dict(ev: func.EventHubEvent) -> dict:
         return {"raw": ev.get_body().decode("utf-8", errors="replace")}
 
 
+def _device_id(ev: func.EventHubEvent):
+    """Return the IoT Hub device id that sent the event, if the runtime provides it."""
+    try:
+        metadata = ev.iothub_metadata or {}
+    except Exception:
+        return None
+    return metadata.get("connection-device-id")
+
+
+def _partition_id(ev: func.EventHubEvent):
+    """Event Hub partition of the batch (the runtime's PartitionContext metadata), if available."""
+    try:
+        context = (ev.metadata or {}).get("PartitionContext")
+        if isinstance(context, str):
+            context = json.loads(context)
+    except Exception:
+        return None
+    if isinstance(context, dict):
+        return context.get("PartitionId")
+    return None
+
+
+def _event_id(ev: func.EventHubEvent, partition_id):
+    """
+    Deterministic document id of an event: "<partition>:<offset>:<sequence number>".
+    Sequence numbers and offsets are only unique within a partition, so without a partition
+    id (or a sequence number) None is returned and the driver assigns an ObjectId.
+    """
+    if partition_id is None:
+        return None
+    try:
+        sequence_number, offset = ev.sequence_number, ev.offset
+    except Exception:
+        return None
+    if sequence_number is None:
+        return None
+    return f"{partition_id}:{offset}:{sequence_number}"
+
+
 def _windows_filetime_now() -> int:
     """Return current UTC time as Windows FILETIME (100ns since 1601)."""
-    now = datetime.utcnow()
-    windows_epoch = datetime(1601, 1, 1)
-    return int((now - windows_epoch).total_seconds() * 10_000_000)
+    return time.time_ns() // 100 + UNIX_EPOCH_AS_FILETIME
+
+
+def _to_utc_ns(value):
+    """
+    Raw timestamp -> int nanoseconds since 1970 (UTC), using the same magnitude ranges as
+    alarm_monitor_function.parse_timestamp(). Returns None for non-numeric values.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if 1.3e17 <= value <= 1.5e17:  # Windows FILETIME (100 ns)
+        return int(value - UNIX_EPOCH_AS_FILETIME) * 100
+    if value > 1e15:  # Nanoseconds
+        return int(value)
+    if value > 1e12:  # Microseconds
+        return int(value * 1_000)
+    if value > 1e9:  # Milliseconds
+        return int(value * 1_000_000)
+    return int(value * 1_000_000_000)  # Seconds
+
+
+def _canonical_ts_ns(doc):
+    """
+    Canonical time of a document: `timestamp`, then `_timestamp` (FILETIME), then Cosmos `_ts`,
+    then the ObjectId generation time, in the order the monitor has always used them.
+    """
+    for field in ("timestamp", "_timestamp"):
+        value = _to_utc_ns(doc.get(field))
+        if value is not None:
+            return value
+    if isinstance(doc.get("_ts"), (int, float)):  # Cosmos server time, always in seconds
+        return int(doc["_ts"]) * 1_000_000_000
+    _id = doc.get("_id")
+    if isinstance(_id, bson.ObjectId):
+        return int(_id.generation_time.timestamp()) * 1_000_000_000
+    return None
+
+
+def _ensure_canonical_index(collection):
+    """Create the CANONICAL_TS_FIELD index once per worker."""
+    global _canonical_index_checked
+    if _canonical_index_checked:
+        return
+    _canonical_index_checked = True
+    try:
+        collection.create_index([(CANONICAL_TS_FIELD, 1)], name=f"{CANONICAL_TS_FIELD}_1")
+    except PyMongoError as e:
+        logging.warning(f"Could not create {CANONICAL_TS_FIELD} index: {e}")
+
+
+def ensure_partitioned_collection(db, name, key_field=None):
+    """
+    Create collection `name` sharded on key_field (default PARTITION_KEY_FIELD):
+    - Cosmos DB (Mongo API): the CreateCollection custom action with a shard key
+    - MongoDB behind mongos: enableSharding + shardCollection with a hashed key
+    Returns "cosmos", "mongos" or None when the server cannot shard (standalone/replica set).
+    An existing collection is left alone on Cosmos, whose shard key cannot be changed: this
+    only checks its shard key and returns None when it is not key_field.
+    """
+    key_field = key_field or PARTITION_KEY_FIELD
+    if name not in db.list_collection_names():
+        try:
+            db.command({"customAction": "CreateCollection", "collection": name, "shardKey": key_field})
+            logging.info(f"Created Cosmos collection {db.name}.{name} partitioned on {key_field}")
+            return "cosmos"
+        except OperationFailure:
+            pass  # not Cosmos; try a sharded MongoDB cluster
+    else:
+        try:
+            existing = db.command({"customAction": "GetCollection", "collection": name})
+        except OperationFailure:
+            existing = None  # not Cosmos
+        if existing is not None:
+            shard_key = list((existing.get("shardKeyDefinition") or {}).keys())
+            if shard_key != [key_field]:
+                logging.warning(
+                    f"Cosmos collection {db.name}.{name} is partitioned on {shard_key or 'nothing'}, not {key_field}; "
+                    "per-unit reads will fan out"
+                )
+                return None
+            logging.debug(f"Cosmos collection {db.name}.{name} is partitioned on {key_field}")
+            return "cosmos"
+    admin = db.client.admin
+    try:
+        try:
+            admin.command("enableSharding", db.name)
+        except OperationFailure as e:
+            if e.code != 23:  # AlreadyInitialized
+                raise
+        admin.command("shardCollection", f"{db.name}.{name}", key={key_field: "hashed"})
+        logging.info(f"Sharded {db.name}.{name} on hashed {key_field}")
+        return "mongos"
+    except OperationFailure as e:
+        logging.warning(f"Could not partition {db.name}.{name} on {key_field}: {e}")
+        return None
+
+
+def _ensure_partitioning(collection):
+    """Run ensure_partitioned_collection() once per worker, before the first write."""
+    global _partitioning_checked
+    if _partitioning_checked:
+        return
+    _partitioning_checked = True
+    try:
+        ensure_partitioned_collection(collection.database, collection.name)
+    except Exception as e:  # never let the bootstrap block writes
+        logging.warning(f"Could not check partitioning of {collection.full_name}: {e}")
+
+
+def _get_collection():
+    """Return the target collection on a MongoClient shared by all invocations of this worker."""
+    global _mongo_client
+    with _mongo_client_lock:
+        if _mongo_client is None:
+            _mongo_client = MongoClient(
+                MONGODB_CONNECTION_STRING,
+                maxPoolSize=BRIDGE_MAX_POOL_SIZE,
+                retryWrites=False,
+            )
+        return _mongo_client[COSMOS_DATABASE][COSMOS_COLLECTION]
+
+
+def _reset_client():
+    """Drop the shared client after a connection-level failure so the next batch reconnects."""
+    global _mongo_client
+    with _mongo_client_lock:
+        if _mongo_client is not None:
+            try:
+                _mongo_client.close()
+            except Exception:
+                pass
+        _mongo_client = None
+
+
+def _chunk_documents(docs):
+    """Split docs into chunks of at most BRIDGE_CHUNK_SIZE documents and BRIDGE_CHUNK_MAX_BYTES of BSON."""
+    chunk, chunk_bytes = [], 0
+    for doc in docs:
+        size = len(bson.encode(doc))
+        if chunk and (len(chunk) >= BRIDGE_CHUNK_SIZE or chunk_bytes + size > BRIDGE_CHUNK_MAX_BYTES):
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append(doc)
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+
+def _backoff_ms(attempt, errors=()):
+    """Exponential backoff with jitter, honouring Cosmos RetryAfterMs hints when present."""
+    hinted = 0
+    for error in errors:
+        match = _RETRY_AFTER_RE.search(str(error.get("errmsg", "")))
+        if match:
+            hinted = max(hinted, int(match.group(1)))
+    delay = min(BRIDGE_RETRY_MAX_MS, BRIDGE_RETRY_BASE_MS * (2 ** attempt))
+    return max(hinted, delay * (0.5 + random.random() / 2))
+
+
+def _insert_with_retry(collection, docs):
+    """
+    Insert docs with unordered insert_many, re-sending only the documents that failed
+    with a retryable error (from BulkWriteError.details). Duplicate keys are already stored:
+    an earlier attempt reached the server, or the batch is an Event Hub redelivery.
+    Returns (written, failed_docs, retries, duplicates, collection); collection is on a new
+    client when a connection failure made us reconnect, and callers must use it from then on.
+    """
+    pending = docs
+    written = 0
+    retries = 0
+    duplicates = 0
+    for attempt in range(BRIDGE_MAX_RETRIES + 1):
+        try:
+            collection.insert_many(pending, ordered=False)
+            return written + len(pending), [], retries, duplicates, collection
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            retry_indexes = {err["index"] for err in write_errors if err.get("code") in RETRYABLE_WRITE_CODES}
+            fatal = [err for err in write_errors
+                     if err.get("code") not in RETRYABLE_WRITE_CODES and err.get("code") != DUPLICATE_KEY_CODE]
+            for err in fatal:
+                logging.error(f"Dropping telemetry document (code {err.get('code')}): {err.get('errmsg')}")
+            fatal_indexes = {err["index"] for err in fatal}
+            duplicate_count = sum(1 for err in write_errors if err.get("code") == DUPLICATE_KEY_CODE)
+            duplicates += duplicate_count
+            written += len(pending) - len(retry_indexes) - len(fatal_indexes) - duplicate_count
+            pending = [doc for i, doc in enumerate(pending) if i in retry_indexes]
+            delay_errors = [err for err in write_errors if err.get("code") in RETRYABLE_WRITE_CODES]
+        except PyMongoError as e:
+            # Whole request failed (connection, timeout, throttle): retry the chunk; already inserted
+            # documents come back as duplicate keys because insert_many assigned their _id.
+            logging.warning(f"Bridge chunk write failed ({type(e).__name__}): {e}")
+            if isinstance(e, ConnectionFailure):
+                # Only a broken connection warrants a new pool; a throttle is retried on the same one.
+                _reset_client()
+                collection = _get_collection()
+            delay_errors = [{"errmsg": str(e)}]
+
+        if not pending:
+            return written, [], retries, duplicates, collection
+        if attempt == BRIDGE_MAX_RETRIES:
+            break
+        retries += 1
+        delay = _backoff_ms(attempt, delay_errors)
+        logging.warning(f"Retrying {len(pending)} document(s) in {delay:.0f} ms (attempt {retries}/{BRIDGE_MAX_RETRIES})")
+        time.sleep(delay / 1000)
+
+    return written, pending, retries, duplicates, collection
 
 
 def _flatten_v_entries(doc: dict) -> dict:
@@ -52,16 +398,266 @@ def _flatten_v_entries(doc: dict) -> dict:
         return doc
 
     for item in entries:
-        if not isinstance(item, dict):
-            continue
-        for key, value in item.items():
+        if isinstance(item, dict):
             # Keep last observed value for each field in the event packet.
-            doc[key] = value
+            doc.update(item)
 
     return doc
 
 
-def main(events: func.EventHubEvent):
+def _compared_values(doc):
+    """Fields the change filter compares: everything but per-message metadata."""
+    return {
+        key: value for key, value in doc.items()
+        if key not in _CHANGE_METADATA_FIELDS and key not in BRIDGE_CHANGE_IGNORE_FIELDS
+    }
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _values_changed(previous, current):
+    """True if any field was added, removed or changed (numeric fields: by more than their deadband)."""
+    for field in previous.keys() | current.keys():
+        old, new = previous.get(field, _MISSING), current.get(field, _MISSING)
+        deadband = BRIDGE_DEADBANDS.get(field)
+        if deadband is not None and _is_number(old) and _is_number(new):
+            if abs(new - old) > deadband:
+                return True
+        elif old != new:
+            return True
+    return False
+
+
+def _filter_unchanged(docs):
+    """
+    Drop samples that repeat the last written sample of their unit. Compared against the last
+    *written* values, so slow drift still gets written once it exceeds the deadband.
+    Returns (kept_docs, stats, references) with stats counting received, changed, transitions,
+    heartbeats; pass references to _remember_written once the write succeeded or was spooled.
+    """
+    kept = []
+    references = []
+    batch_last = {}  # later samples of this batch compare against the earlier kept ones
+    stats = {"received": len(docs), "changed": 0, "transitions": 0, "heartbeats": 0}
+    heartbeat_ns = int(BRIDGE_HEARTBEAT_SECONDS * 1_000_000_000)
+    for doc in docs:
+        unit_id = doc.get(UNIT_ID_FIELD, DEFAULT_UNIT_ID)
+        ts = doc.get(CANONICAL_TS_FIELD)
+        values = _compared_values(doc)
+        last = batch_last.get(unit_id, _last_written.get(unit_id))
+        if last is None:
+            reason = "changed"
+        else:
+            last_ts, last_values = last
+            if any(last_values.get(field, _MISSING) != values.get(field, _MISSING)
+                   for field in (ALARM_FIELD, CALL_SERVICE_FIELD)):
+                reason = "transitions"
+            elif _values_changed(last_values, values):
+                reason = "changed"
+            elif ts is None or last_ts is None or ts - last_ts >= heartbeat_ns:
+                reason = "heartbeats"
+            else:
+                continue
+        stats[reason] += 1
+        kept.append(doc)
+        references.append((doc, unit_id, ts, values))
+        if _is_newer_reference(last, ts):
+            batch_last[unit_id] = (ts, values)
+    _change_filter_totals["received"] += len(docs)
+    _change_filter_totals["written"] += len(kept)
+    return kept, stats, references
+
+
+def _is_newer_reference(last, ts):
+    # A late (out-of-order) sample is written but does not replace the newer reference.
+    return last is None or ts is None or last[0] is None or ts >= last[0]
+
+
+def _remember_written(references, lost=()):
+    """
+    Make stored samples the change filter reference of their unit. Samples in `lost` were
+    neither written nor spooled and stay out, so the next identical sample is still written.
+    """
+    lost_ids = {id(doc) for doc in lost}
+    for doc, unit_id, ts, values in references:
+        if id(doc) not in lost_ids and _is_newer_reference(_last_written.get(unit_id), ts):
+            _last_written[unit_id] = (ts, values)
+
+
+def _is_alarm_active(doc):
+    """Same condition as alarm_monitor_function (without signal-loss forcing, which stays on the timer)."""
+    alarm_value = doc.get(ALARM_FIELD)
+    if alarm_value != 1:
+        return False
+    return doc.get(CALL_SERVICE_FIELD, 0) == 1 or ALLOW_ALARM_WITHOUT_CALL_SERVICE
+
+
+def _alarm_events(docs):
+    """Return alarm-start events for units whose alarm condition switched on in this batch."""
+    events = []
+    for doc in docs:
+        if ALARM_FIELD not in doc:
+            continue
+        unit_id = doc.get(UNIT_ID_FIELD)
+        active = _is_alarm_active(doc)
+        was_active = _last_alarm_active.get(unit_id, False)
+        _last_alarm_active[unit_id] = active
+        if active and not was_active:
+            fields = (ALARM_FIELD, CALL_SERVICE_FIELD, VOLUME_TREATED_FIELD, UNIT_ID_FIELD, "_timestamp", "timestamp")
+            events.append({
+                "event": "alarm_start",
+                "unit_id": unit_id,
+                "doc": {key: doc[key] for key in fields if key in doc},
+                "published_utc": datetime.utcnow().isoformat(),
+            })
+    return events
+
+
+def _publish_alarm_events(alarm_events, alarmqueue):
+    """Send events through the queue output binding, or hand them to the monitor in-process."""
+    if not alarm_events:
+        return
+    for event in alarm_events:
+        logging.warning(f"⚠️  Alarm start detected at ingest (unit={event['unit_id']})")
+    if alarmqueue is not None:
+        alarmqueue.set([json.dumps(event) for event in alarm_events])
+        return
+
+    # Local stand-in for the queue: run the monitor's handler in this worker.
+    from alarm_monitor_function import handle_alarm_event
+
+    for event in alarm_events:
+        handle_alarm_event(event)
+
+
+def _unit_state_updates(docs):
+    """
+    Upserts for the per-unit state documents:
+      {_id: unit, recent: [newest two alarm samples], latest_ts_ns, last_seen_ns}
+    `recent` is kept sorted by time and sliced to two, so samples arriving out of order
+    only land where they belong. A sample already in `recent` (redelivery) makes the filter
+    miss and the upsert fail with a duplicate key, which the caller ignores, so replays
+    are no-ops.
+    """
+    from pymongo import UpdateOne
+
+    by_unit = {}
+    for doc in docs:
+        ts = doc.get(CANONICAL_TS_FIELD)
+        if ts is None:
+            continue
+        unit = by_unit.setdefault(doc.get(UNIT_ID_FIELD, DEFAULT_UNIT_ID), {"last_seen": ts, "samples": []})
+        unit["last_seen"] = max(unit["last_seen"], ts)
+        if ALARM_FIELD in doc:
+            fields = (ALARM_FIELD, CALL_SERVICE_FIELD, VOLUME_TREATED_FIELD, UNIT_ID_FIELD, CANONICAL_TS_FIELD, "_id")
+            unit["samples"].append({key: doc[key] for key in fields if key in doc})
+
+    requests = []
+    for unit_id, unit in by_unit.items():
+        on_insert = {"$setOnInsert": {UNIT_ID_FIELD: unit_id}}
+        samples = sorted(unit["samples"], key=lambda sample: sample[CANONICAL_TS_FIELD], reverse=True)[:2]
+        if not samples:
+            requests.append(UpdateOne(
+                {"_id": unit_id}, {"$max": {"last_seen_ns": unit["last_seen"]}, **on_insert}, upsert=True,
+            ))
+        for sample in samples:
+            ts = sample[CANONICAL_TS_FIELD]
+            requests.append(UpdateOne(
+                {"_id": unit_id, f"recent.{CANONICAL_TS_FIELD}": {"$ne": ts}},
+                {
+                    "$push": {"recent": {"$each": [sample], "$sort": {CANONICAL_TS_FIELD: -1}, "$slice": 2}},
+                    "$max": {"latest_ts_ns": ts, "last_seen_ns": unit["last_seen"]},
+                    **on_insert,
+                },
+                upsert=True,
+            ))
+    return requests
+
+
+def _write_unit_states(collection, docs):
+    """Apply _unit_state_updates(docs) with one unordered bulk write. Returns the number of updates."""
+    requests = _unit_state_updates(docs)
+    if not requests:
+        return 0
+    try:
+        collection.database[UNIT_STATE_COLLECTION].bulk_write(requests, ordered=False)
+    except BulkWriteError as e:
+        errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY_CODE]
+        for err in errors:
+            logging.error(f"Unit state update failed (code {err.get('code')}): {err.get('errmsg')}")
+    return len(requests)
+
+
+def _write_documents(collection, docs):
+    """
+    Write docs in chunks with retries, then update the materialized unit state of what was
+    stored. Returns (written, failed_docs, retries, duplicates, chunks).
+    """
+    written = 0
+    failed = []
+    retries = 0
+    duplicates = 0
+    chunks = 0
+    for chunk in _chunk_documents(docs):
+        chunks += 1
+        chunk_written, chunk_failed, chunk_retries, chunk_duplicates, collection = _insert_with_retry(collection, chunk)
+        written += chunk_written
+        failed.extend(chunk_failed)
+        retries += chunk_retries
+        duplicates += chunk_duplicates
+
+    if MATERIALIZED_UNIT_STATE:
+        failed_ids = {id(doc) for doc in failed}
+        try:
+            _write_unit_states(collection, [doc for doc in docs if id(doc) not in failed_ids])
+        except PyMongoError as e:
+            logging.error(f"Unit state update failed (monitor falls back to telemetry queries): {e}")
+    return written, failed, retries, duplicates, chunks
+
+
+def _drain_spooled(docs):
+    """DiskSpool write callback: returns the documents that still failed."""
+    return _write_documents(_get_collection(), docs)[1]
+
+
+def _get_spool():
+    """Return the worker's DiskSpool, or None when spooling is disabled or the directory is unusable."""
+    global _spool, BRIDGE_SPOOL_ENABLED
+    if not BRIDGE_SPOOL_ENABLED:
+        return None
+    with _spool_lock:
+        if _spool is None:
+            try:
+                _spool = DiskSpool(
+                    BRIDGE_SPOOL_DIR,
+                    _drain_spooled,
+                    lambda doc: ALARM_FIELD in doc,
+                    max_bytes=BRIDGE_SPOOL_MAX_BYTES,
+                    drain_rate=BRIDGE_SPOOL_DRAIN_RATE,
+                    retry_seconds=BRIDGE_SPOOL_RETRY_SECONDS,
+                )
+            except OSError as e:
+                logging.error(f"Bridge spool disabled, cannot use {BRIDGE_SPOOL_DIR}: {e}")
+                BRIDGE_SPOOL_ENABLED = False
+        return _spool
+
+
+def _spool_documents(docs):
+    """Hand documents that could not be written to the spool. Returns True if they were spooled."""
+    spool = _get_spool()
+    if spool is None:
+        return False
+    try:
+        spool.append(docs)
+        return True
+    except Exception as e:
+        logging.error(f"Could not spool {len(docs)} document(s): {e}")
+        return False
+
+
+def main(events: func.EventHubEvent, alarmqueue: func.Out[typing.List[str]] = None):
     """Ingest IoT Hub batch and write into Cosmos Mongo collection."""
     if not MONGODB_CONNECTION_STRING:
         logging.error("MongoDBConnectionString not configured")
@@ -71,35 +667,107 @@ def main(events: func.EventHubEvent):
         logging.info("No events received in this batch")
         return
 
-    client = None
+    docs = []
+    references = []
     try:
-        client = MongoClient(MONGODB_CONNECTION_STRING)
-        collection = client[COSMOS_DATABASE][COSMOS_COLLECTION]
+        started = time.perf_counter()
+        collection = _get_collection()
+        if PARTITION_BY_UNIT:
+            _ensure_partitioning(collection)
+        _ensure_canonical_index(collection)
 
-        docs = []
+        partition_id = _partition_id(events[0]) if BRIDGE_EVENT_IDS else None
         for ev in events:
             doc = _to_dict(ev)
             doc = _flatten_v_entries(doc)
+            if partition_id is not None and "_id" not in doc:
+                event_id = _event_id(ev, partition_id)
+                if event_id is not None:
+                    doc["_id"] = event_id
 
             # Ensure downstream alarm monitor can sort/parse recency reliably.
             if "_timestamp" not in doc:
                 doc["_timestamp"] = _windows_filetime_now()
+            if CANONICAL_TS_FIELD not in doc:
+                doc[CANONICAL_TS_FIELD] = _canonical_ts_ns(doc)
+
+            # Tag the unit so the monitor can track several units from one collection.
+            device_id = _device_id(ev)
+            if device_id and UNIT_ID_FIELD not in doc:
+                doc[UNIT_ID_FIELD] = device_id
+            if PARTITION_BY_UNIT and PARTITION_KEY_FIELD not in doc:
+                doc[PARTITION_KEY_FIELD] = doc.get(UNIT_ID_FIELD) or DEFAULT_UNIT_ID
 
             # Helpful traceability tag for debugging pipeline origin.
             doc.setdefault("ingest_source", "iot_hub_bridge")
             docs.append(doc)
 
-        if docs:
-            collection.insert_many(docs, ordered=False)
+        if BRIDGE_CHANGE_FILTER:
+            docs, stats, references = _filter_unchanged(docs)
+            totals = _change_filter_totals
             logging.info(
-                "Inserted %s telemetry document(s) into %s.%s",
+                "Change filter: writing %s/%s sample(s), %.0f%% reduction (%s changed, %s alarm transitions, "
+                "%s heartbeats); %.0f%% since start",
                 len(docs),
-                COSMOS_DATABASE,
-                COSMOS_COLLECTION,
+                stats["received"],
+                100.0 * (1 - len(docs) / stats["received"]),
+                stats["changed"],
+                stats["transitions"],
+                stats["heartbeats"],
+                100.0 * (1 - totals["written"] / totals["received"]),
+            )
+
+        # Publish alarm starts before the write so the call does not wait on Cosmos.
+        if BRIDGE_ALARM_EVAL:
+            try:
+                _publish_alarm_events(_alarm_events(docs), alarmqueue)
+            except Exception as e:
+                logging.error(f"Inline alarm evaluation failed (timer remains as safety net): {e}")
+
+        written, failed, retries, duplicates, chunks = _write_documents(collection, docs)
+
+        elapsed = time.perf_counter() - started
+        logging.info(
+            "Inserted %s/%s telemetry document(s) into %s.%s in %s chunk(s), %s already stored, %s retries, "
+            "%.0f ms (%.0f docs/s)",
+            written,
+            len(docs),
+            COSMOS_DATABASE,
+            COSMOS_COLLECTION,
+            chunks,
+            duplicates,
+            retries,
+            elapsed * 1000,
+            written / elapsed if elapsed > 0 else 0.0,
+        )
+        spool = _get_spool()
+        spooled = False
+        if failed:
+            spooled = _spool_documents(failed)
+            logging.error(
+                f"Bridge write failed for {len(failed)} document(s) after {BRIDGE_MAX_RETRIES} retries"
+                f"{', spooled to disk' if spooled else ''}"
             )
+        elif spool is not None and written:
+            spool.notify_write_succeeded()
+        _remember_written(references, () if spooled else failed)
+        if spool is not None:
+            metrics = spool.metrics()
+            if metrics["depth_documents"] or metrics["spooled_total"]:
+                logging.info(
+                    "Bridge spool: depth=%s (%s alarm), bytes=%s, spooled=%s, drained=%s, dropped=%s, "
+                    "drain_rate=%.0f docs/s",
+                    metrics["depth_documents"],
+                    metrics["depth_alarm_documents"],
+                    metrics["depth_bytes"],
+                    metrics["spooled_total"],
+                    metrics["drained_total"],
+                    metrics["dropped_total"],
+                    metrics["drain_rate_docs_per_second"],
+                )
     except Exception as e:
         logging.error(f"Bridge write failed: {e}")
-    finally:
-        if client is not None:
-            client.close()
+        if docs and _spool_documents(docs):
+            logging.warning(f"Spooled the {len(docs)} document(s) of the failed batch")
+            _remember_written(references)
 
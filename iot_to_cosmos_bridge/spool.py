@@ -0,0 +1,232 @@
+"""
+Local disk spool for telemetry the bridge could not write to Cosmos.
+
+Failed documents are appended as segment files (concatenated BSON, so ObjectIds, int64
+timestamps and the deterministic `_id` survive the round trip) in two lanes:
+- alarm/      documents carrying ALARM_FIELD, always drained first
+- telemetry/  everything else
+A background thread drains the oldest segments of the alarm lane, then of the telemetry
+lane, at no more than drain_rate documents per second, as soon as writes succeed again.
+
+The spool is bounded by max_bytes: when full, the oldest telemetry segments are evicted
+first; alarm segments only go once no telemetry is left. Segment files are written to a
+temporary name and renamed into place, and claimed for draining by renaming them again,
+so several worker processes can share one directory without writing a segment twice.
+"""
+
+import glob
+import logging
+import os
+import re
+import threading
+import time
+
+import bson
+
+LANES = ("alarm", "telemetry")  # drain order
+_SEGMENT_SUFFIX = ".seg"
+# <ns timestamp>-<pid>-<counter>-n<documents>.seg: sorts oldest first, depth without reading files.
+_COUNT_RE = re.compile(r"-n(\d+)\.seg$")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by someone else
+    return True
+
+
+class DiskSpool:
+    """Bounded on-disk queue of failed bridge documents with a rate-limited background drain."""
+
+    def __init__(self, directory, write_documents, is_alarm, max_bytes=256 * 1024 * 1024,
+                 drain_rate=500.0, retry_seconds=30.0):
+        """
+        write_documents(docs) -> list of documents that still failed; is_alarm(doc) -> bool.
+        """
+        self.directory = directory
+        self.write_documents = write_documents
+        self.is_alarm = is_alarm
+        self.max_bytes = max_bytes
+        self.drain_rate = drain_rate
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._drainer = None
+        self._counter = 0
+        self._spooled = 0
+        self._drained = 0
+        self._dropped = 0
+        self._last_drain_rate = 0.0
+        for lane in LANES:
+            os.makedirs(os.path.join(directory, lane), exist_ok=True)
+        self._reclaim_orphans()
+
+    # --- Segments --------------------------------------------------------------------------
+
+    def _segments(self, lane):
+        """Unclaimed segment paths of a lane, oldest first (names start with a ns timestamp)."""
+        return sorted(glob.glob(os.path.join(self.directory, lane, "*" + _SEGMENT_SUFFIX)))
+
+    def _reclaim_orphans(self):
+        """
+        Return segments claimed by a process that no longer exists to the queue. Runs before this
+        spool claims anything, so a claim carrying our own pid is from an earlier incarnation
+        that had the same pid (containers and Function hosts reuse pids after a restart).
+        """
+        for lane in LANES:
+            for path in glob.glob(os.path.join(self.directory, lane, "*" + _SEGMENT_SUFFIX + ".*")):
+                try:
+                    pid = int(path.rsplit(".", 1)[1])
+                except ValueError:
+                    continue
+                if pid == os.getpid() or not _pid_alive(pid):
+                    os.replace(path, path.rsplit(".", 1)[0])
+
+    @staticmethod
+    def _write_file(path, docs):
+        """Write docs to path atomically (temporary file + rename)."""
+        with open(path + ".tmp", "wb") as f:
+            f.write(b"".join(bson.encode(doc) for doc in docs))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _write_segment(self, lane, docs):
+        with self._lock:
+            self._counter += 1
+            name = f"{time.time_ns():020d}-{os.getpid()}-{self._counter:06d}-n{len(docs)}{_SEGMENT_SUFFIX}"
+        self._write_file(os.path.join(self.directory, lane, name), docs)
+
+    @staticmethod
+    def _count(path):
+        match = _COUNT_RE.search(path)
+        return int(match.group(1)) if match else 0
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _enforce_bound(self):
+        """Evict the oldest segments, telemetry before alarms, until the spool fits max_bytes."""
+        segments = {lane: self._segments(lane) for lane in LANES}
+        total = sum(self._size(path) for paths in segments.values() for path in paths)
+        for lane in reversed(LANES):
+            for path in segments[lane]:
+                if total <= self.max_bytes:
+                    return
+                size = self._size(path)
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue  # claimed by a drainer meanwhile
+                total -= size
+                count = self._count(path)
+                self._dropped += count
+                log = logging.error if lane == "alarm" else logging.warning
+                log(f"Bridge spool full ({self.max_bytes} bytes): dropped {count} {lane} document(s)")
+
+    # --- Public API ------------------------------------------------------------------------
+
+    def append(self, docs):
+        """Spool documents that could not be written, split by lane, and start the drainer."""
+        if not docs:
+            return
+        alarms = [doc for doc in docs if self.is_alarm(doc)]
+        others = [doc for doc in docs if not self.is_alarm(doc)]
+        for lane, lane_docs in (("alarm", alarms), ("telemetry", others)):
+            if lane_docs:
+                self._write_segment(lane, lane_docs)
+        self._spooled += len(docs)
+        self._enforce_bound()
+        logging.warning(f"Spooled {len(docs)} document(s) ({len(alarms)} alarm) to {self.directory}")
+        self._ensure_drainer()
+
+    def notify_write_succeeded(self):
+        """Cosmos accepted a write: drain now instead of waiting for the retry interval."""
+        if self._drainer is not None and self._drainer.is_alive():
+            self._wake.set()
+        elif any(self._segments(lane) for lane in LANES):
+            self._ensure_drainer()
+
+    def drain_once(self):
+        """
+        Drain claimable segments in lane order until the spool is empty or a write fails.
+        Returns True when everything was drained.
+        """
+        for lane in LANES:
+            for path in self._segments(lane):
+                claimed = f"{path}.{os.getpid()}"
+                try:
+                    os.replace(path, claimed)
+                except OSError:
+                    continue  # another process claimed it
+                with open(claimed, "rb") as f:
+                    docs = bson.decode_all(f.read())
+                started = time.perf_counter()
+                try:
+                    failed = self.write_documents(docs)
+                except Exception:
+                    os.replace(claimed, path)  # release the claim
+                    raise
+                drained = len(docs) - len(failed)
+                self._drained += drained
+                if failed:
+                    # Keep the undrained rest at the front of the lane (same timestamp) and back off.
+                    self._write_file(_COUNT_RE.sub(f"-n{len(failed)}{_SEGMENT_SUFFIX}", path), failed)
+                    os.remove(claimed)
+                    return False
+                os.remove(claimed)
+                if self.drain_rate > 0:
+                    pause = drained / self.drain_rate - (time.perf_counter() - started)
+                    if pause > 0:
+                        time.sleep(pause)
+                elapsed = time.perf_counter() - started
+                if elapsed > 0:
+                    self._last_drain_rate = drained / elapsed
+        return not any(self._segments(lane) for lane in LANES)
+
+    def metrics(self):
+        """Spool depth (documents, bytes, segments per lane) and drain counters of this process."""
+        depth = {}
+        total_bytes = 0
+        for lane in LANES:
+            segments = self._segments(lane)
+            total_bytes += sum(self._size(path) for path in segments)
+            depth[lane] = {"segments": len(segments), "documents": sum(self._count(path) for path in segments)}
+        return {
+            "depth_documents": sum(lane["documents"] for lane in depth.values()),
+            "depth_alarm_documents": depth["alarm"]["documents"],
+            "depth_bytes": total_bytes,
+            "segments": sum(lane["segments"] for lane in depth.values()),
+            "spooled_total": self._spooled,
+            "drained_total": self._drained,
+            "dropped_total": self._dropped,
+            "drain_rate_docs_per_second": self._last_drain_rate,
+        }
+
+    # --- Background drain ------------------------------------------------------------------
+
+    def _ensure_drainer(self):
+        with self._lock:
+            if self._drainer is None or not self._drainer.is_alive():
+                self._drainer = threading.Thread(target=self._drain_loop, name="bridge-spool-drain", daemon=True)
+                self._drainer.start()
+
+    def _drain_loop(self):
+        while True:
+            # Give the failing write path time to recover; a successful batch wakes us early.
+            self._wake.wait(self.retry_seconds)
+            self._wake.clear()
+            try:
+                if self.drain_once():
+                    logging.info(f"Bridge spool drained: {self.metrics()}")
+                    return
+            except Exception as e:
+                logging.error(f"Bridge spool drain failed: {e}")
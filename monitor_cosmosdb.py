@@ -4,11 +4,15 @@ Includes phone call functionality when alarms are detected
 """
 
 import os
+import itertools
 import json
+import threading
+import time
 from datetime import datetime, timedelta
 from pymongo import MongoClient
-import time
+from urllib.parse import urlparse, unquote
 import sys
+from collections import deque
 
 # Azure Communication Services for phone calls
 try:
@@ -19,6 +23,8 @@ except ImportError:
     print("⚠️  azure-communication-callautomation not installed. Phone calls will be disabled.")
     print("   Install with: pip install azure-communication-callautomation")
 
+STARTUP_STARTED = time.perf_counter()  # for the time-to-first-screen measurement
+
 # Load configuration from local_data.json
 config_path = os.path.join(os.path.dirname(__file__), "local_data.json")
 with open(config_path, 'r') as f:
@@ -34,6 +40,94 @@ PHONE_NUMBER_TO_CALL = config.get("phone_number_to_call", "")
 COMMUNICATION_SERVICE_CONNECTION_STRING = config.get("communication_service_connection_string", "")
 COMMUNICATION_SERVICE_PHONE_NUMBER = config.get("communication_service_phone_number", "")
 
+# Collection discovery results cached between runs
+DISCOVERY_CACHE_FILE = os.path.join(os.path.dirname(__file__), ".monitor_cache.json")
+
+# One long-lived client for the whole session (see get_client)
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Return the shared CosmosDB client, creating it on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            parsed = urlparse(MONGODB_CONNECTION_STRING)
+            username = unquote(parsed.username) if parsed.username else ""
+            password = unquote(parsed.password) if parsed.password else ""
+            host = parsed.hostname
+            port = parsed.port or 10255
+            
+            # CosmosDB-compatible options; connections are kept alive and reused between refreshes
+            # PyMongo 3.12.3 should work with older wire versions
+            _client = MongoClient(
+                host=host,
+                port=port,
+                username=username,
+                password=password,
+                authSource=COSMOS_DATABASE,
+                tls=True,
+                tlsAllowInvalidCertificates=True,
+                retryWrites=False,
+                serverSelectionTimeoutMS=10000,
+                connectTimeoutMS=10000,
+                socketTimeoutMS=10000,
+                maxPoolSize=4,
+                minPoolSize=1,
+                maxIdleTimeMS=300000,
+            )
+        return _client
+
+def reset_client():
+    """Close the shared client so the next cycle reconnects"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            try:
+                _client.close()
+            except:
+                pass
+        _client = None
+
+def load_discovery_cache():
+    """Load cached collection discovery results"""
+    try:
+        with open(DISCOVERY_CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except:
+        return {}
+
+def save_discovery_cache(cache):
+    """Save collection discovery results"""
+    try:
+        with open(DISCOVERY_CACHE_FILE, 'w') as f:
+            json.dump(cache, f)
+    except Exception as e:
+        print(f"Warning: Could not save discovery cache: {e}")
+
+def discover_collection(common_names):
+    """Find the telemetry collection with one list_collection_names() call (cached on disk)"""
+    cache = load_discovery_cache()
+    cache_key = f"{urlparse(MONGODB_CONNECTION_STRING).hostname}/{COSMOS_DATABASE}"
+    if cache.get(cache_key):
+        print(f"   ✓ Using cached collection: {cache[cache_key]}")
+        return cache[cache_key]
+    
+    db = get_client()[COSMOS_DATABASE]
+    existing = db.list_collection_names()
+    candidates = [name for name in common_names if name in existing]
+    discovered = None
+    for name in candidates:
+        # Try to find a document with the alarm field
+        if len(candidates) == 1 or db[name].find_one({ALARM_FIELD: {"$exists": True}}, {"_id": 1}):
+            discovered = name
+            print(f"   ✓ Found collection: {name}")
+            break
+    if discovered:
+        cache[cache_key] = discovered
+        save_discovery_cache(cache)
+    return discovered
+
 # Track last alarm state to avoid duplicate calls (persistent across restarts)
 ALARM_STATE_FILE = os.path.join(os.path.dirname(__file__), ".alarm_state.json")
 
@@ -59,7 +153,7 @@ def save_alarm_state(last_alarm_state, last_call_time):
         with open(ALARM_STATE_FILE, 'w') as f:
             json.dump(data, f)
     except Exception as e:
-        print(f"Warning: Could not save alarm state: {e}")
+        show_message(f"Warning: Could not save alarm state: {e}")
 
 # Load persistent alarm state
 last_alarm_state, last_call_time = load_alarm_state()
@@ -83,35 +177,9 @@ if COSMOS_COLLECTION == "YourCollectionName":
     
     discovered = None
     try:
-        # Quick connection test
-        parsed = urlparse(MONGODB_CONNECTION_STRING)
-        username = unquote(parsed.username) if parsed.username else ""
-        password = unquote(parsed.password) if parsed.password else ""
-        host = parsed.hostname
-        port = parsed.port or 10255
-        
-        test_client = MongoClient(
-            host=host, port=port, username=username, password=password,
-            authSource=COSMOS_DATABASE, tls=True, tlsAllowInvalidCertificates=True,
-            retryWrites=False, serverSelectionTimeoutMS=5000
-        )
-        test_db = test_client[COSMOS_DATABASE]
-        
-        for name in common_names:
-            try:
-                test_col = test_db[name]
-                # Try to find a document with the alarm field
-                sample = test_col.find_one({ALARM_FIELD: {"$exists": True}})
-                if sample:
-                    discovered = name
-                    print(f"   ✓ Found collection: {name}")
-                    break
-            except:
-                pass
-        
-        test_client.close()
-    except:
-        pass
+        discovered = discover_collection(common_names)
+    except Exception as e:
+        print(f"   Discovery failed: {e}")
     
     if discovered:
         COSMOS_COLLECTION = discovered
@@ -131,23 +199,33 @@ def clear_screen():
     """Clear terminal screen"""
     os.system('cls' if os.name == 'nt' else 'clear')
 
+# Set while the dashboard owns the terminal; stdout output would land inside its diff frame
+_status_renderer = None
+
+def show_message(text=""):
+    """Print a status message, or add it to the dashboard status lines in dashboard mode"""
+    if _status_renderer:
+        _status_renderer.add_messages(text)
+    else:
+        print(text)
+
 def make_phone_call(message="Alarm triggered: Test2OPCUA:CallOperator is 1"):
     """Make phone call using Azure Communication Services"""
     if not CALL_AUTOMATION_AVAILABLE:
-        print(f"⚠️  Phone call disabled - azure-communication-callautomation not installed")
+        show_message(f"⚠️  Phone call disabled - azure-communication-callautomation not installed")
         return False
     
     try:
         if not COMMUNICATION_SERVICE_CONNECTION_STRING:
-            print("⚠️  Communication Service connection string not configured")
+            show_message("⚠️  Communication Service connection string not configured")
             return False
         
         if not PHONE_NUMBER_TO_CALL:
-            print("⚠️  Phone number to call not configured")
+            show_message("⚠️  Phone number to call not configured")
             return False
         
         if not COMMUNICATION_SERVICE_PHONE_NUMBER:
-            print("⚠️  Communication Service phone number not configured")
+            show_message("⚠️  Communication Service phone number not configured")
             return False
         
         # Initialize Call Automation Client
@@ -155,7 +233,7 @@ def make_phone_call(message="Alarm triggered: Test2OPCUA:CallOperator is 1"):
             COMMUNICATION_SERVICE_CONNECTION_STRING
         )
         
-        print(f"Making phone call to {PHONE_NUMBER_TO_CALL}...")
+        show_message(f"Making phone call to {PHONE_NUMBER_TO_CALL}...")
         
         # Create call
         try:
@@ -174,17 +252,18 @@ def make_phone_call(message="Alarm triggered: Test2OPCUA:CallOperator is 1"):
                 source_caller_id_number=source_phone
             )
             
-            print(f"[SUCCESS] Call initiated: {call_connection.call_connection_id}")
+            show_message(f"[SUCCESS] Call initiated: {call_connection.call_connection_id}")
             return True
         except Exception as e:
-            print(f"[ERROR] Failed to create call: {e}")
-            print(f"   Error details: {type(e).__name__}")
-            import traceback
-            traceback.print_exc()
+            show_message(f"[ERROR] Failed to create call: {e}")
+            show_message(f"   Error details: {type(e).__name__}")
+            if not _status_renderer:
+                import traceback
+                traceback.print_exc()
             return False
         
     except Exception as e:
-        print(f"❌ Error making phone call: {e}")
+        show_message(f"❌ Error making phone call: {e}")
         return False
 
 def format_timestamp(timestamp):
@@ -218,157 +297,179 @@ def format_timestamp(timestamp):
             return str(timestamp)
     return str(timestamp)
 
+# Rolling 24-hour window kept between refresh cycles: (time_value, doc) pairs, oldest first.
+# Each cycle only fetches documents newer than the high-water mark and evicts from the left.
+WINDOW_HOURS = 24
+DISPLAY_LIMIT = int(config.get("display_limit", 100))
+MONITOR_FIELDS = config.get("monitor_fields") or [
+    config.get("unit_id_field", "device_id"),
+    ALARM_FIELD, CALL_SERVICE_FIELD, "Test2OPCUA:VolumeTreated",
+    "test_alarm", "created_by", "source", "ingest_source",
+]
+UNIT_ID_FIELD = config.get("unit_id_field", "device_id")
+CANONICAL_TS_FIELD = config.get("canonical_ts_field", "ts_utc_ns")  # UTC ns stamped by iot_to_cosmos_bridge
+document_window = deque()
+unit_latest = {}  # unit id -> most recent document, updated as new documents arrive
+window_high_water = None
+window_ids_at_high_water = set()
+timestamp_format = None  # (field, to_field_value) detected once from a sample document
+
+
+def detect_timestamp_format(sample):
+    """
+    Pick the timestamp field of the collection from a sample document.
+    Returns (field, to_field_value) where to_field_value converts a datetime into the
+    field's own units, or (None, None) when no recognized field exists.
+    """
+    windows_epoch = datetime(1601, 1, 1)
+    unix_epoch = datetime(1970, 1, 1)
+    for field in [CANONICAL_TS_FIELD, 'timestamp', '_ts', 'time', 'date', '_id']:
+        if field not in sample:
+            continue
+        timestamp_value = sample[field]
+        if field == CANONICAL_TS_FIELD:
+            # Canonical UTC nanoseconds: one indexed range, no per-format handling
+            return field, lambda dt: (dt - unix_epoch) // timedelta(microseconds=1) * 1000
+        if field == 'timestamp' and isinstance(timestamp_value, (int, float)):
+            # Could be FILETIME, nanoseconds, microseconds, milliseconds, or seconds
+            if 1.3e17 <= timestamp_value <= 1.5e17:  # Windows FILETIME
+                return field, lambda dt: int((dt - windows_epoch).total_seconds() * 1e7)
+            elif timestamp_value > 1e15:  # Nanoseconds (e.g., 134075122252005310)
+                return field, lambda dt: int(dt.timestamp() * 1e9)
+            elif timestamp_value > 1e12:  # Microseconds
+                return field, lambda dt: int(dt.timestamp() * 1e6)
+            elif timestamp_value > 1e9:  # Milliseconds
+                return field, lambda dt: int(dt.timestamp() * 1e3)
+            else:  # Seconds
+                return field, lambda dt: int(dt.timestamp())
+        elif field == '_ts':
+            # _ts is Unix timestamp
+            return field, lambda dt: int(dt.timestamp())
+        elif field == '_id':
+            # _id might be ObjectId with timestamp
+            from bson import ObjectId
+            try:
+                ObjectId(sample['_id'])
+                return field, lambda dt: ObjectId.from_datetime(dt)
+            except:
+                pass
+    return None, None
+
+
+def find_latest(collection, projection=None, limit=DISPLAY_LIMIT):
+    """
+    Newest documents first. Sorted by the canonical ingest timestamp; `_id` order is only used
+    for ObjectIds, since the bridge's "<partition>:<offset>:<seq>" ids do not sort by time.
+    """
+    docs = list(collection.find({CANONICAL_TS_FIELD: {"$exists": True}}, projection).sort(CANONICAL_TS_FIELD, -1).limit(limit))
+    if docs:
+        return docs
+    return list(collection.find({"_id": {"$type": "objectId"}}, projection).sort("_id", -1).limit(limit))
+
+
 def get_documents_last_24h():
-    """Get documents from last 24 hours"""
+    """Get documents from last 24 hours (incrementally, from the in-memory window)"""
+    global timestamp_format, window_high_water, window_ids_at_high_water
     try:
-        # CosmosDB MongoDB API connection with compatibility settings
-        # Parse connection string properly
-        from urllib.parse import urlparse, unquote
-        
-        parsed = urlparse(MONGODB_CONNECTION_STRING)
-        username = unquote(parsed.username) if parsed.username else ""
-        password = unquote(parsed.password) if parsed.password else ""
-        host = parsed.hostname
-        port = parsed.port or 10255
-        
-        # Connect directly with CosmosDB-compatible options
-        # PyMongo 3.12.3 should work with older wire versions
-        client = MongoClient(
-            host=host,
-            port=port,
-            username=username,
-            password=password,
-            authSource=COSMOS_DATABASE,
-            tls=True,
-            tlsAllowInvalidCertificates=True,
-            retryWrites=False,
-            serverSelectionTimeoutMS=10000,
-            connectTimeoutMS=10000,
-            socketTimeoutMS=10000
-        )
-        
-        # Test connection with a simple operation
-        try:
-            # Try to list databases first (lighter operation)
-            client.list_database_names()
-        except Exception as e:
-            # If that fails, try direct access
-            print(f"⚠️  Connection warning: {e}")
-            pass
-        
+        # Reuse the long-lived CosmosDB client (no per-cycle connect or connection test)
+        client = get_client()
         db = client[COSMOS_DATABASE]
         collection = db[COSMOS_COLLECTION]
         
         # Calculate 24 hours ago (adjust local time -1 hour for DB comparison)
         now = datetime.utcnow() - timedelta(hours=1)
-        last_24h = now - timedelta(hours=24)
-        
-        # Get a sample document to understand the structure
-        sample = collection.find_one(sort=[("_id", -1)])
-        if not sample:
-            print("⚠️  No documents found in collection")
-            return None, None
-        
-        # Try different timestamp fields and formats
-        timestamp_fields = ['timestamp', '_ts', 'time', 'date', '_id']
-        timestamp_field = None
-        query = {}
-        
-        # Check timestamp field format
-        for field in timestamp_fields:
-            if field in sample:
-                timestamp_value = sample[field]
-                
-                if field == 'timestamp':
-                    # Handle different timestamp formats
-                    if isinstance(timestamp_value, (int, float)):
-                        # Could be FILETIME, nanoseconds, microseconds, milliseconds, or seconds
-                        # Try to determine the format
-                        if 1.3e17 <= timestamp_value <= 1.5e17:  # Windows FILETIME
-                            # Convert 24 hours ago to FILETIME
-                            windows_epoch = datetime(1601, 1, 1)
-                            last_24h_filetime = int((last_24h - windows_epoch).total_seconds() * 1e7)
-                            query = {"timestamp": {"$gte": last_24h_filetime}}
-                            timestamp_field = field
-                            break
-                        elif timestamp_value > 1e15:  # Nanoseconds (e.g., 134075122252005310)
-                            # Convert 24 hours ago to nanoseconds
-                            last_24h_ns = int((last_24h.timestamp()) * 1e9)
-                            query = {"timestamp": {"$gte": last_24h_ns}}
-                            timestamp_field = field
-                            break
-                        elif timestamp_value > 1e12:  # Microseconds
-                            last_24h_us = int((last_24h.timestamp()) * 1e6)
-                            query = {"timestamp": {"$gte": last_24h_us}}
-                            timestamp_field = field
-                            break
-                        elif timestamp_value > 1e9:  # Milliseconds
-                            last_24h_ms = int((last_24h.timestamp()) * 1e3)
-                            query = {"timestamp": {"$gte": last_24h_ms}}
-                            timestamp_field = field
-                            break
-                        else:  # Seconds
-                            query = {"timestamp": {"$gte": int(last_24h.timestamp())}}
-                            timestamp_field = field
-                            break
-                elif field == '_ts':
-                    # _ts is Unix timestamp
-                    query = {"_ts": {"$gte": int(last_24h.timestamp())}}
-                    timestamp_field = field
-                    break
-                elif field == '_id':
-                    # _id might be ObjectId with timestamp
-                    from bson import ObjectId
-                    try:
-                        obj_id = ObjectId(sample['_id'])
-                        query = {"_id": {"$gte": ObjectId.from_datetime(last_24h)}}
-                        timestamp_field = field
-                        break
-                    except:
-                        pass
-        
-        # If timestamp field found, use query; otherwise get last 100 documents
+        last_24h = now - timedelta(hours=WINDOW_HOURS)
+        
+        # Detect the timestamp field/format once from a sample document
+        if timestamp_format is None:
+            sample = next(iter(find_latest(collection, limit=1)), None) or collection.find_one()
+            if not sample:
+                show_message("⚠️  No documents found in collection")
+                return None, None
+            timestamp_format = detect_timestamp_format(sample)
+        timestamp_field, to_field_value = timestamp_format
+        
+        projection = {field: 1 for field in MONITOR_FIELDS}
+        # Needed by the old-alarm guard in check_alarm_and_call, whatever field the window uses
+        projection[CANONICAL_TS_FIELD] = 1
+        projection['timestamp'] = 1
         if timestamp_field:
-            # Try query first, but if it returns too few results, get more documents
-            documents = list(collection.find(query).sort("_id", -1).limit(100))
+            projection[timestamp_field] = 1
+            if timestamp_field == CANONICAL_TS_FIELD:
+                # The canonical field is real UTC, so it needs no -1 hour adjustment
+                cutoff = to_field_value(datetime.utcnow() - timedelta(hours=WINDOW_HOURS))
+            else:
+                cutoff = to_field_value(last_24h)
+            
+            # Only fetch what arrived since the last cycle ($gte + id set keeps same-timestamp docs)
+            lower = cutoff if window_high_water is None or window_high_water < cutoff else window_high_water
+            query = {timestamp_field: {"$gte": lower}}
+            for doc in collection.find(query, projection).sort(timestamp_field, 1):
+                value = doc.get(timestamp_field)
+                if value is None or doc['_id'] in window_ids_at_high_water:
+                    continue
+                if window_high_water is None or value > window_high_water:
+                    window_high_water = value
+                    window_ids_at_high_water = set()
+                window_ids_at_high_water.add(doc['_id'])
+                document_window.append((value, doc))
+                unit_latest[doc.get(UNIT_ID_FIELD, "-")] = doc
+            
+            # Evict entries that fell out of the 24h window (oldest are on the left)
+            while document_window and document_window[0][0] < cutoff:
+                document_window.popleft()
+            
+            documents = [doc for _, doc in itertools.islice(reversed(document_window), DISPLAY_LIMIT)]
             if len(documents) < 5:  # If query returns very few, get more documents
                 # Get last 100 documents regardless of timestamp
-                all_docs = list(collection.find().sort("_id", -1).limit(100))
+                all_docs = find_latest(collection, projection)
                 if len(all_docs) > len(documents):
-                    print(f"⚠️  Query returned {len(documents)} document(s), showing last {len(all_docs)} documents instead")
+                    show_message(f"⚠️  Query returned {len(documents)} document(s), showing last {len(all_docs)} documents instead")
                     documents = all_docs
         else:
-            print("⚠️  No recognized timestamp field found, showing last 100 documents")
-            documents = list(collection.find().sort("_id", -1).limit(100))
+            show_message("⚠️  No recognized timestamp field found, showing last 100 documents")
+            documents = find_latest(collection)
         
         # Filter out test alarms from display (but keep them for alarm checking)
         # We'll show them but mark them clearly
         
-        client.close()
         return documents, timestamp_field
         
     except Exception as e:
-        print(f"❌ Error connecting to CosmosDB: {e}")
+        show_message(f"❌ Error connecting to CosmosDB: {e}")
+        reset_client()
         return None, None
 
-def display_documents(documents, timestamp_field):
-    """Display documents in a formatted way"""
-    clear_screen()
-    
-    print("=" * 80)
-    print(f"COSMOSDB MONITOR - Last 24 Hours")
-    print(f"Database: {COSMOS_DATABASE} | Collection: {COSMOS_COLLECTION}")
-    print(f"Alarm Field: {ALARM_FIELD}")
-    print(f"Last Update: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("=" * 80)
-    print()
-    
-    if not documents:
-        print("⚠️  No documents found in the last 24 hours")
-        return
-    
-    print(f"📊 Found {len(documents)} document(s)\n")
-    
+def alarm_age_seconds(doc):
+    """
+    Age of a document in seconds, or None if it carries no usable time.
+    Prefers the canonical UTC field; legacy documents fall back to `timestamp`
+    (local time, compared with the -1 hour adjustment used elsewhere in this script).
+    """
+    canonical = doc.get(CANONICAL_TS_FIELD)
+    if isinstance(canonical, int) and not isinstance(canonical, bool):
+        doc_time = datetime(1970, 1, 1) + timedelta(microseconds=canonical // 1000)
+        return (datetime.utcnow() - doc_time).total_seconds()
+
+    ts_value = doc.get('timestamp')
+    if not isinstance(ts_value, (int, float)) or isinstance(ts_value, bool):
+        return None
+    if 1.3e17 <= ts_value <= 1.5e17:  # Windows FILETIME
+        doc_timestamp = datetime(1601, 1, 1) + timedelta(microseconds=ts_value / 10)
+    elif ts_value > 1e15:  # Nanoseconds
+        doc_timestamp = datetime.fromtimestamp(ts_value / 1e9)
+    elif ts_value > 1e12:  # Microseconds
+        doc_timestamp = datetime.fromtimestamp(ts_value / 1e6)
+    elif ts_value > 1e9:  # Milliseconds
+        doc_timestamp = datetime.fromtimestamp(ts_value / 1e3)
+    else:  # Seconds
+        doc_timestamp = datetime.fromtimestamp(ts_value)
+    current_time_adjusted = datetime.now() - timedelta(hours=1)
+    return (current_time_adjusted - doc_timestamp).total_seconds()
+
+
+def check_alarm_and_call(documents):
+    """Check the most recent document for an alarm and place a phone call if needed"""
     # Check for test alarm trigger first (before checking real documents)
     check_test_alarm_trigger()
     
@@ -384,31 +485,12 @@ def display_documents(documents, timestamp_field):
         # Check if the most recent document has an alarm and make phone call
         if most_recent_alarm_value == 1:
             # Check document age - don't call for old alarms (older than 10 minutes)
-            doc_timestamp = None
-            if 'timestamp' in most_recent_doc:
-                ts_value = most_recent_doc['timestamp']
-                if isinstance(ts_value, (int, float)):
-                    if 1.3e17 <= ts_value <= 1.5e17:  # Windows FILETIME
-                        windows_epoch = datetime(1601, 1, 1)
-                        doc_timestamp = windows_epoch + timedelta(microseconds=ts_value / 10)
-                    elif ts_value > 1e15:  # Nanoseconds
-                        doc_timestamp = datetime.fromtimestamp(ts_value / 1e9)
-                    elif ts_value > 1e12:  # Microseconds
-                        doc_timestamp = datetime.fromtimestamp(ts_value / 1e6)
-                    elif ts_value > 1e9:  # Milliseconds
-                        doc_timestamp = datetime.fromtimestamp(ts_value / 1e3)
-                    else:  # Seconds
-                        doc_timestamp = datetime.fromtimestamp(ts_value)
-            
-            # If document is older than 10 minutes, consider it "old" and don't call
-            # Adjust local time -1 hour for DB comparison
             is_old_alarm = False
-            if doc_timestamp:
-                current_time_adjusted = datetime.now() - timedelta(hours=1)
-                age_seconds = (current_time_adjusted - doc_timestamp).total_seconds()
+            age_seconds = alarm_age_seconds(most_recent_doc)
+            if age_seconds is not None:
                 if age_seconds > 600:  # 10 minutes
                     is_old_alarm = True
-                    print(f"\nℹ️  Alarm detected but document is old ({int(age_seconds/60)} min old) - skipping call")
+                    show_message(f"\nℹ️  Alarm detected but document is old ({int(age_seconds/60)} min old) - skipping call")
             
             # Only make call if alarm state changed AND it's not an old alarm
             if not is_old_alarm and last_alarm_state.get(most_recent_doc_id) != 1:
@@ -419,35 +501,56 @@ def display_documents(documents, timestamp_field):
                 time_since_last_call = (current_time_adjusted - last_call).total_seconds()
                 
                 if time_since_last_call > 300:  # 5 minutes cooldown
-                    print(f"\n{'=' * 80}")
-                    print(f"⚠️  ALARM TRIGGERED in most recent document!")
-                    print(f"   Making phone call...")
-                    print(f"{'=' * 80}\n")
+                    show_message(f"\n{'=' * 80}")
+                    show_message(f"⚠️  ALARM TRIGGERED in most recent document!")
+                    show_message(f"   Making phone call...")
+                    show_message(f"{'=' * 80}\n")
                     alarm_message = f"ALARM: {ALARM_FIELD} is active. Check system immediately."
                     call_success = make_phone_call(alarm_message)
                     if call_success:
                         # Store time with -1 hour adjustment
                         last_call_time[most_recent_doc_id] = datetime.now() - timedelta(hours=1)
-                        print(f"[SUCCESS] Phone call initiated successfully!")
+                        show_message(f"[SUCCESS] Phone call initiated successfully!")
                     else:
-                        print(f"[ERROR] Phone call failed. Check configuration.")
+                        show_message(f"[ERROR] Phone call failed. Check configuration.")
                     last_alarm_state[most_recent_doc_id] = 1
                     save_alarm_state(last_alarm_state, last_call_time)
                 else:
                     minutes_left = int((300 - time_since_last_call) / 60)
-                    print(f"\n⚠️  Alarm detected but call cooldown active ({minutes_left} min remaining)")
+                    show_message(f"\n⚠️  Alarm detected but call cooldown active ({minutes_left} min remaining)")
             elif is_old_alarm:
                 # Old alarm - mark as seen but don't call
                 last_alarm_state[most_recent_doc_id] = 1
                 save_alarm_state(last_alarm_state, last_call_time)
             else:
-                print(f"\nℹ️  Alarm still active (call already made for this alarm)")
+                show_message(f"\nℹ️  Alarm still active (call already made for this alarm)")
         else:
             if last_alarm_state.get(most_recent_doc_id) == 1:
-                print(f"\n✅ Alarm cleared in most recent document: {ALARM_FIELD} = {most_recent_alarm_value}")
+                show_message(f"\n✅ Alarm cleared in most recent document: {ALARM_FIELD} = {most_recent_alarm_value}")
             last_alarm_state[most_recent_doc_id] = most_recent_alarm_value
             save_alarm_state(last_alarm_state, last_call_time)
     
+
+def display_documents(documents, timestamp_field):
+    """Display documents in a formatted way"""
+    clear_screen()
+    
+    print("=" * 80)
+    print(f"COSMOSDB MONITOR - Last 24 Hours")
+    print(f"Database: {COSMOS_DATABASE} | Collection: {COSMOS_COLLECTION}")
+    print(f"Alarm Field: {ALARM_FIELD}")
+    print(f"Last Update: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 80)
+    print()
+    
+    if not documents:
+        print("⚠️  No documents found in the last 24 hours")
+        return
+    
+    print(f"📊 Found {len(documents)} document(s)\n")
+    
+    check_alarm_and_call(documents)
+
     print()
     
     # Display documents
@@ -523,13 +626,124 @@ def display_documents(documents, timestamp_field):
             print(f"  ... and {len(doc) - field_count - 3} more fields")
     
     print(f"\n{'─' * 80}")
-    print(f"\nRefreshing every 30 seconds... (Press Ctrl+C to stop)")
+    print(f"\nRefreshing every {REFRESH_INTERVAL_SECONDS:.0f} seconds... (Press 'r' + Enter to refresh now, Ctrl+C to stop)")
     print(f"Note: Old alarms (>10 min) won't trigger calls")
     print()
 
+# Dashboard mode: redraw only changed lines instead of clearing and reprinting every document
+DASHBOARD_MODE = bool(config.get("dashboard_mode", False)) or "--dashboard" in sys.argv
+DASHBOARD_PAGE_SIZE = int(config.get("dashboard_page_size", 20))
+
+def document_time_str(doc, timestamp_field):
+    """Short timestamp text for one dashboard row"""
+    if not timestamp_field or timestamp_field not in doc:
+        return "-"
+    value = doc[timestamp_field]
+    if timestamp_field == '_ts':
+        return datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S')
+    if timestamp_field == '_id':
+        from bson import ObjectId
+        try:
+            return ObjectId(value).generation_time.strftime('%Y-%m-%d %H:%M:%S')
+        except:
+            return str(value)
+    return format_timestamp(value)
+
+def alarm_status_text(alarm_value):
+    """Alarm status label used by both display modes"""
+    return "🔴 ALARM ACTIVE" if alarm_value == 1 else "🟢 OK" if alarm_value == 0 else "⚪ UNKNOWN"
+
+class DashboardRenderer:
+    """
+    ANSI diff renderer: keeps the previous frame and rewrites only the lines that changed,
+    so a refresh with no new data writes nothing to the terminal. History is paged lazily
+    from the in-memory window; only the visible page is formatted.
+    """
+
+    def __init__(self, out=None, page_size=DASHBOARD_PAGE_SIZE):
+        self.out = out or sys.stdout
+        self.page_size = page_size
+        self.page = 0
+        self.previous = []
+        self.messages = deque(maxlen=5)
+
+    def invalidate(self):
+        """Force a full redraw on the next render"""
+        self.previous = []
+
+    def next_page(self):
+        self.page += 1
+
+    def previous_page(self):
+        self.page = max(0, self.page - 1)
+
+    def add_messages(self, text):
+        for line in text.splitlines():
+            # Banner rules of the plain-mode messages are no use in the status lines
+            if line.strip().strip("=─"):
+                self.messages.append(f"{datetime.now().strftime('%H:%M:%S')} {line.strip()}")
+
+    def build_lines(self, timestamp_field):
+        import shutil
+
+        width = shutil.get_terminal_size((120, 40)).columns
+        total = len(document_window)
+        pages = max(1, (total + self.page_size - 1) // self.page_size)
+        self.page = min(self.page, pages - 1)
+
+        lines = [
+            "=" * min(width, 80),
+            f"COSMOSDB MONITOR - Last {WINDOW_HOURS} Hours | {COSMOS_DATABASE}/{COSMOS_COLLECTION} | Alarm Field: {ALARM_FIELD}",
+            f"Last Update: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | {total} document(s) | page {self.page + 1}/{pages} ('n'/'p' + Enter)",
+            "=" * min(width, 80),
+            "UNITS:",
+        ]
+        for unit_id in sorted(unit_latest, key=str):
+            doc = unit_latest[unit_id]
+            lines.append(
+                f"  {str(unit_id):24} {alarm_status_text(doc.get(ALARM_FIELD, 'N/A')):16} "
+                f"last seen {document_time_str(doc, timestamp_field)}"
+            )
+        lines.append("─" * min(width, 80))
+
+        start = self.page * self.page_size
+        rows = itertools.islice(reversed(document_window), start, start + self.page_size)
+        for offset, (_, doc) in enumerate(rows):
+            fields = ", ".join(
+                f"{key}={value}" for key, value in doc.items()
+                if key not in ('_id', '_ts', ALARM_FIELD, timestamp_field)
+            )
+            label = " [MOST RECENT]" if start + offset == 0 else ""
+            lines.append(
+                f"{document_time_str(doc, timestamp_field):19} {alarm_status_text(doc.get(ALARM_FIELD, 'N/A'))}{label} {fields}"
+            )
+        lines.append("─" * min(width, 80))
+        lines.extend(self.messages)
+        return [line[:width - 1] for line in lines]
+
+    def render(self, timestamp_field):
+        lines = self.build_lines(timestamp_field)
+        write = self.out.write
+        if not self.previous:
+            write("\x1b[2J")
+        for row, line in enumerate(lines):
+            if row >= len(self.previous) or self.previous[row] != line:
+                write(f"\x1b[{row + 1};1H\x1b[2K{line}")
+        for row in range(len(lines), len(self.previous)):
+            write(f"\x1b[{row + 1};1H\x1b[2K")
+        write(f"\x1b[{len(lines) + 1};1H")
+        self.out.flush()
+        self.previous = lines
+
+def display_dashboard(renderer, documents, timestamp_field):
+    """Run the alarm check (its messages go to the status lines) and redraw the changed dashboard lines"""
+    if documents:
+        check_alarm_and_call(documents)
+    renderer.render(timestamp_field)
+
 def create_test_alarm():
     """Create a test alarm state locally (without saving to database)"""
-    print("Creating test alarm state (simulated, not saved to database)...")
+    show_message("Creating test alarm state (simulated, not saved to database)...")
     
     # Create a simulated test document ID
     test_doc_id = f"test_alarm_{int(datetime.now().timestamp())}"
@@ -543,9 +757,9 @@ def create_test_alarm():
     
     # Set test alarm state to trigger call on next cycle
     # We'll simulate it by creating a temporary state that will be checked
-    print(f"✅ Test alarm state created (ID: {test_doc_id})")
-    print(f"   This will trigger a phone call on the next monitor cycle")
-    print(f"   Note: No document is saved to the database")
+    show_message(f"✅ Test alarm state created (ID: {test_doc_id})")
+    show_message(f"   This will trigger a phone call on the next monitor cycle")
+    show_message(f"   Note: No document is saved to the database")
     
     # Store test alarm info to trigger call
     # We'll use a special marker that the monitor will recognize
@@ -574,28 +788,7 @@ def create_test_alarm():
 def delete_test_alarms_from_db():
     """Delete test alarm documents from the database"""
     try:
-        from urllib.parse import urlparse, unquote
-        
-        parsed = urlparse(MONGODB_CONNECTION_STRING)
-        username = unquote(parsed.username) if parsed.username else ""
-        password = unquote(parsed.password) if parsed.password else ""
-        host = parsed.hostname
-        port = parsed.port or 10255
-        
-        client = MongoClient(
-            host=host,
-            port=port,
-            username=username,
-            password=password,
-            authSource=COSMOS_DATABASE,
-            tls=True,
-            tlsAllowInvalidCertificates=True,
-            retryWrites=False,
-            serverSelectionTimeoutMS=10000,
-            connectTimeoutMS=10000,
-            socketTimeoutMS=10000
-        )
-        
+        client = get_client()
         db = client[COSMOS_DATABASE]
         collection = db[COSMOS_COLLECTION]
         
@@ -607,13 +800,11 @@ def delete_test_alarms_from_db():
             ]
         })
         
-        client.close()
-        
-        print(f"✅ Deleted {result.deleted_count} test alarm document(s) from database")
+        show_message(f"✅ Deleted {result.deleted_count} test alarm document(s) from database")
         return result.deleted_count
         
     except Exception as e:
-        print(f"❌ Error deleting test alarms: {e}")
+        show_message(f"❌ Error deleting test alarms: {e}")
         return 0
 
 def check_test_alarm_trigger():
@@ -632,18 +823,18 @@ def check_test_alarm_trigger():
                         # Trigger the call
                         doc_id = test_alarm['doc_id']
                         if last_call_time.get(doc_id, datetime.min) != datetime.now():
-                            print(f"\n{'=' * 80}")
-                            print(f"⚠️  TEST ALARM TRIGGERED!")
-                            print(f"   Making phone call...")
-                            print(f"{'=' * 80}\n")
+                            show_message(f"\n{'=' * 80}")
+                            show_message(f"⚠️  TEST ALARM TRIGGERED!")
+                            show_message(f"   Making phone call...")
+                            show_message(f"{'=' * 80}\n")
                             alarm_message = f"TEST ALARM: {ALARM_FIELD} is active. This is a test call."
                             call_success = make_phone_call(alarm_message)
                             if call_success:
                                 # Store time with -1 hour adjustment
                                 last_call_time[doc_id] = datetime.now() - timedelta(hours=1)
-                                print(f"[SUCCESS] Test phone call initiated successfully!")
+                                show_message(f"[SUCCESS] Test phone call initiated successfully!")
                             else:
-                                print(f"[ERROR] Test phone call failed. Check configuration.")
+                                show_message(f"[ERROR] Test phone call failed. Check configuration.")
                             
                             # Clear test alarm trigger
                             test_alarm['trigger_call'] = False
@@ -655,6 +846,49 @@ def check_test_alarm_trigger():
         pass
     return False
 
+REFRESH_INTERVAL_SECONDS = float(config.get("refresh_interval_seconds", 30))
+CHANGE_STREAM_REFRESH = bool(config.get("change_stream_refresh", False))
+# Inserts arriving closer together than this share one redraw
+CHANGE_DEBOUNCE_SECONDS = float(config.get("change_debounce_seconds", 2))
+
+def watch_for_changes(event_queue, stop_monitoring):
+    """Push a refresh event whenever a document is inserted (needs change stream support)"""
+    try:
+        collection = get_client()[COSMOS_DATABASE][COSMOS_COLLECTION]
+        with collection.watch(
+            [{"$match": {"operationType": {"$in": ["insert"]}}},
+             {"$project": {"_id": 1, "fullDocument": 1, "ns": 1, "documentKey": 1}}],
+            max_await_time_ms=1000,
+        ) as stream:
+            while not stop_monitoring.is_set() and stream.alive:
+                if stream.try_next() is not None:
+                    event_queue.put(("change", None))
+    except Exception as e:
+        event_queue.put(("message", f"⚠️  Change stream unavailable, using timed refresh only: {e}"))
+
+def handle_command(user_input, renderer, timestamp_field):
+    """Handle one keyboard command. Returns True when a refresh should follow."""
+    if user_input == '1':
+        show_message("\n📞 Creating test alarm...")
+        create_test_alarm()
+        show_message("   Monitor will check for alarm on the next refresh\n")
+        return True
+    elif user_input == '2':
+        show_message("\n🗑️  Deleting test alarms from database...")
+        deleted = delete_test_alarms_from_db()
+        show_message(f"   Deleted {deleted} test alarm document(s)\n")
+        return True
+    elif user_input == 'r':
+        return True
+    elif renderer and user_input in ('n', 'p'):
+        # Page from the in-memory window without querying the database
+        if user_input == 'n':
+            renderer.next_page()
+        else:
+            renderer.previous_page()
+        renderer.render(timestamp_field)
+    return False
+
 def main():
     """Main monitoring loop"""
     print("🚀 Starting CosmosDB Monitor...")
@@ -664,15 +898,18 @@ def main():
     print("CONTROLS:")
     print("  Press '1' + Enter to create a test alarm (triggers phone call, not saved to DB)")
     print("  Press '2' + Enter to delete test alarms from database")
+    print("  Press 'r' + Enter to refresh now")
+    if DASHBOARD_MODE:
+        print("  Press 'n' / 'p' + Enter to page through history (dashboard mode)")
     print("  Press Ctrl+C to stop monitoring")
     print("=" * 80)
     print()
     
-    # Use threading to handle input while monitoring
-    import threading
+    # Keyboard input, change stream pushes and the refresh timer all feed one event queue;
+    # the loop blocks on it until the next event or the next scheduled refresh.
     import queue
     
-    input_queue = queue.Queue()
+    event_queue = queue.Queue()
     stop_monitoring = threading.Event()
     
     def input_handler():
@@ -681,55 +918,65 @@ def main():
             try:
                 user_input = input().strip()
                 if user_input:
-                    input_queue.put(user_input)
+                    event_queue.put(("command", user_input))
             except:
                 break
     
     # Start input handler thread
     input_thread = threading.Thread(target=input_handler, daemon=True)
     input_thread.start()
+    if CHANGE_STREAM_REFRESH:
+        threading.Thread(target=watch_for_changes, args=(event_queue, stop_monitoring), daemon=True).start()
+    
+    global _status_renderer
+    renderer = DashboardRenderer() if DASHBOARD_MODE else None
+    _status_renderer = renderer
+    timestamp_field = None
     
+    first_screen = True
+    next_refresh = time.monotonic()
+    last_refresh = float("-inf")
     try:
         while True:
-            # Check for user input
+            if time.monotonic() >= next_refresh:
+                documents, timestamp_field = get_documents_last_24h()
+                if documents is not None and renderer:
+                    display_dashboard(renderer, documents, timestamp_field)
+                elif documents is not None:
+                    display_documents(documents, timestamp_field)
+                else:
+                    show_message("❌ Failed to retrieve documents")
+                    if renderer:
+                        renderer.render(timestamp_field)
+                if first_screen:
+                    show_message(f"⏱️  Time to first screen: {(time.perf_counter() - STARTUP_STARTED) * 1000:.0f} ms")
+                    if renderer:
+                        # The diff render only rewrites the new status line
+                        renderer.render(timestamp_field)
+                    first_screen = False
+                last_refresh = time.monotonic()
+                next_refresh = last_refresh + REFRESH_INTERVAL_SECONDS
+            
+            # Sleep until an event arrives or the next refresh is due (no polling)
             try:
-                user_input = input_queue.get_nowait()
-                if user_input == '1':
-                    print("\n📞 Creating test alarm...")
-                    create_test_alarm()
-                    print("   Monitor will check for alarm on next cycle (30 seconds)\n")
-                elif user_input == '2':
-                    print("\n🗑️  Deleting test alarms from database...")
-                    deleted = delete_test_alarms_from_db()
-                    print(f"   Deleted {deleted} test alarm document(s)\n")
+                kind, value = event_queue.get(timeout=max(0.0, next_refresh - time.monotonic()))
             except queue.Empty:
-                pass
-            
-            documents, timestamp_field = get_documents_last_24h()
-            if documents is not None:
-                display_documents(documents, timestamp_field)
-            else:
-                print("❌ Failed to retrieve documents")
+                continue
             
-            # Wait 30 seconds, but check for input periodically
-            for _ in range(30):
-                time.sleep(1)
-                # Check for user input during wait
-                try:
-                    user_input = input_queue.get_nowait()
-                    if user_input == '1':
-                        print("\n📞 Creating test alarm...")
-                        create_test_alarm()
-                        print("   Monitor will check for alarm on next cycle\n")
-                    elif user_input == '2':
-                        print("\n🗑️  Deleting test alarms from database...")
-                        deleted = delete_test_alarms_from_db()
-                        print(f"   Deleted {deleted} test alarm document(s)\n")
-                except queue.Empty:
-                    pass
+            if kind == "command":
+                if handle_command(value, renderer, timestamp_field):
+                    next_refresh = time.monotonic()
+                if renderer and value in ('1', '2'):
+                    renderer.invalidate()
+            elif kind == "change":
+                # Debounced: a burst of inserts moves the refresh forward once, not once per insert
+                next_refresh = min(next_refresh, max(time.monotonic(), last_refresh + CHANGE_DEBOUNCE_SECONDS))
+            elif kind == "message":
+                show_message(value)
             
     except KeyboardInterrupt:
         stop_monitoring.set()
+        reset_client()
         print("\n\n👋 Monitoring stopped by user")
         sys.exit(0)
     except Exception as e:
@@ -0,0 +1,162 @@
+"""
+Fault drill for the bridge's disk spool (iot_to_cosmos_bridge.spool).
+
+Telemetry is sent through iot_to_cosmos_bridge.main() into an in-memory collection
+(mongomock) wrapped in a fault injector. During the outage every insert is throttled
+(Cosmos 429) or fails as if the server were down; the failed documents must land in the
+spool. After the outage the drill sends one healthy batch and waits for the background
+drain, then checks that:
+- every event is stored exactly once
+- spooled alarm documents were written before any spooled telemetry
+- the spool is empty, and reports its metrics (depth, drain rate, dropped)
+
+Usage:
+  python spool_fault_drill.py
+  python spool_fault_drill.py --fault down --batches 50 --drain-rate 2000
+  python spool_fault_drill.py --max-bytes 20000   # overflow: telemetry is evicted first
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from benchmark_alarm_pipeline import FakeEvent
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inject Cosmos faults and check the bridge spool")
+    parser.add_argument("--fault", choices=("throttle", "down"), default="throttle")
+    parser.add_argument("--batches", type=int, default=20, help="batches sent during the outage")
+    parser.add_argument("--batch-size", type=int, default=50, help="events per batch")
+    parser.add_argument("--alarm-every", type=int, default=10, help="one alarm document every N events")
+    parser.add_argument("--drain-rate", type=float, default=1000.0, help="BRIDGE_SPOOL_DRAIN_RATE (documents/s)")
+    parser.add_argument("--max-bytes", type=int, default=256 * 1024 * 1024, help="BRIDGE_SPOOL_MAX_BYTES")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for the drain")
+    parser.add_argument("--verbose", action="store_true", help="show the bridge's own logging")
+    return parser.parse_args()
+
+
+class FaultyCollection:
+    """Collection wrapper failing every insert while `failing` is set; records the write order."""
+
+    def __init__(self, collection, fault):
+        self._collection = collection
+        self.fault = fault
+        self.failing = False
+        self.written = []
+        self._lock = threading.Lock()  # mongomock is not thread-safe; the drain runs on its own thread
+
+    def insert_many(self, docs, ordered=True):
+        from pymongo.errors import AutoReconnect, BulkWriteError
+
+        docs = list(docs)
+        with self._lock:
+            if self.failing:
+                if self.fault == "down":
+                    raise AutoReconnect("connection refused (injected)")
+                raise BulkWriteError({
+                    "writeErrors": [
+                        {"index": i, "code": 16500, "errmsg": "Request rate is large. RetryAfterMs=1 (injected)"}
+                        for i in range(len(docs))
+                    ],
+                    "nInserted": 0,
+                })
+            result = self._collection.insert_many(docs, ordered=ordered)
+            self.written.extend(docs)
+            return result
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+def main():
+    args = parse_args()
+    spool_dir = tempfile.mkdtemp(prefix="bridge_spool_drill_")
+    os.environ.setdefault("MongoDBConnectionString", "mongodb://drill.invalid:27017")
+    os.environ.setdefault("COSMOS_DATABASE", "SpoolDrill")
+    os.environ["BRIDGE_MAX_RETRIES"] = "0"
+    os.environ["BRIDGE_SPOOL_ENABLED"] = "true"
+    os.environ["BRIDGE_SPOOL_DIR"] = spool_dir
+    os.environ["BRIDGE_SPOOL_DRAIN_RATE"] = str(args.drain_rate)
+    os.environ["BRIDGE_SPOOL_MAX_BYTES"] = str(args.max_bytes)
+    os.environ["BRIDGE_SPOOL_RETRY_SECONDS"] = "0.5"
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL, format="%(levelname)s %(message)s")
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import iot_to_cosmos_bridge as bridge
+
+    try:
+        import mongomock
+    except ImportError:
+        print("❌ mongomock is not installed; pip install mongomock")
+        return 1
+    collection = FaultyCollection(mongomock.MongoClient()[bridge.COSMOS_DATABASE][bridge.COSMOS_COLLECTION], args.fault)
+    bridge._get_collection = lambda: collection
+
+    filetime = bridge._windows_filetime_now()
+    sequence = 0
+
+    def batch(size):
+        nonlocal filetime, sequence
+        events = []
+        for _ in range(size):
+            filetime += 10
+            sequence += 1
+            if sequence % args.alarm_every == 0:
+                fields = {bridge.ALARM_FIELD: 1, bridge.CALL_SERVICE_FIELD: 1}
+            else:
+                fields = {bridge.VOLUME_TREATED_FIELD: sequence}
+            events.append(FakeEvent({"_timestamp": filetime, "v": [fields]}, "drill-unit", sequence))
+        return events
+
+    print("=" * 80)
+    print(f"Bridge spool fault drill: {args.fault}, {args.batches} x {args.batch_size} events")
+    print("=" * 80)
+
+    collection.failing = True
+    for _ in range(args.batches):
+        bridge.main(batch(args.batch_size))
+    spool = bridge._get_spool()
+    outage = spool.metrics()
+    print(f"During the outage: {outage['depth_documents']} document(s) spooled "
+          f"({outage['depth_alarm_documents']} alarm, {outage['depth_bytes']} bytes, {outage['dropped_total']} dropped)")
+
+    collection.failing = False
+    healed_at = time.perf_counter()
+    bridge.main(batch(args.batch_size))
+    healthy = len(collection.written)
+    while spool.metrics()["depth_documents"] and time.perf_counter() - healed_at < args.timeout:
+        time.sleep(0.05)
+    drain_seconds = time.perf_counter() - healed_at
+    metrics = spool.metrics()
+
+    failures = []
+    stored_ids = [doc["_id"] for doc in collection.find({}, {"_id": 1})]
+    expected = sequence - metrics["dropped_total"]
+    if len(stored_ids) != expected or len(set(stored_ids)) != len(stored_ids):
+        failures.append(f"{len(stored_ids)} document(s) stored, expected {expected} unique")
+    drained = collection.written[healthy:]
+    kinds = [bridge.ALARM_FIELD in doc for doc in drained]
+    if True in kinds and False in kinds and kinds.index(False) < len(kinds) - kinds[::-1].index(True) - 1:
+        failures.append("spooled telemetry was written before spooled alarms")
+    if metrics["depth_documents"]:
+        failures.append(f"{metrics['depth_documents']} document(s) still spooled after {args.timeout:.0f}s")
+
+    print(f"Drained {metrics['drained_total']} document(s) in {drain_seconds:.2f}s "
+          f"(last drain rate {metrics['drain_rate_docs_per_second']:.0f} docs/s, limit {args.drain_rate:.0f})")
+    print(f"Stored {len(stored_ids)} of {sequence} event(s), {metrics['dropped_total']} dropped by the size bound")
+    shutil.rmtree(spool_dir, ignore_errors=True)
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ Spool drained completely, alarms first, no duplicates")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The function folders and root scripts are imported as top-level modules, as the Functions host does.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
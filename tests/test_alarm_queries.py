@@ -0,0 +1,224 @@
+"""Projection and index helpers of the latest-alarm lookup."""
+
+from datetime import timedelta
+
+import pytest
+from pymongo.errors import OperationFailure
+
+import alarm_monitor_function as monitor
+
+mongomock = pytest.importorskip("mongomock")
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    monkeypatch.setattr(monitor, "_alarm_indexes_checked", False)
+    return mongomock.MongoClient()["test"]["telemetry"]
+
+
+def index_names(collection):
+    return {index["name"] for index in collection.list_indexes()} - {"_id_"}
+
+
+def test_projection_reads_only_the_alarm_fields():
+    projection = monitor.get_alarm_projection()
+
+    assert set(projection) == {
+        monitor.ALARM_FIELD, monitor.CALL_SERVICE_FIELD, monitor.VOLUME_TREATED_FIELD,
+        monitor.CANONICAL_TS_FIELD, "_timestamp", "timestamp", "_id",
+    }
+    assert set(projection.values()) == {1}
+
+
+def test_projection_follows_configured_field_names(monkeypatch):
+    monkeypatch.setattr(monitor, "ALARM_FIELD", "Plant:Alarm")
+    monkeypatch.setattr(monitor, "ALARM_PROJECTION_EXTRA_FIELDS", ["Plant:Pressure"])
+    monkeypatch.setattr(monitor, "MULTI_UNIT_MONITORING", True)
+    monkeypatch.setattr(monitor, "PARTITION_BY_UNIT", True)
+    monkeypatch.setattr(monitor, "PARTITION_KEY_FIELD", "site")
+
+    projection = monitor.get_alarm_projection()
+
+    assert {"Plant:Alarm", "Plant:Pressure", monitor.UNIT_ID_FIELD, "site"} <= set(projection)
+    assert "Test2OPCUA:CallOperator" not in projection
+
+
+def test_debug_flag_reads_full_documents(monkeypatch):
+    monkeypatch.setattr(monitor, "ALARM_DEBUG_FULL_DOCUMENT", True)
+    assert monitor.get_alarm_projection() is None
+
+
+def test_projected_find_drops_the_payload(collection):
+    collection.insert_one({
+        monitor.ALARM_FIELD: 1, monitor.CANONICAL_TS_FIELD: 1, "v": [{"Test2OPCUA:Tag1": 2.5}], "Test2OPCUA:Tag1": 2.5,
+    })
+
+    doc = collection.find_one({}, monitor.get_alarm_projection())
+
+    assert set(doc) == {"_id", monitor.ALARM_FIELD, monitor.CANONICAL_TS_FIELD}
+
+
+def test_ensure_alarm_indexes_creates_latest_index_once(collection):
+    monitor.ensure_alarm_indexes(collection)
+    assert "alarm_latest_ts" in index_names(collection)
+    latest = next(index for index in collection.list_indexes() if index["name"] == "alarm_latest_ts")
+    assert list(latest["key"].items()) == [(monitor.CANONICAL_TS_FIELD, -1)]
+
+    collection.drop_indexes()
+    monitor.ensure_alarm_indexes(collection)  # checked once per worker
+    assert index_names(collection) == set()
+
+
+def test_ensure_alarm_indexes_multi_unit_and_partition(collection, monkeypatch):
+    monkeypatch.setattr(monitor, "MULTI_UNIT_MONITORING", True)
+    monkeypatch.setattr(monitor, "PARTITION_BY_UNIT", True)
+    monkeypatch.setattr(monitor, "PARTITION_KEY_FIELD", "site")
+
+    monitor.ensure_alarm_indexes(collection)
+
+    assert {"alarm_latest_ts", "alarm_unit_ts", "alarm_partition_ts"} <= index_names(collection)
+
+
+def test_ensure_alarm_indexes_falls_back_without_partial_indexes(collection):
+    class NoPartialIndexes:
+        """Cosmos-like: rejects partialFilterExpression."""
+
+        def __init__(self, wrapped):
+            self._wrapped = wrapped
+
+        def create_index(self, keys, **kwargs):
+            if "partialFilterExpression" in kwargs:
+                raise OperationFailure("partial indexes are not supported")
+            return self._wrapped.create_index(keys, **kwargs)
+
+        def __getattr__(self, name):
+            return getattr(self._wrapped, name)
+
+    monitor.ensure_alarm_indexes(NoPartialIndexes(collection))
+
+    latest = next(index for index in collection.list_indexes() if index["name"] == "alarm_latest_ts")
+    assert "partialFilterExpression" not in latest
+
+
+def test_ensure_alarm_indexes_can_be_disabled(collection, monkeypatch):
+    monkeypatch.setattr(monitor, "ALARM_INDEX_PROVISIONING", False)
+    monitor.ensure_alarm_indexes(collection)
+    assert index_names(collection) == set()
+
+
+class ThrottlingCollection:
+    """Fails the next `throttled` sorted finds with the given error code, like a throttled Cosmos account."""
+
+    def __init__(self, wrapped, code=16500):
+        self._wrapped = wrapped
+        self.code = code
+        self.throttled = 0
+        self.sorts = []
+
+    def find(self, *args, **kwargs):
+        cursor = self._wrapped.find(*args, **kwargs)
+        collection = self
+
+        class Cursor:
+            def sort(self, key, direction):
+                collection.sorts.append(key)
+                if collection.throttled:
+                    collection.throttled -= 1
+                    raise OperationFailure("Request rate is large", code=collection.code)
+                return cursor.sort(key, direction)
+
+        return Cursor()
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+
+@pytest.fixture
+def lookup(collection, monkeypatch):
+    """check_alarm_in_cosmosdb() against a ThrottlingCollection with two alarm documents."""
+    throttling = ThrottlingCollection(collection)
+    monkeypatch.setattr(monitor, "MONGODB_CONNECTION_STRING", "mongodb://test.invalid")
+    monkeypatch.setattr(monitor, "MATERIALIZED_UNIT_STATE", False)
+    monkeypatch.setattr(monitor, "ALARM_INDEX_PROVISIONING", False)
+    monkeypatch.setattr(monitor, "_alarm_sort_key", None)
+    monkeypatch.setattr(monitor, "get_mongo_client", lambda: {monitor.COSMOS_DATABASE: {monitor.COSMOS_COLLECTION: throttling}})
+    # String ids that sort the wrong way round: an _id sort would pick the older document.
+    collection.insert_many([
+        {"_id": "0:99:99", monitor.ALARM_FIELD: 0, monitor.CANONICAL_TS_FIELD: 2, "_timestamp": 2},
+        {"_id": "0:100:100", monitor.ALARM_FIELD: 1, monitor.CANONICAL_TS_FIELD: 3, "_timestamp": 3},
+    ])
+    return throttling
+
+
+def test_throttled_sort_does_not_latch_the_id_fallback(lookup):
+    lookup.throttled = 1  # a throttle fails the tick instead of ruling the key out
+
+    assert monitor.check_alarm_in_cosmosdb() is None
+    assert monitor._alarm_sort_key is None
+
+    alarm_value, latest_doc, _ = monitor.check_alarm_in_cosmosdb()
+    assert monitor._alarm_sort_key == monitor.CANONICAL_TS_FIELD
+    assert (alarm_value, latest_doc["_id"]) == (1, "0:100:100")
+
+
+def test_throttled_cached_sort_key_is_kept(lookup):
+    monitor.check_alarm_in_cosmosdb()
+    lookup.throttled = 1
+
+    assert monitor.check_alarm_in_cosmosdb() is None
+    assert monitor._alarm_sort_key == monitor.CANONICAL_TS_FIELD
+    assert monitor.check_alarm_in_cosmosdb()[1]["_id"] == "0:100:100"
+
+
+def test_unsupported_sort_falls_back_to_the_next_key(lookup):
+    lookup.code = 2  # Cosmos: the order-by item is excluded from the index
+    lookup.throttled = 1
+
+    assert monitor.check_alarm_in_cosmosdb()[1]["_id"] == "0:100:100"
+    assert lookup.sorts == [monitor.CANONICAL_TS_FIELD, "_timestamp"]
+    assert monitor._alarm_sort_key == "_timestamp"
+
+
+def test_multi_unit_lookup_matches_the_single_unit_lookup(monkeypatch):
+    """check_alarms_for_units() picks, for every unit, what check_alarm_in_cosmosdb() picks on that unit alone."""
+    now_ns = 1_700_000_000 * 1_000_000_000
+    now_utc = monitor.UNIX_EPOCH + timedelta(microseconds=now_ns // 1000)
+    second = 1_000_000_000
+    # Inserted out of timestamp order, with string ids that sort against it.
+    samples = [
+        ("u1", "0:9:9", 0, now_ns - 30 * second),
+        ("u1", "0:10:10", 1, now_ns - 10 * second),
+        ("u1", "0:8:8", 0, now_ns - 20 * second),
+        ("u2", "1:5:5", 1, now_ns - 50 * second),
+        ("u2", "1:6:6", 0, now_ns - 5 * second),
+        ("u3", "2:1:1", 1, now_ns - 40 * second),
+    ]
+    docs = [
+        {"_id": _id, monitor.UNIT_ID_FIELD: unit, monitor.ALARM_FIELD: alarm, monitor.CANONICAL_TS_FIELD: ts}
+        for unit, _id, alarm, ts in samples
+    ]
+    monkeypatch.setattr(monitor, "MONGODB_CONNECTION_STRING", "mongodb://test.invalid")
+    monkeypatch.setattr(monitor, "MULTI_UNIT_MONITORING", True)
+    monkeypatch.setattr(monitor, "MATERIALIZED_UNIT_STATE", False)
+    monkeypatch.setattr(monitor, "PARTITION_BY_UNIT", False)
+    monkeypatch.setattr(monitor, "ALARM_INDEX_PROVISIONING", False)
+    monkeypatch.setattr(monitor, "_unit_snapshots", {})
+
+    def use(collection_docs):
+        collection = mongomock.MongoClient()["test"]["telemetry"]
+        collection.insert_many([dict(doc) for doc in collection_docs])
+        monkeypatch.setattr(monitor, "get_mongo_client", lambda: {monitor.COSMOS_DATABASE: {monitor.COSMOS_COLLECTION: collection}})
+
+    def picked(snapshot):
+        alarm_value, latest_doc, previous_doc = snapshot
+        return alarm_value, latest_doc["_id"], previous_doc["_id"] if previous_doc else None
+
+    use(docs)
+    units = monitor.check_alarms_for_units(now_utc)
+
+    assert set(units) == {"alarm:u1", "alarm:u2", "alarm:u3"}
+    for unit in ("u1", "u2", "u3"):
+        monkeypatch.setattr(monitor, "_alarm_sort_key", None)
+        use(doc for doc in docs if doc[monitor.UNIT_ID_FIELD] == unit)
+        assert picked(units[f"alarm:{unit}"]) == picked(monitor.check_alarm_in_cosmosdb())
+    assert picked(units["alarm:u1"]) == (1, "0:10:10", "0:8:8")
@@ -0,0 +1,56 @@
+"""Small runs of benchmark_alarm_pipeline.py: every alarm dials once, redelivery stores nothing twice, a warm client dials faster."""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip("mongomock")
+
+
+def run_benchmark(tmp_path, *args):
+    """Run the script in its own process: the function modules read their settings at import time."""
+    report = tmp_path / "report.json"
+    env = {k: v for k, v in os.environ.items() if k != "MongoDBConnectionString"}
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "benchmark_alarm_pipeline.py"), "--report", str(report), *args],
+        cwd=str(tmp_path), env=env, capture_output=True, text=True, timeout=300,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    with open(report) as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("mode,units", [("timer", 1), ("inline", 3)])
+def test_every_alarm_dials_once(tmp_path, mode, units):
+    alarms = 6
+    report = run_benchmark(tmp_path, "--mode", mode, "--units", str(units), "--alarms", str(alarms),
+                           "--noise", "2", "--preload", "20", "--timeout", "5", "--acs-dials", "0")
+
+    assert report["misses"] == 0
+    assert report["calls_issued"] == alarms
+    assert report["detection_to_dial_ms"]["count"] == alarms
+    assert report["documents_stored"] == report["events_sent"]
+
+
+def test_redelivered_batches_store_no_duplicates(tmp_path):
+    report = run_benchmark(tmp_path, "--alarms", "4", "--noise", "2", "--preload", "20",
+                           "--redeliver", "2", "--timeout", "5", "--acs-dials", "0")
+
+    assert report["config"]["redeliver"] == 2
+    assert report["documents_stored"] == report["unique_events_stored"] == report["events_sent"]
+    assert report["calls_issued"] == 4
+
+
+def test_warm_client_dials_faster_than_cold(tmp_path):
+    report = run_benchmark(tmp_path, "--alarms", "1", "--noise", "0", "--preload", "10", "--query-ticks", "0",
+                           "--acs-dials", "3", "--acs-setup-ms", "100", "--acs-rtt-ms", "10")
+
+    dial = report["acs_dial_ms"]
+    assert dial["cold"]["count"] == dial["warm"]["count"] == 3
+    assert dial["cold"]["p50"] >= 110
+    assert dial["warm"]["max"] < dial["cold"]["p50"] - 50
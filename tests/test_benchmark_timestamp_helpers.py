@@ -0,0 +1,59 @@
+"""
+pytest-benchmark wrapper for benchmark_timestamp_helpers.py: the same cases, verified first.
+
+  python -m pytest tests/test_benchmark_timestamp_helpers.py --benchmark-only
+  python -m pytest tests/test_benchmark_timestamp_helpers.py --benchmark-autosave   # compare later runs
+"""
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import alarm_monitor_function as monitor  # noqa: E402
+import benchmark_timestamp_helpers as helpers  # noqa: E402
+import iot_to_cosmos_bridge as bridge  # noqa: E402
+
+INPUTS = helpers.sample_inputs()
+CASES = helpers.build_cases(monitor, bridge, *INPUTS)
+
+
+def test_fast_paths_match_reference():
+    helpers.verify(monitor, bridge, *INPUTS)
+
+
+@pytest.mark.parametrize("implementation", ["current", "previous"])
+@pytest.mark.parametrize("case", CASES, ids=[case[0] for case in CASES])
+def test_helper(benchmark, case, implementation):
+    name, current, previous, items = case
+    func = current if implementation == "current" else previous
+    benchmark.group = name
+
+    def run():
+        for item in items:
+            func(item)
+
+    benchmark(run)
+
+
+def test_parse_timestamps_matches_scalar_on_edge_values():
+    pytest.importorskip("numpy")
+    from alarm_monitor_function.timestamp_batch import parse_timestamps
+
+    helpers.verify_batch(monitor, parse_timestamps)
+
+
+@pytest.mark.parametrize("pool", ["filetime", "nanoseconds", "mixed"])
+def test_parse_timestamps_batch(benchmark, pool):
+    np = pytest.importorskip("numpy")
+    from alarm_monitor_function.timestamp_batch import parse_timestamps
+
+    values = INPUTS[0]
+    if pool == "mixed":
+        raw = [v for name, items in values.items() if name != "float_seconds" for v in items]
+    else:
+        raw = values[pool]
+    array = np.array(raw * 500, dtype=np.int64)
+    benchmark.group = f"parse_timestamps[{pool}]"
+
+    result = benchmark(parse_timestamps, array)
+    assert result[: len(raw)].tolist() == [np.datetime64(monitor.parse_timestamp(v), "ns").item() for v in raw]
@@ -0,0 +1,84 @@
+"""Change filter reference: only samples that were stored or spooled suppress later repeats."""
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+import iot_to_cosmos_bridge as bridge
+from benchmark_alarm_pipeline import FakeEvent
+
+mongomock = pytest.importorskip("mongomock")
+
+FILETIME = 133_500_000_000_000_000
+
+
+class FlakyCollection:
+    """mongomock collection whose inserts fail while `failing` is set."""
+
+    def __init__(self):
+        self._collection = mongomock.MongoClient()["test"]["telemetry"]
+        self.failing = False
+
+    def insert_many(self, docs, ordered=True):
+        if self.failing:
+            raise AutoReconnect("connection refused (test)")
+        return self._collection.insert_many(docs, ordered=ordered)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    collection = FlakyCollection()
+    monkeypatch.setattr(bridge, "MONGODB_CONNECTION_STRING", "mongodb://test.invalid")
+    monkeypatch.setattr(bridge, "BRIDGE_CHANGE_FILTER", True)
+    monkeypatch.setattr(bridge, "BRIDGE_SPOOL_ENABLED", False)
+    monkeypatch.setattr(bridge, "BRIDGE_MAX_RETRIES", 0)
+    monkeypatch.setattr(bridge, "_last_written", {})
+    monkeypatch.setattr(bridge, "_get_collection", lambda: collection)
+    return collection
+
+
+def sample(sequence_number, volume=10):
+    body = {"_timestamp": FILETIME + sequence_number * 10_000_000, "v": [{bridge.VOLUME_TREATED_FIELD: volume}]}
+    return FakeEvent(body, "unit-1", sequence_number)
+
+
+def stored(collection):
+    return collection.count_documents({})
+
+
+def test_repeat_of_stored_sample_is_dropped(collection):
+    bridge.main([sample(1)])
+    bridge.main([sample(2)])
+    assert stored(collection) == 1
+
+
+def test_repeat_within_one_batch_is_dropped(collection):
+    bridge.main([sample(1), sample(2), sample(3, volume=11)])
+    assert stored(collection) == 2
+
+
+def test_failed_write_does_not_become_the_reference(collection):
+    collection.failing = True
+    bridge.main([sample(1)])
+    assert bridge._last_written == {}
+
+    collection.failing = False
+    bridge.main([sample(2)])  # same values as the lost sample
+    assert stored(collection) == 1
+
+
+def test_spooled_sample_becomes_the_reference(collection, monkeypatch, tmp_path):
+    monkeypatch.setattr(bridge, "BRIDGE_SPOOL_ENABLED", True)
+    monkeypatch.setattr(bridge, "BRIDGE_SPOOL_DIR", str(tmp_path))
+    monkeypatch.setattr(bridge, "BRIDGE_SPOOL_RETRY_SECONDS", 3600)
+    monkeypatch.setattr(bridge, "_spool", None)
+
+    collection.failing = True
+    bridge.main([sample(1)])
+    assert bridge._get_spool().metrics()["depth_documents"] == 1
+
+    collection.failing = False
+    bridge.main([sample(2)])
+    assert stored(collection) == 0  # the repeat is dropped; the spooled sample drains later
@@ -0,0 +1,88 @@
+"""Deterministic bridge document ids: redelivered Event Hub batches must not store duplicates."""
+
+import json
+
+import pytest
+
+import iot_to_cosmos_bridge as bridge
+from benchmark_alarm_pipeline import FakeEvent
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def event(sequence_number, partition="3", alarm=0):
+    ev = FakeEvent({"_timestamp": 133_500_000_000_000_000 + sequence_number, "v": [{bridge.ALARM_FIELD: alarm}]},
+                   "unit-1", sequence_number)
+    ev.metadata = {"PartitionContext": {"PartitionId": partition}}
+    return ev
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    collection = mongomock.MongoClient()["test"]["telemetry"]
+    monkeypatch.setattr(bridge, "MONGODB_CONNECTION_STRING", "mongodb://test.invalid")
+    monkeypatch.setattr(bridge, "BRIDGE_SPOOL_ENABLED", False)
+    monkeypatch.setattr(bridge, "_get_collection", lambda: collection)
+    return collection
+
+
+def test_event_id_is_partition_offset_sequence():
+    ev = event(42)
+    assert bridge._event_id(ev, "3") == f"3:{ev.offset}:42"
+    assert bridge._event_id(ev, "3") == bridge._event_id(event(42), "3")
+
+
+def test_event_id_needs_partition_and_sequence_number():
+    assert bridge._event_id(event(42), None) is None
+    ev = event(42)
+    ev.sequence_number = None
+    assert bridge._event_id(ev, "3") is None
+
+
+def test_same_offset_in_another_partition_is_another_event():
+    assert bridge._event_id(event(42), "3") != bridge._event_id(event(42), "4")
+
+
+def test_partition_id_from_metadata():
+    ev = event(1, partition="7")
+    assert bridge._partition_id(ev) == "7"
+    ev.metadata = {"PartitionContext": json.dumps({"PartitionId": "8"})}
+    assert bridge._partition_id(ev) == "8"
+    ev.metadata = {}
+    assert bridge._partition_id(ev) is None
+
+
+def test_redelivered_batch_stores_no_duplicates(collection):
+    batch = [event(n, alarm=n % 2) for n in range(1, 11)]
+
+    bridge.main(batch)
+    bridge.main(batch)  # function retry / checkpoint replay
+    bridge.main(batch[5:] + [event(11)])  # partly overlapping redelivery
+
+    ids = [doc["_id"] for doc in collection.find({}, {"_id": 1})]
+    assert len(ids) == len(set(ids)) == 11
+    assert set(ids) == {f"3:{n * 512}:{n}" for n in range(1, 12)}
+
+
+def test_monitor_id_fallback_ignores_event_ids(monkeypatch):
+    import alarm_monitor_function as monitor
+    from bson import ObjectId
+
+    collection = mongomock.MongoClient()["test"]["telemetry"]
+    legacy_old, legacy_new = ObjectId(), ObjectId()
+    collection.insert_many([
+        {"_id": legacy_old, monitor.ALARM_FIELD: 0},
+        {"_id": legacy_new, monitor.ALARM_FIELD: 1},
+        {"_id": "0:99:99", monitor.ALARM_FIELD: 0},
+        {"_id": "0:100:100", monitor.ALARM_FIELD: 1},
+    ])
+    monkeypatch.setattr(monitor, "MONGODB_CONNECTION_STRING", "mongodb://test.invalid")
+    monkeypatch.setattr(monitor, "MATERIALIZED_UNIT_STATE", False)
+    monkeypatch.setattr(monitor, "ALARM_INDEX_PROVISIONING", False)
+    monkeypatch.setattr(monitor, "_alarm_sort_key", "_id")  # no timestamp sort supported
+    monkeypatch.setattr(monitor, "get_mongo_client", lambda: {monitor.COSMOS_DATABASE: {monitor.COSMOS_COLLECTION: collection}})
+
+    _, latest_doc, previous_doc = monitor.check_alarm_in_cosmosdb()
+
+    # A string _id sort would return "0:99:99" as the latest document.
+    assert (latest_doc["_id"], previous_doc["_id"]) == (legacy_new, legacy_old)
@@ -0,0 +1,108 @@
+"""Shard-key wiring of the bridge: collection bootstrap on Cosmos / mongos and the per-document key."""
+
+import logging
+
+import pytest
+from pymongo.errors import OperationFailure
+
+import iot_to_cosmos_bridge as bridge
+from benchmark_alarm_pipeline import FakeEvent
+
+mongomock = pytest.importorskip("mongomock")
+
+
+class FakeAdmin:
+    def __init__(self, server):
+        self.server = server
+
+    def command(self, name, *args, **kwargs):
+        self.server.commands.append((name, args, kwargs))
+        if self.server.kind != "mongos":
+            raise OperationFailure(f"no such command: '{name}'", code=59)
+        return {"ok": 1}
+
+
+class FakeClient:
+    def __init__(self, server):
+        self.admin = FakeAdmin(server)
+
+
+class FakeDatabase:
+    """Answers the commands ensure_partitioned_collection() sends like Cosmos, mongos or a replica set."""
+
+    name = "IoTDatabase"
+
+    def __init__(self, kind, collections=(), shard_key=None):
+        self.kind = kind
+        self.collections = list(collections)
+        self.shard_key = shard_key
+        self.commands = []
+        self.client = FakeClient(self)
+
+    def list_collection_names(self):
+        return list(self.collections)
+
+    def command(self, command):
+        self.commands.append((command["customAction"], (), {}))
+        if self.kind != "cosmos":
+            raise OperationFailure("no such command: 'customAction'", code=59)
+        if command["customAction"] == "CreateCollection":
+            self.collections.append(command["collection"])
+            self.shard_key = command["shardKey"]
+            return {"ok": 1}
+        return {"ok": 1, "shardKeyDefinition": {self.shard_key: "Hash"} if self.shard_key else None}
+
+
+def sent(db):
+    return [name for name, _, _ in db.commands]
+
+
+def test_new_cosmos_collection_is_created_with_the_shard_key():
+    db = FakeDatabase("cosmos")
+    assert bridge.ensure_partitioned_collection(db, "iotmessages", "unit") == "cosmos"
+    assert sent(db) == ["CreateCollection"]
+    assert db.shard_key == "unit"
+
+
+def test_existing_cosmos_collection_is_left_alone(caplog):
+    db = FakeDatabase("cosmos", ["iotmessages"], shard_key="unit")
+    assert bridge.ensure_partitioned_collection(db, "iotmessages", "unit") == "cosmos"
+    assert sent(db) == ["GetCollection"]  # no enableSharding / shardCollection
+    assert not [record for record in caplog.records if record.levelno >= logging.WARNING]
+
+
+def test_existing_cosmos_collection_on_another_key_is_reported(caplog):
+    db = FakeDatabase("cosmos", ["iotmessages"], shard_key="device_id")
+    assert bridge.ensure_partitioned_collection(db, "iotmessages", "unit") is None
+    assert sent(db) == ["GetCollection"]
+    assert "partitioned on ['device_id'], not unit" in caplog.text
+
+
+def test_mongos_shards_on_a_hashed_key():
+    db = FakeDatabase("mongos", ["iotmessages"])
+    assert bridge.ensure_partitioned_collection(db, "iotmessages", "unit") == "mongos"
+    assert sent(db) == ["GetCollection", "enableSharding", "shardCollection"]
+    assert db.commands[-1][2] == {"key": {"unit": "hashed"}}
+
+
+def test_replica_set_cannot_partition():
+    db = FakeDatabase("replset")
+    assert bridge.ensure_partitioned_collection(db, "iotmessages", "unit") is None
+
+
+def test_documents_carry_the_partition_key_and_bootstrap_runs_once(monkeypatch):
+    collection = mongomock.MongoClient()["test"]["telemetry"]
+    bootstraps = []
+    monkeypatch.setattr(bridge, "MONGODB_CONNECTION_STRING", "mongodb://test.invalid")
+    monkeypatch.setattr(bridge, "BRIDGE_SPOOL_ENABLED", False)
+    monkeypatch.setattr(bridge, "PARTITION_BY_UNIT", True)
+    monkeypatch.setattr(bridge, "PARTITION_KEY_FIELD", "unit")
+    monkeypatch.setattr(bridge, "_partitioning_checked", False)
+    monkeypatch.setattr(bridge, "_get_collection", lambda: collection)
+    monkeypatch.setattr(bridge, "ensure_partitioned_collection", lambda db, name: bootstraps.append(name))
+
+    for n in (1, 2):
+        bridge.main([FakeEvent({"_timestamp": 133_500_000_000_000_000 + n, "n": n}, f"unit-{n}", n)])
+
+    assert bootstraps == ["telemetry"]
+    assert {doc["unit"] for doc in collection.find()} == {"unit-1", "unit-2"}
@@ -0,0 +1,140 @@
+"""Bridge chunk writes: partial retries from BulkWriteError.details, client reuse on errors and the unit state."""
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError, OperationFailure
+
+import iot_to_cosmos_bridge as bridge
+
+mongomock = pytest.importorskip("mongomock")
+
+
+class ScriptedCollection:
+    """
+    mongomock collection whose insert_many follows a script: each entry is either an exception
+    to raise or {index: error code} for writeErrors; the other documents of that call are stored.
+    """
+
+    def __init__(self, script=()):
+        self._collection = mongomock.MongoClient()["test"]["telemetry"]
+        self.script = list(script)
+        self.calls = []
+
+    def insert_many(self, docs, ordered=True):
+        docs = list(docs)
+        self.calls.append([doc["_id"] for doc in docs])
+        step = self.script.pop(0) if self.script else {}
+        if isinstance(step, Exception):
+            raise step
+        stored = [doc for i, doc in enumerate(docs) if i not in step]
+        if stored:
+            self._collection.insert_many(stored)
+        if step:
+            raise BulkWriteError({
+                "writeErrors": [{"index": i, "code": code, "errmsg": f"code {code}"} for i, code in sorted(step.items())],
+                "nInserted": len(stored),
+            })
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(bridge, "BRIDGE_MAX_RETRIES", 2)
+    monkeypatch.setattr(bridge, "BRIDGE_RETRY_BASE_MS", 0)
+    monkeypatch.setattr(bridge, "BRIDGE_RETRY_MAX_MS", 0)
+
+
+@pytest.fixture
+def resets(monkeypatch):
+    calls = []
+    monkeypatch.setattr(bridge, "_reset_client", lambda: calls.append(True))
+    return calls
+
+
+def docs(count):
+    return [{"_id": f"0:{n}:{n}", "n": n} for n in range(count)]
+
+
+def test_only_retryable_documents_are_resent(resets):
+    # index 1 throttled, 2 already stored, 3 rejected for good
+    collection = ScriptedCollection([{1: 16500, 2: bridge.DUPLICATE_KEY_CODE, 3: 2}])
+
+    written, failed, retries, duplicates, used = bridge._insert_with_retry(collection, docs(5))
+
+    assert collection.calls == [["0:0:0", "0:1:1", "0:2:2", "0:3:3", "0:4:4"], ["0:1:1"]]
+    assert (written, failed, retries, duplicates) == (3, [], 1, 1)
+    assert used is collection
+    assert resets == []
+
+
+def test_documents_still_throttled_after_the_last_retry_are_returned(resets):
+    collection = ScriptedCollection([{0: 16500, 1: 16500}, {0: 16500}, {0: 16500}])
+
+    written, failed, retries, duplicates, _ = bridge._insert_with_retry(collection, docs(3))
+
+    assert [doc["_id"] for doc in failed] == ["0:0:0"]
+    assert (written, retries, duplicates) == (2, 2, 0)
+
+
+def test_throttled_request_is_retried_on_the_same_client(resets):
+    collection = ScriptedCollection([OperationFailure("Request rate is large", code=16500)])
+
+    written, failed, retries, _, used = bridge._insert_with_retry(collection, docs(2))
+
+    assert (written, failed, retries) == (2, [], 1)
+    assert used is collection
+    assert resets == []
+
+
+def test_connection_failure_reconnects_and_later_chunks_use_the_new_client(resets, monkeypatch):
+    old = ScriptedCollection([AutoReconnect("connection reset")])
+    new = ScriptedCollection()
+    monkeypatch.setattr(bridge, "_get_collection", lambda: new)
+    monkeypatch.setattr(bridge, "BRIDGE_CHUNK_SIZE", 2)
+    monkeypatch.setattr(bridge, "MATERIALIZED_UNIT_STATE", True)
+    unit_states = []
+    monkeypatch.setattr(bridge, "_write_unit_states", lambda collection, stored: unit_states.append(collection))
+
+    written, failed, retries, duplicates, chunks = bridge._write_documents(old, docs(5))
+
+    assert resets == [True]
+    assert old.calls == [["0:0:0", "0:1:1"]]
+    assert new.calls == [["0:0:0", "0:1:1"], ["0:2:2", "0:3:3"], ["0:4:4"]]
+    assert (written, failed, retries, chunks) == (5, [], 1, 3)
+    assert unit_states == [new]
+
+
+def sample(ts, alarm, unit="u1"):
+    return {
+        "_id": f"0:{ts}:{ts}", bridge.UNIT_ID_FIELD: unit, bridge.ALARM_FIELD: alarm, bridge.CANONICAL_TS_FIELD: ts,
+    }
+
+
+def unit_state(collection, unit="u1"):
+    state = collection.database[bridge.UNIT_STATE_COLLECTION].find_one({"_id": unit})
+    return [doc[bridge.CANONICAL_TS_FIELD] for doc in state["recent"]], state["latest_ts_ns"], state["last_seen_ns"]
+
+
+def test_older_sample_does_not_overwrite_the_unit_state():
+    collection = mongomock.MongoClient()["test"]["telemetry"]
+
+    bridge._write_unit_states(collection, [sample(300, 1), sample(200, 0)])
+    bridge._write_unit_states(collection, [sample(100, 0)])  # late: older than both
+    assert unit_state(collection) == ([300, 200], 300, 300)
+
+    bridge._write_unit_states(collection, [sample(250, 0)])  # late: between the two
+    assert unit_state(collection) == ([300, 250], 300, 300)
+    recent = collection.database[bridge.UNIT_STATE_COLLECTION].find_one({"_id": "u1"})["recent"]
+    assert recent[0][bridge.ALARM_FIELD] == 1
+
+
+def test_redelivered_sample_is_a_no_op():
+    collection = mongomock.MongoClient()["test"]["telemetry"]
+
+    bridge._write_unit_states(collection, [sample(300, 1)])
+    bridge._write_unit_states(collection, [sample(300, 1)])
+    assert unit_state(collection) == ([300], 300, 300)
+
+    bridge._write_unit_states(collection, [sample(200, 0), sample(300, 1)])
+    assert unit_state(collection) == ([300, 200], 300, 300)
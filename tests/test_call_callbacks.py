@@ -0,0 +1,176 @@
+"""ACS Call Automation callbacks posted to call_callback_function, driving the call state."""
+
+import json
+
+import azure.functions as func
+import pytest
+
+import alarm_monitor_function as monitor
+import call_callback_function
+
+STATE_KEY = "unit-7"
+
+
+class FakeAcs:
+    """Posts CloudEvents for one call to the callback route, the way ACS does."""
+
+    def __init__(self, call_connection_id="call-1", state_key=STATE_KEY, token=None):
+        self.call_connection_id = call_connection_id
+        self.state_key = state_key
+        self.token = token
+
+    def event(self, event_type):
+        return {
+            "type": f"Microsoft.Communication.{event_type}",
+            "data": {"callConnectionId": self.call_connection_id, "operationContext": self.state_key},
+        }
+
+    def post(self, *event_types):
+        req = func.HttpRequest(
+            method="POST",
+            url="/api/callbacks",
+            params={"token": self.token} if self.token is not None else {},
+            body=json.dumps([self.event(event_type) for event_type in event_types]).encode(),
+        )
+        return call_callback_function.main(req)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = monitor.MemoryStateStore({})
+    monkeypatch.setattr(monitor, "_state_store", store)
+    monkeypatch.setattr(monitor, "_call_registry", {})
+    monkeypatch.setattr(monitor, "alarm_runtime_state", {})
+    monkeypatch.setattr(monitor, "CALLBACK_SECRET", "")
+    return store
+
+
+@pytest.fixture
+def played(monkeypatch):
+    played = []
+
+    def start_playback(call_connection_id, call_automation_client=None):
+        played.append(call_connection_id)
+        return True
+
+    monkeypatch.setattr(monitor, "start_playback", start_playback)
+    return played
+
+
+def handled(response):
+    assert response.status_code == 200
+    return json.loads(response.get_body())["handled"]
+
+
+def outcome(store, state_key=STATE_KEY):
+    return store.load([state_key])[state_key]["last_call_outcome"]
+
+
+def test_answered_call_plays_once_and_keeps_its_outcome(store, played):
+    monitor.register_call("call-1", STATE_KEY)
+    acs = FakeAcs()
+
+    assert handled(acs.post("CallConnected")) == ["CallConnected"]
+    assert played == ["call-1"]
+    assert outcome(store) == "answered"
+
+    assert handled(acs.post("PlayCompleted", "CallDisconnected")) == ["PlayCompleted", "CallDisconnected"]
+    assert outcome(store) == "answered"
+    assert "call-1" not in monitor._call_registry
+
+
+def test_unanswered_call_records_not_answered(store, played):
+    monitor.register_call("call-1", STATE_KEY)
+
+    assert handled(FakeAcs().post("CallDisconnected")) == ["CallDisconnected"]
+    assert outcome(store) == "not_answered"
+    assert played == []
+
+
+@pytest.mark.parametrize("event_type", ["CreateCallFailed", "PlayFailed"])
+def test_failure_events(store, played, event_type):
+    monitor.register_call("call-1", STATE_KEY)
+    acs = FakeAcs()
+    if event_type == "PlayFailed":
+        acs.post("CallConnected")
+
+    assert handled(acs.post(event_type)) == [event_type]
+    if event_type == "CreateCallFailed":
+        assert outcome(store) == "not_answered"
+        assert "call-1" not in monitor._call_registry
+    else:
+        # The operator picked up; only the message failed.
+        assert outcome(store) == "answered"
+        assert "call-1" in monitor._call_registry
+
+
+def test_recognize_completed_is_ignored(store, played):
+    monitor.register_call("call-1", STATE_KEY)
+
+    assert handled(FakeAcs().post("RecognizeCompleted")) == []
+    assert outcome(store) is None
+
+
+def test_redelivered_call_connected_does_not_replay(store, played):
+    monitor.register_call("call-1", STATE_KEY)
+    acs = FakeAcs()
+
+    acs.post("CallConnected")
+    acs.post("CallConnected")
+    assert played == ["call-1"]
+
+
+def test_redelivered_call_disconnected_keeps_the_answered_outcome(store, played):
+    monitor.register_call("call-1", STATE_KEY)
+    acs = FakeAcs()
+
+    acs.post("CallConnected", "CallDisconnected")
+    assert handled(acs.post("CallDisconnected")) == []
+    assert outcome(store) == "answered"
+
+
+def test_call_connected_after_call_disconnected_is_ignored(store, played):
+    monitor.register_call("call-1", STATE_KEY)
+    acs = FakeAcs()
+
+    acs.post("CallDisconnected")
+    assert handled(acs.post("CallConnected")) == []
+    assert played == []
+    assert outcome(store) == "not_answered"
+    assert "call-1" not in monitor._call_registry
+
+
+def test_call_created_by_another_worker_is_adopted(store, played):
+    # Registered on another instance: only the shared state store knows the call.
+    store.save(STATE_KEY, {"active_call_connection_id": "call-1"})
+
+    assert handled(FakeAcs().post("CallConnected")) == ["CallConnected"]
+    assert played == ["call-1"]
+    assert monitor._call_registry["call-1"]["state_key"] == STATE_KEY
+
+
+def test_unknown_call_is_ignored(store, played):
+    store.save(STATE_KEY, {"active_call_connection_id": "call-2"})
+
+    assert handled(FakeAcs().post("CallConnected", "CallDisconnected")) == []
+    assert played == []
+    assert outcome(store) is None
+
+
+def test_ending_an_old_call_keeps_the_newer_call_id(store, played):
+    monitor.register_call("call-1", STATE_KEY)
+    monitor.register_call("call-2", STATE_KEY)
+
+    FakeAcs("call-1").post("CallDisconnected")
+    assert store.load([STATE_KEY])[STATE_KEY]["active_call_connection_id"] == "call-2"
+
+
+def test_wrong_token_is_rejected(store, played, monkeypatch):
+    monkeypatch.setattr(monitor, "CALLBACK_SECRET", "s3cret")
+    monitor.register_call("call-1", STATE_KEY)
+
+    assert FakeAcs(token="wrong").post("CallConnected").status_code == 401
+    assert FakeAcs().post("CallConnected").status_code == 401
+    assert played == []
+
+    assert handled(FakeAcs(token="s3cret").post("CallConnected")) == ["CallConnected"]
@@ -0,0 +1,114 @@
+"""Background call placement with a fake CallAutomationClient that answers after a delay."""
+
+import threading
+import time
+
+import pytest
+
+import alarm_monitor_function as monitor
+
+if not monitor.AUDIO_PLAYBACK_AVAILABLE:
+    pytest.skip("azure-communication-callautomation without FileSource", allow_module_level=True)
+
+
+class FakeCallConnection:
+    def __init__(self, client, call_connection_id):
+        self.client = client
+        self.call_connection_id = call_connection_id
+        self.server_call_id = None
+
+    def play_media_to_all(self, file_source):
+        if self.client.answer_after is None or time.monotonic() < self.client.created_at + self.client.answer_after:
+            raise Exception("Call is not in Established state (8501)")
+        self.client.played.append(self.call_connection_id)
+
+
+class FakeCallAutomationClient:
+    """Answers answer_after seconds after create_call (never when None)."""
+
+    def __init__(self, answer_after):
+        self.answer_after = answer_after
+        self.created_at = None
+        self.created = threading.Event()
+        self.played = []
+
+    def create_call(self, target_participant=None, callback_url=None, source_caller_id_number=None,
+                    operation_context=None, **kwargs):
+        self.created_at = time.monotonic()
+        self.created.set()
+        return FakeCallConnection(self, "call-1")
+
+    def get_call_connection(self, call_connection_id):
+        return FakeCallConnection(self, call_connection_id)
+
+
+@pytest.fixture
+def acs(monkeypatch):
+    def install(answer_after):
+        client = FakeCallAutomationClient(answer_after)
+        monkeypatch.setattr(monitor, "get_call_automation_client", lambda: client)
+        return client
+
+    monkeypatch.setattr(monitor, "COMMUNICATION_SERVICE_CONNECTION_STRING", "endpoint=https://test.invalid/;accesskey=eA==")
+    monkeypatch.setattr(monitor, "COMMUNICATION_SERVICE_PHONE_NUMBER", "+10000000000")
+    monkeypatch.setattr(monitor, "AUDIO_FILE_URL", "https://test.invalid/alarm.wav")
+    monkeypatch.setattr(monitor, "AUDIO_PLAYBACK_TRIGGER", "poll")
+    monkeypatch.setattr(monitor, "PLAYBACK_INITIAL_DELAY_SECONDS", 0.05)
+    monkeypatch.setattr(monitor, "PLAYBACK_RETRY_SECONDS", 0.05)
+    monkeypatch.setattr(monitor, "PLAYBACK_TIMEOUT_SECONDS", 2.0)
+    monkeypatch.setattr(monitor.operator_phone_cache, "get", lambda: "+4512345678")
+    return install
+
+
+def test_detection_returns_before_the_call_is_answered(acs):
+    client = acs(answer_after=0.3)
+
+    started = time.monotonic()
+    future = monitor.place_call_in_background("alarm", "unit-answered")
+    assert time.monotonic() - started < 0.1
+
+    assert future.result(timeout=5) is True
+    assert client.played == ["call-1"]
+    assert time.monotonic() - client.created_at >= 0.3
+
+
+def test_unanswered_call_gives_up_after_the_playback_timeout(acs, monkeypatch):
+    monkeypatch.setattr(monitor, "PLAYBACK_TIMEOUT_SECONDS", 0.3)
+    client = acs(answer_after=None)
+
+    started = time.monotonic()
+    monitor.place_call_in_background("alarm", "unit-unanswered").result(timeout=5)
+
+    assert client.played == []
+    assert time.monotonic() - started < 1.5
+
+
+def test_cancel_stops_the_playback_wait(acs):
+    client = acs(answer_after=None)
+
+    future = monitor.place_call_in_background("alarm", "unit-cleared")
+    assert client.created.wait(5)
+    cancelled_at = time.monotonic()
+    assert monitor.cancel_pending_calls("unit-cleared") == 1
+    future.result(timeout=5)
+
+    assert time.monotonic() - cancelled_at < 0.5
+    assert client.played == []
+
+
+def test_cosmosdb_trigger_keys_calls_by_unit(monkeypatch):
+    placed = []
+    monkeypatch.setattr(monitor, "place_call_in_background", lambda message, state_key: placed.append(state_key))
+    monkeypatch.setattr(monitor, "last_alarm_state", {})
+    monkeypatch.setattr(monitor, "MULTI_UNIT_MONITORING", True)
+    alarm, call_service, unit = monitor.ALARM_FIELD, monitor.CALL_SERVICE_FIELD, monitor.UNIT_ID_FIELD
+
+    monitor.cosmosdb_trigger([
+        {"_id": "doc-1", unit: "u1", alarm: 1, call_service: 1},
+        {"_id": "doc-2", unit: "u1", alarm: 1, call_service: 1},
+        {"_id": "doc-3", unit: "u2", alarm: 1, call_service: 1},
+        {"_id": "doc-4", unit: "u1", alarm: 0, call_service: 1},
+        {"_id": "doc-5", unit: "u1", alarm: 1, call_service: 1},
+    ])
+
+    assert placed == ["alarm:u1", "alarm:u2", "alarm:u1"]
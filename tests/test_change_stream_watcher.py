@@ -0,0 +1,210 @@
+"""Change stream watcher: resume tokens, error handling, restart backoff and the state machine path."""
+
+import logging
+import time
+
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure
+
+import alarm_monitor_function as monitor
+
+mongomock = pytest.importorskip("mongomock")
+
+
+class FakeStream:
+    """Returns the queued change events, then idles; resume_token follows the last event."""
+
+    alive = True
+
+    def __init__(self, changes):
+        self.changes = changes
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def try_next(self):
+        if self.changes:
+            change = self.changes.pop(0)
+            self.resume_token = change["_id"]
+            return change
+        time.sleep(0.001)
+        return None
+
+
+class FakeCollection:
+    """watch() raises the next queued error, then opens a stream over the queued changes."""
+
+    full_name = "test.telemetry"
+
+    def __init__(self, errors=(), changes=()):
+        self.errors = list(errors)
+        self.changes = list(changes)
+        self.opened = 0
+        self.resume_after = []
+
+    def watch(self, *args, resume_after=None, **kwargs):
+        self.opened += 1
+        self.resume_after.append(resume_after)
+        if self.errors:
+            raise self.errors.pop(0)
+        return FakeStream(self.changes)
+
+
+def insert(n, alarm=1, call_service=1):
+    doc = {
+        "_id": f"0:{n}:{n}",
+        monitor.ALARM_FIELD: alarm,
+        monitor.CALL_SERVICE_FIELD: call_service,
+        monitor.CANONICAL_TS_FIELD: time.time_ns(),
+    }
+    return {"_id": {"_data": f"token-{n}"}, "operationType": "insert", "fullDocument": doc}
+
+
+@pytest.fixture
+def make_watcher(monkeypatch):
+    monkeypatch.setattr(monitor, "ALARM_DETECTION_MODE", "change_stream")
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(monitor, "get_mongo_client", lambda: client)
+    watchers = []
+
+    def make(collection):
+        watcher = monitor.ChangeStreamWatcher(collection, client["test"]["tokens"])
+        monkeypatch.setattr(monitor, "_change_stream_watcher", watcher)
+        watchers.append(watcher)
+        return watcher
+
+    yield make
+    for watcher in watchers:
+        watcher.stop()
+
+
+def warnings(caplog):
+    return [record for record in caplog.records if record.levelno == logging.WARNING]
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert condition()
+
+
+def test_stopped_watcher_is_not_restarted_during_backoff(make_watcher, caplog):
+    collection = FakeCollection([RuntimeError("boom"), RuntimeError("boom again")])
+    watcher = make_watcher(collection)
+    watcher.start()
+    watcher._thread.join(5)
+
+    for _ in range(5):  # timer ticks inside the backoff window poll instead
+        assert monitor.ensure_change_stream_watcher() is None
+    assert collection.opened == 1
+    assert len(warnings(caplog)) == 1
+
+    watcher.backoff.retry_at = 0.0
+    monitor.ensure_change_stream_watcher()
+    watcher._thread.join(5)
+    assert collection.opened == 2
+    assert watcher.backoff.delay == 2.0
+    assert len(warnings(caplog)) == 1  # still the same failure streak
+
+
+def test_interrupted_stream_backs_off_and_recovers(make_watcher, monkeypatch, caplog):
+    monkeypatch.setattr(monitor, "CHANGE_STREAM_RETRY_MAX_SECONDS", 0.01)
+    caplog.set_level(logging.INFO)
+    collection = FakeCollection([AutoReconnect("down")] * 4)
+    watcher = make_watcher(collection)
+    watcher.start()
+
+    wait_for(lambda: watcher.backoff.healthy and collection.opened == 5)
+    assert monitor.ensure_change_stream_watcher() is watcher
+    assert len(warnings(caplog)) == 1
+    assert any("recovered" in record.getMessage() for record in caplog.records)
+
+
+def test_failing_watcher_is_not_used_for_snapshots(make_watcher):
+    watcher = make_watcher(FakeCollection())
+    watcher.start()
+    wait_for(lambda: watcher.backoff.healthy and watcher.is_running())
+    assert monitor.ensure_change_stream_watcher() is watcher
+
+    watcher.backoff.healthy = False  # e.g. reopening after an interruption
+    assert monitor.ensure_change_stream_watcher() is None
+
+
+def saved_token(watcher):
+    saved = watcher.token_collection.find_one({"_id": watcher.token_key})
+    return saved and saved["resume_token"]
+
+
+def test_resume_token_is_saved_after_a_handled_event_and_resumed_from(make_watcher, monkeypatch):
+    handled = []
+    monkeypatch.setattr(monitor, "evaluate_alarm", lambda *args: handled.append(args))
+    watcher = make_watcher(FakeCollection(changes=[insert(1), insert(2)]))
+    watcher.start()
+    wait_for(lambda: saved_token(watcher) == {"_data": "token-2"})
+    watcher.stop()
+    assert [args[1]["_id"] for args in handled] == ["0:1:1", "0:2:2"]
+
+    collection = FakeCollection()
+    restarted = make_watcher(collection)
+    restarted.start()
+    wait_for(lambda: collection.opened == 1)
+    assert collection.resume_after == [{"_data": "token-2"}]
+
+
+def test_lost_resume_token_is_dropped_and_the_stream_reopened(make_watcher, monkeypatch):
+    seeded = {"alarm:u1": (0, {"_id": "seed", monitor.ALARM_FIELD: 0}, None)}
+    monkeypatch.setattr(monitor, "fetch_alarm_snapshots", lambda now_utc: seeded)
+    collection = FakeCollection(errors=[OperationFailure("history lost", code=286)])
+    watcher = make_watcher(collection)
+    watcher.token_collection.insert_one({"_id": watcher.token_key, "resume_token": {"_data": "stale"}})
+    watcher.start()
+
+    wait_for(lambda: collection.opened == 2 and watcher.backoff.healthy)
+    assert collection.resume_after == [{"_data": "stale"}, None]
+    assert saved_token(watcher) is None
+    assert watcher.supported
+    assert watcher.snapshot() == seeded
+
+
+def test_unsupported_server_disables_push_mode(make_watcher):
+    watcher = make_watcher(FakeCollection(errors=[OperationFailure("not a replica set", code=40573)]))
+    watcher.start()
+    watcher._thread.join(5)
+
+    assert not watcher.supported
+    assert monitor.ensure_change_stream_watcher() is None
+
+
+def test_throttled_open_is_retried_not_disabled(make_watcher, monkeypatch):
+    monkeypatch.setattr(monitor, "CHANGE_STREAM_RETRY_MAX_SECONDS", 0.01)
+    collection = FakeCollection(errors=[OperationFailure("Request rate is large", code=16500)])
+    watcher = make_watcher(collection)
+    watcher.start()
+
+    wait_for(lambda: collection.opened == 2 and watcher.backoff.healthy)
+    assert watcher.supported
+
+
+def test_change_events_drive_the_alarm_state_machine(make_watcher, monkeypatch):
+    store = monitor.MemoryStateStore({})
+    calls = []
+    monkeypatch.setattr(monitor, "_state_store", store)
+    monkeypatch.setattr(monitor, "place_call_in_background", lambda message, state_key: calls.append(state_key))
+    monkeypatch.setattr(monitor, "MULTI_UNIT_MONITORING", False)
+    state_key = monitor.unit_state_key(insert(1)["fullDocument"])
+    watcher = make_watcher(FakeCollection())
+
+    watcher.handle_change(insert(1))
+    watcher.handle_change(insert(2))  # still active, inside the retry delay: no second call
+    assert calls == [state_key]
+    assert store.states[state_key]["active"] and store.states[state_key]["attempts"] == 1
+
+    watcher.handle_change(insert(3, alarm=0))
+    assert not store.states[state_key]["active"]
+    latest, previous = watcher.units[state_key]
+    assert (latest["_id"], previous["_id"]) == ("0:3:3", "0:2:2")
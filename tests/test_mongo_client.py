@@ -0,0 +1,99 @@
+"""Shared MongoClient of alarm_monitor_function: reuse, health checks, and when it is reset."""
+
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure, ServerSelectionTimeoutError
+
+import alarm_monitor_function as monitor
+
+
+class FakeMongoClient:
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        self.kwargs = kwargs
+        self.closed = False
+        self.ping_error = None
+        self.database = {}
+        FakeMongoClient.instances.append(self)
+
+    @property
+    def admin(self):
+        client = self
+
+        class Admin:
+            def command(self, name):
+                if client.ping_error:
+                    raise client.ping_error
+                return {"ok": 1}
+
+        return Admin()
+
+    def __getitem__(self, name):
+        return self.database
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_client(monkeypatch):
+    FakeMongoClient.instances = []
+    monkeypatch.setattr(monitor, "MongoClient", FakeMongoClient)
+    monkeypatch.setattr(monitor, "MONGODB_CONNECTION_STRING", "mongodb://test.invalid")
+    monkeypatch.setattr(monitor, "_mongo_client", None)
+    monkeypatch.setattr(monitor, "MONGODB_HEALTH_CHECK_SECONDS", 3600)
+    yield
+    monitor._mongo_client = None
+
+
+def test_client_is_created_once_and_reused():
+    first = monitor.get_mongo_client()
+    assert monitor.get_mongo_client() is first
+    assert len(FakeMongoClient.instances) == 1
+    assert first.kwargs["maxPoolSize"] == monitor.MONGODB_MAX_POOL_SIZE
+
+
+def test_failed_health_check_reconnects(monkeypatch):
+    first = monitor.get_mongo_client()
+    first.ping_error = AutoReconnect("connection reset")
+    monkeypatch.setattr(monitor, "MONGODB_HEALTH_CHECK_SECONDS", 0)
+
+    second = monitor.get_mongo_client()
+
+    assert second is not first and first.closed
+
+
+class FailingCollection:
+    def __init__(self, error):
+        self.error = error
+
+    def find(self, *args, **kwargs):
+        raise self.error
+
+    def find_one(self, *args, **kwargs):
+        raise self.error
+
+    def aggregate(self, *args, **kwargs):
+        raise self.error
+
+
+@pytest.mark.parametrize("error, reset", [
+    (OperationFailure("Request rate is large", code=16500), False),
+    (OperationFailure("bad query", code=2), False),
+    (AutoReconnect("connection reset"), True),
+    (ServerSelectionTimeoutError("no servers"), True),
+])
+def test_only_connection_errors_reset_the_client(monkeypatch, error, reset):
+    monkeypatch.setattr(monitor, "MATERIALIZED_UNIT_STATE", False)
+    monkeypatch.setattr(monitor, "ALARM_INDEX_PROVISIONING", False)
+    monkeypatch.setattr(monitor, "_alarm_sort_key", monitor.CANONICAL_TS_FIELD)
+    client = monitor.get_mongo_client()
+    collection = FailingCollection(error)
+    client.database = {monitor.COSMOS_COLLECTION: collection, "Operator": collection}
+
+    assert monitor.check_alarm_in_cosmosdb() is None
+    assert monitor.check_alarms_for_units() is None
+    assert monitor.get_phone_number_from_database() is None
+
+    assert client.closed is reset
+    assert (monitor._mongo_client is client) is not reset
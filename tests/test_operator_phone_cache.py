@@ -0,0 +1,159 @@
+"""Operator phone number cache: TTL, hit/miss counters, invalidation and the change stream watch."""
+
+import logging
+import threading
+import time
+
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure
+
+import alarm_monitor_function as monitor
+
+
+class Loader:
+    """get_phone_number_from_database() stand-in returning the queued numbers in turn."""
+
+    def __init__(self, *numbers):
+        self.numbers = list(numbers)
+        self.calls = 0
+        self.loaded = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        value = self.numbers.pop(0) if len(self.numbers) > 1 else self.numbers[0]
+        self.loaded.set()
+        return value
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert condition()
+
+
+def test_first_lookup_loads_inline_then_hits():
+    loader = Loader("+4511111111")
+    cache = monitor.OperatorPhoneCache(loader, ttl_seconds=60)
+
+    assert cache.get() == "+4511111111"
+    assert cache.get() == "+4511111111"
+
+    assert loader.calls == 1
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits"], stats["refreshes"]) == (1, 1, 1)
+    assert stats["cached"] and stats["fresh"]
+
+
+def test_stale_value_is_served_while_it_reloads():
+    loader = Loader("+4511111111", "+4522222222")
+    cache = monitor.OperatorPhoneCache(loader, ttl_seconds=60)
+    cache.get()
+    cache.loaded_at -= 61  # past the TTL
+
+    assert not cache.is_fresh()
+    assert cache.get() == "+4511111111"
+    wait_for(lambda: cache.get() == "+4522222222")
+    assert loader.calls == 2
+
+
+def test_failed_reload_keeps_the_cached_number():
+    loader = Loader("+4511111111", None)
+    cache = monitor.OperatorPhoneCache(loader, ttl_seconds=60)
+    cache.get()
+
+    assert cache.refresh() == "+4511111111"
+    assert cache.value == "+4511111111"
+
+
+def test_invalidate_reloads_in_the_background():
+    loader = Loader("+4511111111", "+4522222222")
+    cache = monitor.OperatorPhoneCache(loader, ttl_seconds=60)
+    cache.get()
+    loader.loaded.clear()
+
+    cache.invalidate()
+
+    assert loader.loaded.wait(5)
+    wait_for(lambda: cache.value == "+4522222222" and cache.is_fresh())
+    assert cache.stats()["invalidations"] == 1
+
+
+class OperatorStream:
+    """Streams the queued changes, then closes."""
+
+    def __init__(self, changes):
+        self.changes = changes
+        self.alive = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def try_next(self):
+        if self.changes:
+            return self.changes.pop(0)
+        self.alive = False
+        return None
+
+
+class OperatorCollection:
+    """watch() raises the queued errors in turn, then streams the queued changes."""
+
+    def __init__(self, errors=(), changes=()):
+        self.errors = list(errors)
+        self.changes = list(changes)
+        self.opened = 0
+
+    def watch(self, *args, **kwargs):
+        self.opened += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return OperatorStream(self.changes)
+
+
+def watch_ticks(cache, collection, ticks=5):
+    for _ in range(ticks):
+        cache.watch(collection)
+        if cache._watch_thread is not None:
+            cache._watch_thread.join(0.2)
+
+
+def test_failed_watch_backs_off_and_warns_once(caplog):
+    cache = monitor.OperatorPhoneCache(Loader("+4511111111"), ttl_seconds=60)
+    collection = OperatorCollection(errors=[AutoReconnect("down"), AutoReconnect("still down")])
+
+    watch_ticks(cache, collection)
+    assert collection.opened == 1  # later ticks wait for the backoff
+
+    cache.watch_backoff.retry_at = 0.0
+    watch_ticks(cache, collection, ticks=1)
+    assert collection.opened == 2
+    assert cache.watch_backoff.delay == 2.0
+    assert len([record for record in caplog.records if record.levelno == logging.WARNING]) == 1
+
+
+def test_unsupported_watch_is_not_retried():
+    cache = monitor.OperatorPhoneCache(Loader("+4511111111"), ttl_seconds=60)
+    collection = OperatorCollection(errors=[OperationFailure("not a replica set", code=40573)])
+
+    watch_ticks(cache, collection)
+    cache.watch_backoff.retry_at = 0.0
+    watch_ticks(cache, collection)
+
+    assert collection.opened == 1
+    assert not cache.watch_supported
+
+
+def test_operator_change_invalidates_the_cache():
+    loader = Loader("+4511111111", "+4522222222")
+    cache = monitor.OperatorPhoneCache(loader, ttl_seconds=60)
+    cache.get()
+
+    cache.watch(OperatorCollection(changes=[{"operationType": "update"}]))
+
+    wait_for(lambda: cache.value == "+4522222222")
+    assert cache.stats()["invalidations"] == 1
+    assert cache.watch_backoff.healthy
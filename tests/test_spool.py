@@ -0,0 +1,165 @@
+"""DiskSpool: append, alarm-first drain order, telemetry-first eviction and orphan reclaim."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from iot_to_cosmos_bridge.spool import LANES, DiskSpool
+
+
+def is_alarm(doc):
+    return bool(doc.get("alarm"))
+
+
+class Writer:
+    """write_documents stand-in recording the write order; `fail` makes every write fail."""
+
+    def __init__(self):
+        self.written = []
+        self.fail = False
+
+    def __call__(self, docs):
+        if self.fail:
+            return list(docs)
+        self.written.extend(docs)
+        return []
+
+
+@pytest.fixture
+def writer():
+    return Writer()
+
+
+def make_spool(tmp_path, writer, **kwargs):
+    # A long retry interval keeps the background drainer asleep; tests call drain_once().
+    kwargs.setdefault("retry_seconds", 3600)
+    kwargs.setdefault("drain_rate", 0)
+    return DiskSpool(str(tmp_path), writer, is_alarm, **kwargs)
+
+
+def segments(tmp_path, lane):
+    return sorted(os.listdir(tmp_path / lane))
+
+
+def test_append_splits_documents_by_lane(tmp_path, writer):
+    spool = make_spool(tmp_path, writer)
+    spool.append([{"_id": 1}, {"_id": 2, "alarm": 1}, {"_id": 3}])
+
+    assert len(segments(tmp_path, "alarm")) == 1
+    assert len(segments(tmp_path, "telemetry")) == 1
+    metrics = spool.metrics()
+    assert metrics["depth_documents"] == 3
+    assert metrics["depth_alarm_documents"] == 1
+    assert metrics["spooled_total"] == 3
+    assert metrics["depth_bytes"] > 0
+    assert writer.written == []
+
+
+def test_append_nothing_writes_no_segment(tmp_path, writer):
+    spool = make_spool(tmp_path, writer)
+    spool.append([])
+    assert all(segments(tmp_path, lane) == [] for lane in LANES)
+
+
+def test_drain_writes_alarms_before_older_telemetry(tmp_path, writer):
+    spool = make_spool(tmp_path, writer)
+    spool.append([{"_id": "t1"}])
+    spool.append([{"_id": "t2"}, {"_id": "a1", "alarm": 1}])
+    spool.append([{"_id": "a2", "alarm": 1}])
+
+    assert spool.drain_once()
+    assert [doc["_id"] for doc in writer.written] == ["a1", "a2", "t1", "t2"]
+    assert spool.metrics()["depth_documents"] == 0
+    assert spool.metrics()["drained_total"] == 4
+
+
+def test_failed_drain_keeps_documents_in_place(tmp_path, writer):
+    spool = make_spool(tmp_path, writer)
+    spool.append([{"_id": "a1", "alarm": 1}, {"_id": "t1"}])
+    writer.fail = True
+
+    assert not spool.drain_once()
+    assert spool.metrics()["depth_documents"] == 2
+
+    writer.fail = False
+    assert spool.drain_once()
+    assert [doc["_id"] for doc in writer.written] == ["a1", "t1"]
+
+
+def lane_bytes(spool, lane):
+    return sum(os.path.getsize(path) for path in spool._segments(lane))
+
+
+def test_eviction_drops_oldest_telemetry_first(tmp_path, writer):
+    spool = make_spool(tmp_path, writer)
+    payload = "x" * 1000
+    spool.append([{"_id": "a0", "alarm": 1, "p": payload}])
+    spool.append([{"_id": "t0", "p": payload}])
+    alarm_bytes, telemetry_bytes = lane_bytes(spool, "alarm"), lane_bytes(spool, "telemetry")
+    for n in range(1, 4):
+        spool.append([{"_id": f"t{n}", "p": payload}])
+
+    spool.max_bytes = alarm_bytes + 2 * telemetry_bytes
+    spool.append([{"_id": "t4", "p": payload}])  # three segments over the bound
+
+    spool.drain_once()
+    assert [doc["_id"] for doc in writer.written] == ["a0", "t3", "t4"]
+    assert spool.metrics()["dropped_total"] == 3
+
+
+def test_eviction_drops_alarms_only_without_telemetry(tmp_path, writer):
+    spool = make_spool(tmp_path, writer)
+    payload = "x" * 1000
+    spool.append([{"_id": "a0", "alarm": 1, "p": payload}])
+    spool.append([{"_id": "t0", "p": payload}])
+
+    spool.max_bytes = lane_bytes(spool, "alarm")
+    spool.append([{"_id": "a1", "alarm": 1, "p": payload}])
+
+    spool.drain_once()
+    assert [doc["_id"] for doc in writer.written] == ["a1"]
+    assert spool.metrics()["dropped_total"] == 2
+
+
+def test_segments_of_dead_process_are_reclaimed(tmp_path, writer):
+    make_spool(tmp_path, writer).append([{"_id": "a1", "alarm": 1}, {"_id": "t1"}])
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    for lane in LANES:
+        for name in segments(tmp_path, lane):  # claimed by a worker that then died
+            os.replace(tmp_path / lane / name, tmp_path / lane / f"{name}.{child.pid}")
+
+    spool = make_spool(tmp_path, writer)
+    assert spool.metrics()["depth_documents"] == 2
+    assert spool.drain_once()
+    assert [doc["_id"] for doc in writer.written] == ["a1", "t1"]
+
+
+def test_segments_claimed_under_a_reused_pid_are_reclaimed(tmp_path, writer):
+    make_spool(tmp_path, writer).append([{"_id": "a1", "alarm": 1}])
+    (name,) = segments(tmp_path, "alarm")
+    # Claimed by an earlier incarnation that had the pid this process has now.
+    os.replace(tmp_path / "alarm" / name, tmp_path / "alarm" / f"{name}.{os.getpid()}")
+
+    spool = make_spool(tmp_path, writer)
+    assert spool.metrics()["depth_alarm_documents"] == 1
+    assert spool.drain_once()
+    assert [doc["_id"] for doc in writer.written] == ["a1"]
+
+
+def test_segments_claimed_by_live_process_are_left_alone(tmp_path, writer):
+    make_spool(tmp_path, writer).append([{"_id": "t1"}])
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        (name,) = segments(tmp_path, "telemetry")
+        os.replace(tmp_path / "telemetry" / name, tmp_path / "telemetry" / f"{name}.{child.pid}")
+
+        spool = make_spool(tmp_path, writer)
+        assert spool.metrics()["depth_documents"] == 0
+        assert spool.drain_once()
+        assert writer.written == []
+    finally:
+        child.kill()
+        child.wait()
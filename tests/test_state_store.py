@@ -0,0 +1,112 @@
+"""Concurrent compare_and_set must have exactly one winner on every alarm state backend."""
+
+import multiprocessing
+import threading
+
+import pytest
+
+from alarm_monitor_function.state_store import MemoryStateStore, MongoStateStore, SqliteStateStore
+
+CONTENDERS = 8
+
+
+class SerializedCollection:
+    """mongomock is not thread-safe; one lock per operation gives the server's per-document atomicity."""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        def locked(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+        return locked
+
+
+def race(store, state_key="unit-1"):
+    """CONTENDERS threads claim the same START transition at once; returns the winners' ids."""
+    barrier = threading.Barrier(CONTENDERS)
+    winners = []
+
+    def contend(i):
+        barrier.wait()
+        if store.compare_and_set(state_key, {"active": False}, {"active": True, "attempts": i + 1}) is not None:
+            winners.append(i + 1)
+
+    threads = [threading.Thread(target=contend, args=(i,)) for i in range(CONTENDERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return winners
+
+
+def assert_single_winner(store, winners, state_key="unit-1"):
+    assert len(winners) == 1
+    state = store.load([state_key])[state_key]
+    assert state["active"] is True
+    assert state["attempts"] == winners[0]
+
+
+@pytest.fixture
+def mongo_store():
+    mongomock = pytest.importorskip("mongomock")
+    collection = SerializedCollection(mongomock.MongoClient()["test"]["alarm_runtime_state"])
+    return MongoStateStore(lambda: collection)
+
+
+def test_memory_store_single_winner():
+    store = MemoryStateStore()
+    assert_single_winner(store, race(store))
+
+
+def test_sqlite_store_single_winner(tmp_path):
+    store = SqliteStateStore(str(tmp_path / "state.db"))
+    assert_single_winner(store, race(store))
+
+
+def test_mongo_store_single_winner_without_document(mongo_store):
+    # First transition of a unit: the contenders race on the insert path.
+    assert_single_winner(mongo_store, race(mongo_store))
+
+
+def test_mongo_store_single_winner_with_document(mongo_store):
+    mongo_store._write_many({"unit-1": {"active": False}})
+    assert_single_winner(mongo_store, race(mongo_store))
+
+
+def test_cas_rejects_stale_expectation():
+    store = MemoryStateStore()
+    assert store.compare_and_set("unit-1", {"active": False}, {"active": True}) is not None
+    assert store.compare_and_set("unit-1", {"active": False}, {"active": True}) is None
+    assert store.compare_and_set("unit-1", {"active": True}, {"active": False})["active"] is False
+
+
+def _sqlite_contender(path, i, start, results):
+    store = SqliteStateStore(path)
+    start.wait()
+    won = store.compare_and_set("unit-1", {"active": False}, {"active": True, "attempts": i + 1}) is not None
+    results.put((i + 1, won))
+
+
+def test_sqlite_store_single_winner_across_processes(tmp_path):
+    path = str(tmp_path / "state.db")
+    SqliteStateStore(path)  # create the table before the race
+    context = multiprocessing.get_context("fork")
+    start = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target=_sqlite_contender, args=(path, i, start, results)) for i in range(CONTENDERS)]
+    for process in processes:
+        process.start()
+    start.set()
+    outcomes = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join(timeout=30)
+
+    winners = [attempt for attempt, won in outcomes if won]
+    assert_single_winner(SqliteStateStore(path), winners)